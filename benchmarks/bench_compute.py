@@ -0,0 +1,339 @@
+#!/usr/bin/env python
+""" Benchmarks of gonzo's compute hot paths, against the in-memory `fake`
+compute and DNS backends, at a range of fleet sizes
+
+Each (benchmark, fleet size) case runs in its own process, so that its peak
+memory can be measured. Results are written as one JSON object per line:
+
+    {"benchmark": "list_instances", "fleet_size": 1000, "wall_time": ...,
+     "api_calls": {"list_nodes": 1}, "api_call_count": 1,
+     "setup_rss_kb": ..., "peak_rss_kb": ...}
+
+DNS calls are counted as "dns.<method>". Results are followed by one
+"scaling" line per benchmark, comparing the API calls made at the smallest
+and largest fleet sizes; anything other than a constant number of calls
+(or, for paged listings, one call per page, and for contended hostname
+reservations, retries bounded by the number of launches) is a regression
+(e.g. a request per instance).
+
+With gonzo installed (e.g. `make develop`):
+
+    python benchmarks/bench_compute.py --sizes 10,1000 --output results.json
+"""
+
+import argparse
+from cStringIO import StringIO
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+from threading import Thread
+import time
+
+from gonzo.clouds import fake  # noqa, registers the fake backend
+from gonzo.clouds.cache import ResourceCache
+from gonzo.clouds.compute import DEFAULT_PAGE_SIZE, Cloud
+from gonzo.clouds.dns import RESERVE_ATTEMPTS
+from gonzo.clouds.fake import FakeDNS, FakeDNSDriver
+from gonzo.scripts.base import get_parser
+from gonzo.scripts.launch import launch_fleet
+from gonzo.scripts.list_ import headers, print_instance_summary
+from gonzo.scripts.utils import print_streaming_table, print_table
+
+
+DEFAULT_SIZES = [10, 100, 1000, 10000, 50000]
+
+# benchmarks listing a page of DEFAULT_PAGE_SIZE instances per API call
+PAGED_BENCHMARKS = set(['stream_table'])
+
+DNS_ZONE = 'example.com'
+
+# instances launched by launch_fleet
+LAUNCH_COUNT = 10
+# launches reserving hostnames at once in host_contention, each looking up
+# the zone (listing hosted zones, not records), then reading the count and
+# changing it once per attempt
+CONTENDING_LAUNCHES = 8
+# most calls to each API method, for benchmarks whose calls depend on
+# timing rather than fleet size; calls to any other method are unexpected
+MAX_API_CALLS = {
+    'host_contention': {
+        'dns.iterate_zones': CONTENDING_LAUNCHES,
+        'dns.ex_get_record': CONTENDING_LAUNCHES * RESERVE_ATTEMPTS,
+        'dns.ex_change_records': CONTENDING_LAUNCHES * RESERVE_ATTEMPTS,
+    },
+}
+
+
+def make_cloud(fleet_size):
+    return Cloud.from_config({
+        'BACKEND': 'fake',
+        'FAKE_FLEET_SIZE': fleet_size,
+        'FAKE_POLL_INTERVAL': 0,
+        'FAKE_SEED': 0,
+    }, 'fake-1', name='benchmark')
+
+
+def make_dns(driver):
+    return FakeDNS(driver, poll_interval=0)
+
+
+def bench_list_instances(cloud, _):
+    cloud.list_instances()
+
+
+def bench_list_instances_by_type(cloud, _):
+    cloud.list_instances_by_type('production', 'web-app')
+
+
+def bench_get_next_az(cloud, _):
+    cloud.get_next_az('production', 'web-app')
+
+
+def bench_create_instance(cloud, _):
+    cloud.create_instance(
+        'ami-fake', 'production-web-app-999', 'benchmark',
+        size='m1.small', key_name='master',
+        security_groups=['web-app', 'gonzo'])
+
+
+def setup_print_table(cloud):
+    # the listing itself is measured by list_instances
+    return cloud.list_instances()
+
+
+def bench_print_table(cloud, instances):
+    print_table(print_instance_summary, headers, instances,
+                use_color='never', stream=StringIO())
+
+
+def bench_stream_table(cloud, _):
+    # listing and printing a page at a time
+    with open(os.devnull, 'w') as devnull:
+        print_streaming_table(print_instance_summary, headers,
+                              cloud.iter_instances(), use_color='never',
+                              stream=devnull)
+
+
+def setup_launch_fleet(cloud):
+    args = get_parser().parse_args([
+        'launch', 'production-web-app', '--count', str(LAUNCH_COUNT),
+        '--image-id', 'ami-fake', '--size', 'm1.small', '--color', 'never'])
+    return args, make_dns(cloud.dns_driver)
+
+
+def bench_launch_fleet(cloud, prepared):
+    # reserving hostnames, launching, waiting and writing DNS records
+    args, dns = prepared
+    cloud_config = {
+        'DNS_ZONE': DNS_ZONE,
+        'DNS_TYPE': 'CNAME',
+        'PUBLIC_KEY_NAME': 'master',
+    }
+    stdout = sys.stdout
+    with open(os.devnull, 'w') as sys.stdout:
+        try:
+            launch_fleet(args, cloud, dns, cloud_config)
+        finally:
+            sys.stdout = stdout
+
+
+def bench_host_contention(cloud, _):
+    # concurrent launches, each with its own view of the zone, racing to
+    # reserve hostnames
+    def launch():
+        make_dns(cloud.dns_driver).reserve_hosts(
+            'production-web-app', DNS_ZONE, 3)
+
+    threads = [
+        Thread(target=launch) for number in range(CONTENDING_LAUNCHES)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def setup_inventory_sync(cloud):
+    # a synced inventory, then some churn since
+    cache_dir = tempfile.mkdtemp()
+    cloud.cache = ResourceCache(
+        cloud.compute_session, 'benchmark', cloud.region, cache_dir,
+        owner=cloud)
+    cloud.full_sync_interval = 600
+    instances = cloud.list_instances()
+
+    driver = cloud.compute_session
+    for number in range(10):
+        driver.add_node(
+            'test-churn-{:03d}'.format(number), 'm1.small',
+            driver.locations[0].name, {})
+    for instance in instances[:10]:
+        driver.destroy_node(instance)
+    cloud.invalidate_inventory()
+    return cache_dir
+
+
+def bench_inventory_sync(cloud, cache_dir):
+    try:
+        cloud.list_instances()
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+# name: (setup, benchmark). The benchmark is called with the cloud and
+# whatever the setup returned, and only it is timed
+BENCHMARKS = {
+    'list_instances': (None, bench_list_instances),
+    'list_instances_by_type': (None, bench_list_instances_by_type),
+    'get_next_az': (None, bench_get_next_az),
+    'create_instance': (None, bench_create_instance),
+    'print_table': (setup_print_table, bench_print_table),
+    'stream_table': (None, bench_stream_table),
+    'inventory_sync': (setup_inventory_sync, bench_inventory_sync),
+    'launch_fleet': (setup_launch_fleet, bench_launch_fleet),
+    'host_contention': (None, bench_host_contention),
+}
+
+
+def max_rss_kb():
+    # kilobytes on linux (bytes on OS X)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_case(benchmark, fleet_size):
+    """ Run a single case in this process, returning its result """
+    setup, bench = BENCHMARKS[benchmark]
+
+    cloud = make_cloud(fleet_size)
+    # the zone shared by every DNS the benchmark uses
+    cloud.dns_driver = FakeDNSDriver(
+        zones=[DNS_ZONE], latency=0.001, seed=0)
+    prepared = None
+    if setup is not None:
+        prepared = setup(cloud)
+    setup_rss = max_rss_kb()
+
+    def calls():
+        calls = dict(cloud.compute_session.calls)
+        calls.update(
+            ('dns.{}'.format(method), count)
+            for method, count in cloud.dns_driver.calls.items())
+        return calls
+
+    calls_before = calls()
+    started = time.time()
+    bench(cloud, prepared)
+    wall_time = time.time() - started
+
+    api_calls = dict(
+        (method, count - calls_before.get(method, 0))
+        for method, count in calls().items()
+        if count - calls_before.get(method, 0)
+    )
+    return {
+        'benchmark': benchmark,
+        'fleet_size': fleet_size,
+        'wall_time': wall_time,
+        'api_calls': api_calls,
+        'api_call_count': sum(api_calls.values()),
+        'setup_rss_kb': setup_rss,
+        'peak_rss_kb': max_rss_kb(),
+    }
+
+
+def run_in_subprocess(benchmark, fleet_size):
+    output = subprocess.check_output([
+        sys.executable, __file__,
+        '--case', benchmark, '--sizes', str(fleet_size)])
+    return json.loads(output.splitlines()[-1])
+
+
+def pages(fleet_size):
+    return max(1, -(-fleet_size // DEFAULT_PAGE_SIZE))
+
+
+def scaling(results):
+    """ Compare API call counts of each benchmark across fleet sizes """
+    by_benchmark = {}
+    for result in results:
+        by_benchmark.setdefault(result['benchmark'], []).append(result)
+
+    for benchmark, runs in sorted(by_benchmark.items()):
+        runs.sort(key=lambda run: run['fleet_size'])
+        smallest, largest = runs[0], runs[-1]
+        if benchmark in PAGED_BENCHMARKS:
+            expected = all(
+                run['api_call_count'] <= pages(run['fleet_size'])
+                for run in runs)
+        elif benchmark in MAX_API_CALLS:
+            budget = MAX_API_CALLS[benchmark]
+            expected = all(
+                count <= budget.get(method, 0)
+                for run in runs
+                for method, count in run['api_calls'].items())
+        else:
+            expected = (
+                smallest['api_call_count'] == largest['api_call_count'])
+        yield {
+            'scaling': benchmark,
+            'fleet_sizes': [smallest['fleet_size'], largest['fleet_size']],
+            'api_call_counts': [
+                smallest['api_call_count'], largest['api_call_count']],
+            'api_calls_constant': (
+                smallest['api_call_count'] == largest['api_call_count']),
+            'api_calls_expected': expected,
+            'wall_time_ratio': (
+                largest['wall_time'] / smallest['wall_time']
+                if smallest['wall_time'] else None),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument(
+        '--sizes', default=','.join(str(size) for size in DEFAULT_SIZES),
+        help='comma separated fleet sizes (default: %(default)s)')
+    parser.add_argument(
+        '--benchmarks', default=','.join(sorted(BENCHMARKS)),
+        help='comma separated benchmarks (default: all)')
+    parser.add_argument(
+        '--output', type=argparse.FileType('w'), default=sys.stdout,
+        help='file to write results to (default: stdout)')
+    parser.add_argument(
+        '--strict', action='store_true', default=False,
+        help='exit with an error if any API call count grows with the fleet '
+             '(beyond a call per page, for paged listings)')
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    if args.case:
+        # a single case, run by the parent process
+        print json.dumps(run_case(args.case, sizes[0]))
+        return
+
+    results = []
+    for benchmark in args.benchmarks.split(','):
+        for fleet_size in sizes:
+            result = run_in_subprocess(benchmark, fleet_size)
+            results.append(result)
+            print >> args.output, json.dumps(result, sort_keys=True)
+            args.output.flush()
+
+    regressions = []
+    for summary in scaling(results):
+        print >> args.output, json.dumps(summary, sort_keys=True)
+        if not summary['api_calls_expected']:
+            regressions.append(summary['scaling'])
+
+    if regressions and args.strict:
+        sys.exit("API calls grow with fleet size: {}".format(
+            ', '.join(regressions)))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,84 @@
+from functools import partial
+from threading import Lock
+
 from gonzo.clouds.compute import Cloud
+from gonzo.clouds import fake  # noqa, registers the 'fake' backend
 from gonzo.config import config_proxy
+from gonzo.utils import run_concurrently
+
+
+# Clouds already created by this process, keyed by (name, region, use_cache)
+_clouds = {}
+_clouds_lock = Lock()
+
+
+def get_cloud(name, region, use_cache=True):
+    """ The Cloud for `region` of the configured cloud `name`
 
+    Clouds (with their drivers and connections) are created on first use
+    and shared by the rest of the process.
+    """
+    key = (name, region, use_cache)
+    with _clouds_lock:
+        if key not in _clouds:
+            cloud_config = config_proxy.get_cloud(name)
+            _clouds[key] = Cloud.from_config(
+                cloud_config, region, name=name, use_cache=use_cache)
+        return _clouds[key]
 
-def get_current_cloud(cloud=None):
+
+def clear_clouds():
+    """ Forget the Clouds created so far, e.g. after the config changed """
+    with _clouds_lock:
+        _clouds.clear()
+
+
+def get_current_cloud(cloud=None, use_cache=True):
     cloud_config = config_proxy.get_cloud(cloud)
     if cloud is not None:
         region = cloud_config['REGIONS'][0]
     else:
+        cloud = config_proxy.CLOUD_NAME
         region = config_proxy.REGION
 
-    return Cloud.from_config(cloud_config, region)
+    return get_cloud(cloud, region, use_cache=use_cache)
+
+
+def get_cloud_regions(cloud=None):
+    """ (cloud name, region) for each of the REGIONS configured for `cloud`
+        (by default the current cloud) """
+    cloud_config = config_proxy.get_cloud(cloud)
+    if cloud is None:
+        cloud = config_proxy.CLOUD_NAME
+
+    return [(cloud, region) for region in cloud_config['REGIONS']]
+
+
+def get_all_cloud_regions():
+    """ (cloud name, region) for every region of every one of the CLOUDS
+        configured """
+    return [
+        (name, region)
+        for name, cloud_config in config_proxy.CLOUDS.items()
+        for region in cloud_config['REGIONS']
+    ]
+
+
+def _list_cloud_instances(name, region, use_cache):
+    return get_cloud(name, region, use_cache=use_cache).list_instances()
+
+
+def list_instances_across(cloud_regions, use_cache=True, timeout=None):
+    """ list_instances_across(cloud_regions) -> (instances, errors)
+
+    List the instances of each of the (cloud name, region) `cloud_regions`
+    concurrently, so that it takes as long as the slowest rather than all
+    of them. Returns dicts keyed by (cloud name, region), of instance lists
+    and of exceptions for the clouds that couldn't be created (e.g. for
+    missing config) or listed, or took longer than `timeout` seconds.
+    """
+    return run_concurrently(dict(
+        ((name, region), partial(
+            _list_cloud_instances, name, region, use_cache))
+        for name, region in cloud_regions
+    ), timeout=timeout)
@@ -0,0 +1,114 @@
+""" Time limited cache of cloud resources, shared between gonzo commands
+
+Each cloud and region gets its own directory under ``~/.gonzo/cache``,
+holding one pickle per cached collection (e.g. ``instances``).
+"""
+
+import cPickle as pickle
+import logging
+import os
+import time
+
+from libcloud.common.base import BaseDriver
+
+from gonzo.config import CACHE_DIR
+
+
+logger = logging.getLogger(__name__)
+
+DRIVER_ID = 'driver'
+OWNER_ID = 'owner'
+
+# types that can't be (or refer to) a driver or owner; most of what's pickled
+PLAIN_TYPES = frozenset([
+    str, unicode, int, long, float, bool, type(None), list, tuple, dict])
+
+
+class ResourceCache(object):
+    """ Cache of libcloud resources for a single cloud and region
+
+    Values are remembered in memory for the lifetime of the object, and
+    pickled to disk so that subsequent invocations can reuse them. Any
+    references to a driver, or to the `owner` of the cache (e.g. the Cloud
+    the values came from), are replaced with the current ones on loading.
+    """
+
+    def __init__(self, driver, cloud_name, region, cache_dir=CACHE_DIR,
+                 owner=None):
+        self.driver = driver
+        self.owner = owner
+        self.cache_dir = os.path.join(
+            cache_dir, '{}-{}'.format(cloud_name, region))
+        self._entries = {}
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, '{}.pickle'.format(key))
+
+    def _load(self, key):
+        try:
+            with open(self._path(key), 'rb') as cache_file:
+                unpickler = pickle.Unpickler(cache_file)
+                unpickler.persistent_load = self._persistent_load
+                return unpickler.load()
+        except IOError:
+            return None
+        except Exception as ex:  # corrupt or incompatible cache file
+            logger.debug("Ignoring unreadable cache `%s`: %s", key, ex)
+            return None
+
+    def _persistent_id(self, obj):
+        if type(obj) in PLAIN_TYPES:
+            return None
+        if obj is self.driver or isinstance(obj, BaseDriver):
+            return DRIVER_ID
+        if self.owner is not None and obj is self.owner:
+            return OWNER_ID
+        return None
+
+    def _persistent_load(self, persistent_id):
+        if persistent_id == DRIVER_ID:
+            return self.driver
+        if persistent_id == OWNER_ID:
+            return self.owner
+        raise pickle.UnpicklingError(
+            "Unknown reference `{}`".format(persistent_id))
+
+    def get(self, key, ttl):
+        """ Return the value cached for `key`, or None if there is no value
+            or it is older than `ttl` seconds
+        """
+        if not ttl:
+            return None
+
+        if key not in self._entries:
+            entry = self._load(key)
+            if entry is None:
+                return None
+            self._entries[key] = entry
+
+        stored_at, value = self._entries[key]
+        if time.time() - stored_at > ttl:
+            return None
+        return value
+
+    def set(self, key, value):
+        stored_at = time.time()
+        self._entries[key] = (stored_at, value)
+
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+        path = self._path(key)
+        temp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temp_path, 'wb') as cache_file:
+            pickler = pickle.Pickler(cache_file, pickle.HIGHEST_PROTOCOL)
+            pickler.persistent_id = self._persistent_id
+            pickler.dump((stored_at, value))
+        os.rename(temp_path, path)
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
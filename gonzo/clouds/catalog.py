@@ -0,0 +1,146 @@
+""" Lookup of rarely changing cloud resources (sizes, key pairs, zones...)
+by name, fetching each collection at most once per TTL
+"""
+
+import logging
+from threading import Lock
+
+
+logger = logging.getLogger(__name__)
+
+# default seconds a collection is reused for, before being fetched again
+DEFAULT_CATALOG_TTLS = {
+    'sizes': 24 * 60 * 60,
+    'zones': 24 * 60 * 60,
+    'images': 24 * 60 * 60,
+    'key_pairs': 60 * 60,
+    'security_groups': 10 * 60,
+}
+
+
+class Catalog(object):
+    """ Name-keyed collections of cloud resources
+
+    `sources` maps each collection to a `(list_function, key_attribute)`
+    pair. Collections are fetched on first use, kept in memory and, given a
+    ResourceCache, on disk. Looking up a name that isn't known refetches
+    the collection once, in case it was created since it was cached.
+
+    Collections too large to list (e.g. images) have no list function, and
+    are filled in one resource at a time by `fetch_one`.
+    """
+
+    def __init__(self, sources, cache=None, ttls=None):
+        self.sources = sources
+        self.cache = cache
+        self.ttls = dict(DEFAULT_CATALOG_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+
+        self._collections = {}
+        self._indexes = {}
+        self._fresh = set()
+        # per collection, so that different collections can be fetched
+        # concurrently
+        self._locks = dict((collection, Lock()) for collection in sources)
+
+    def _cache_key(self, collection):
+        return 'catalog-{}'.format(collection)
+
+    def _fetch(self, collection):
+        list_function, _ = self.sources[collection]
+        if list_function is None:
+            resources = self._collections.get(collection, [])
+            self._remember(collection, resources)
+        else:
+            resources = list_function()
+            self._store(collection, resources)
+        self._fresh.add(collection)
+        return resources
+
+    def _forget_indexes(self, collection):
+        for index_key in list(self._indexes):
+            if index_key[0] == collection:
+                del self._indexes[index_key]
+
+    def _remember(self, collection, resources):
+        self._collections[collection] = resources
+        self._forget_indexes(collection)
+
+    def _store(self, collection, resources):
+        self._remember(collection, resources)
+        if self.cache is not None and self.ttls.get(collection):
+            self.cache.set(self._cache_key(collection), resources)
+
+    def list(self, collection):
+        """ All resources in `collection`, in the order the cloud lists them
+        """
+        with self._locks[collection]:
+            if collection in self._collections:
+                return self._collections[collection]
+
+            if self.cache is not None:
+                resources = self.cache.get(
+                    self._cache_key(collection), self.ttls.get(collection))
+                if resources is not None:
+                    self._remember(collection, resources)
+                    return resources
+
+            return self._fetch(collection)
+
+    def _find(self, collection, name, attribute=None):
+        if attribute is None:
+            _, attribute = self.sources[collection]
+
+        index_key = (collection, attribute)
+        if index_key not in self._indexes:
+            # first resource wins, as it would in a scan of the listing
+            self._indexes[index_key] = dict(
+                (getattr(resource, attribute), resource)
+                for resource in reversed(self._collections[collection]))
+        return self._indexes[index_key][name]
+
+    def get(self, collection, name, attribute=None):
+        """ The resource in `collection` whose key attribute (or `attribute`,
+            if given) is `name`. Raises KeyError if there is no such
+            resource, even after refetching """
+        self.list(collection)
+        with self._locks[collection]:
+            try:
+                return self._find(collection, name, attribute)
+            except KeyError:
+                if collection in self._fresh:
+                    raise
+
+            logger.debug("%s not in cached %s, refetching", name, collection)
+            self._fetch(collection)
+            return self._find(collection, name, attribute)
+
+    def fetch_one(self, collection, name, fetch):
+        """ The resource called `name` in `collection`, calling `fetch()` to
+            get it from the cloud if it hasn't been seen before """
+        self.list(collection)
+        with self._locks[collection]:
+            try:
+                return self._find(collection, name)
+            except KeyError:
+                pass
+
+        resource = fetch()
+        self.add(collection, resource)
+        return resource
+
+    def add(self, collection, resource):
+        """ Record a resource created after the collection was fetched """
+        self.list(collection)
+        with self._locks[collection]:
+            resources = self._collections.get(collection, [])
+            self._store(collection, resources + [resource])
+
+    def invalidate(self, collection):
+        with self._locks[collection]:
+            self._collections.pop(collection, None)
+            self._forget_indexes(collection)
+            self._fresh.discard(collection)
+            if self.cache is not None:
+                self.cache.invalidate(self._cache_key(collection))
@@ -1,15 +1,99 @@
+from functools import partial
 import logging
+from threading import Lock
 import time
 
-from datetime import datetime
+from datetime import datetime, timedelta
 
-from libcloud.compute.types import Provider as ComputeProvider
+from libcloud.compute.drivers.ec2 import NAMESPACE as EC2_NAMESPACE
+from libcloud.compute.types import NodeState, Provider as ComputeProvider
 from libcloud.compute.providers import get_driver as get_compute_driver
+from libcloud.utils.xml import findall, findtext
+
+from gonzo.clouds.cache import ResourceCache
+from gonzo.clouds.catalog import Catalog
+from gonzo.clouds.instance import Instance
+from gonzo.clouds.inventory import Inventory, InventorySnapshot
+from gonzo.clouds.profiling import profiler
+from gonzo.clouds.session import (make_thread_safe, reuse_openstack_auth,
+                                  throttle_requests)
+from gonzo.clouds.throttle import get_throttle
+from gonzo.clouds.waiter import Waiter
+from gonzo.exceptions import ConcurrentTaskError, UnhealthyResourceError
+from gonzo.utils import chunks, gather
 
 
 logger = logging.getLogger(__name__)
 backends = {}
 
+# seconds a cached instance listing stays valid, unless configured with
+# INVENTORY_CACHE_TTL
+DEFAULT_INVENTORY_TTL = 60
+
+# instances fetched per request by iter_instances, where the cloud pages
+DEFAULT_PAGE_SIZE = 500
+
+# seconds of clock skew allowed for when asking the cloud what changed
+# since the last inventory sync
+SYNC_MARGIN = 60
+
+# instances looked up by id per request (EC2's limit on filter values)
+DESCRIBE_BATCH_SIZE = 200
+
+# EC2 states other than running: instances that are stopped, or on the way
+# to or from running
+EC2_NOT_RUNNING_STATES = [
+    'pending', 'shutting-down', 'stopping', 'stopped', 'terminated']
+
+
+def _node_is_running(node):
+    if node.state in (NodeState.TERMINATED, NodeState.ERROR):
+        raise UnhealthyResourceError("Instance {} is {}".format(
+            node.name, NodeState.tostring(node.state)))
+    return (node.state == NodeState.RUNNING and
+            bool(node.public_ips or node.private_ips))
+
+
+def _volume_is_available(volume):
+    state = volume.extra['state']
+    if state == 'available':
+        return True
+    elif state == 'creating':
+        return False
+    raise UnhealthyResourceError("Unknown volume state `{}`".format(state))
+
+
+def _image_is_available(image):
+    state = image.extra.get('state', image.extra.get('status', ''))
+    state = state.lower()
+    if state in ('available', 'active'):
+        return True
+    elif state in ('pending', 'queued', 'saving'):
+        return False
+    raise UnhealthyResourceError("Image {} is {}".format(image.id, state))
+
+
+def tag_filters(filters):
+    """ EC2 filters matching instances with all of the given tags """
+    return dict(
+        ('tag:{}'.format(key), value) for key, value in filters.items())
+
+
+def launch_time_patterns(since, now=None):
+    """ EC2 launch-time filter values (which can't express a range)
+        matching every day from `since` until `now` """
+    now = now or datetime.utcnow()
+    days = (now.date() - since.date()).days
+    return [
+        '{:%Y-%m-%d}*'.format(since + timedelta(days=day))
+        for day in range(days + 1)
+    ]
+
+
+def _has_tags(instance, tags):
+    instance_tags = instance.gonzo_tags
+    return all(instance_tags.get(key) == value for key, value in tags.items())
+
 
 def backend_for(provider):
     def wrapper(cls):
@@ -19,10 +103,27 @@ def backend_for(provider):
 
 
 class Cloud(object):
+    WAIT_TIMEOUT = 600
+    CREATED_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+    # longest INVENTORY_FULL_SYNC_INTERVAL for which incremental syncs
+    # still see every change, or None if there's no limit
+    MAX_FULL_SYNC_INTERVAL = None
+
     compute_session = None
+    name = None
+    region = None
+    cache = None
+    inventory_ttl = 0
+    full_sync_interval = None
+    catalog_ttls = None
+    _inventory = None
+    _catalog = None
+
+    def __init__(self, cloud_config, region):
+        self._catalog_lock = Lock()
 
     @classmethod
-    def from_config(cls, cloud_config, region):
+    def from_config(cls, cloud_config, region, name=None, use_cache=False):
         try:
             backend = cloud_config['BACKEND']
         except KeyError:
@@ -34,83 +135,308 @@ class Cloud(object):
             raise LookupError(
                 "Unknown backend `{}`. Please choose one of {}".format(
                     backend, backends.keys()))
-        return backend_cls(cloud_config, region)
+
+        cloud = backend_cls(cloud_config, region)
+        cloud.name = name
+        cloud.region = region
+        throttle_requests(cloud.compute_session, get_throttle(
+            'compute', '{}/{}'.format(name or backend, region),
+            cloud_config.get('API_RATE_LIMITS')))
+        cloud.compute_session = profiler.wrap(cloud.compute_session, 'compute')
+        if use_cache and name is not None:
+            cloud.cache = ResourceCache(
+                cloud.compute_session, name, region, owner=cloud)
+            cloud.inventory_ttl = cloud_config.get(
+                'INVENTORY_CACHE_TTL', DEFAULT_INVENTORY_TTL)
+            cloud.full_sync_interval = cloud._limit_full_sync_interval(
+                cloud_config.get('INVENTORY_FULL_SYNC_INTERVAL'))
+            cloud.catalog_ttls = cloud_config.get('CATALOG_CACHE_TTLS')
+        return cloud
+
+    @property
+    def catalog(self):
+        """ Sizes, images, key pairs, zones and security groups, looked up by
+            name without relisting them each time """
+        with self._catalog_lock:
+            if self._catalog is None:
+                self._catalog = Catalog(
+                    self._catalog_sources(),
+                    cache=self.cache, ttls=self.catalog_ttls)
+        return self._catalog
+
+    def _catalog_sources(self):
+        session = self.compute_session
+        return {
+            'sizes': (session.list_sizes, self.INSTANCE_SIZE_ATTRIBUTE),
+            'images': (None, 'id'),
+            'key_pairs': (session.list_key_pairs, 'name'),
+            'zones': (session.list_locations, 'name'),
+            'security_groups': (
+                getattr(session, self.SECURITY_GROUP_METHOD),
+                self.SECURITY_GROUP_IDENTIFIER),
+        }
+
+    def _limit_full_sync_interval(self, interval):
+        limit = self.MAX_FULL_SYNC_INTERVAL
+        if interval and limit is not None and interval > limit:
+            logger.warning(
+                "INVENTORY_FULL_SYNC_INTERVAL is limited to %ss for %s "
+                "clouds", limit, self.__class__.__name__)
+            return limit
+        return interval
+
+    def _syncs_incrementally(self):
+        return self.cache is not None and bool(self.full_sync_interval)
+
+    def _cached_instances(self):
+        if self.cache is None:
+            return None
+        if self._syncs_incrementally():
+            if not self.cache.get('inventory_fresh', self.inventory_ttl):
+                return None
+            snapshot = self.cache.get('inventory', self.full_sync_interval)
+            return snapshot and snapshot.instances
+        return self.cache.get('instances', self.inventory_ttl)
+
+    def _get_inventory(self, instances):
+        """ Inventory (and its indexes) for a listing, reused for as long
+            as the same listing is returned """
+        inventory = self._inventory
+        if inventory is None or inventory.instances is not instances:
+            self._inventory = Inventory(instances)
+        return self._inventory
+
+    def _list_nodes(self, **filters):
+        """ List nodes, optionally restricted by tags/metadata. Backends
+            that can filter server side override this; returns None when
+            filtering is unsupported """
+        if filters:
+            return None
+        return self.compute_session.list_nodes()
 
     def list_instances(self):
-        instances = self.compute_session.list_nodes()
-        for instance in instances:
-            self._monkeypatch_instance(instance)
+        instances = self._cached_instances()
+        if instances is not None:
+            return instances
+
+        if self._syncs_incrementally():
+            return self._sync_instances()
+
+        instances = [self._to_instance(node) for node in self._list_nodes()]
+
+        if self.cache is not None and self.inventory_ttl:
+            self.cache.set('instances', instances)
         return instances
 
-    def get_instance_by_uuid(self, instance_uuid):
-        for instance in self.list_instances():
-            if instance.uuid == instance_uuid:
-                return instance
+    def _iter_node_pages(self, page_size, **filters):
+        """ Lists of nodes, a page at a time, optionally restricted by
+            tags/metadata where the backend can. Backends that can page
+            their listings override this; by default it's a single page """
+        nodes = self._list_nodes(**filters)
+        if nodes is None:
+            nodes = self._list_nodes()
+        yield nodes
+
+    def iter_instances(self, page_size=DEFAULT_PAGE_SIZE, **tags):
+        """ Instances (with all of the given `tags`), yielded as each page
+            of the listing arrives, without holding the whole listing.
+
+            A cached listing is used if there is one, but a streamed
+            listing isn't cached. """
+        instances = self._cached_instances()
+        if instances is not None:
+            pages = [instances]
+        else:
+            pages = (
+                [self._to_instance(node) for node in nodes]
+                for nodes in self._iter_node_pages(page_size, **tags))
+
+        for page in pages:
+            for instance in page:
+                if _has_tags(instance, tags):
+                    yield instance
+
+    def _list_changed_nodes(self, since, known):
+        """ (nodes, removed_ids): nodes that changed since the datetime
+            `since` (UTC), and ids of instances in the listing `known` that
+            no longer exist. NotImplemented if the backend can't tell, and
+            needs to list everything """
+        return NotImplemented
+
+    def _recheck_nodes(self, known, seen_ids):
+        """ (nodes, removed_ids) for the instances in `known` that weren't
+            running and aren't in `seen_ids`, looked up by id in batches """
+        recheck_ids = [
+            instance.id for instance in known
+            if instance.state != NodeState.RUNNING and
+            instance.id not in seen_ids
+        ]
+        nodes = []
+        removed_ids = []
+        for batch in chunks(recheck_ids, DESCRIBE_BATCH_SIZE):
+            found = self._describe_nodes(batch)
+            found_ids = set(node.id for node in found)
+            nodes.extend(found)
+            removed_ids.extend(
+                node_id for node_id in batch if node_id not in found_ids)
+        return nodes, removed_ids
+
+    def _sync_instances(self):
+        """ Bring the stored inventory snapshot up to date, fetching only
+            what changed since the last sync unless the last full listing is
+            older than `full_sync_interval` """
+        started = time.time()
+        snapshot = self.cache.get('inventory', self.full_sync_interval)
+
+        changes = NotImplemented
+        if (snapshot is not None and
+                started - snapshot.full_synced_at < self.full_sync_interval):
+            since = datetime.utcfromtimestamp(snapshot.synced_at - SYNC_MARGIN)
+            changes = self._list_changed_nodes(since, snapshot.instances)
+
+        if changes is NotImplemented:
+            snapshot = InventorySnapshot(
+                [self._to_instance(node) for node in self._list_nodes()],
+                started)
+        else:
+            nodes, removed_ids = changes
+            logger.debug("Inventory sync: %d changed, %d removed",
+                         len(nodes), len(removed_ids))
+            snapshot.merge(
+                [self._to_instance(node) for node in nodes],
+                removed_ids, started)
+
+        self.cache.set('inventory', snapshot)
+        if self.inventory_ttl:
+            self.cache.set('inventory_fresh', True)
+        return snapshot.instances
+
+    def invalidate_inventory(self):
+        """ Forget any cached instance listing, e.g. after launching or
+            terminating instances. An incrementally synced inventory is
+            kept, to be brought up to date on the next listing. """
+        self._inventory = None
+        if self.cache is not None:
+            self.cache.invalidate('instances')
+            self.cache.invalidate('inventory_fresh')
+
+    def _list_instances_matching(self, **filters):
+        """ Instances from the cached inventory when there is one, otherwise
+            from a listing filtered by the cloud where the backend allows.
+            Callers still need to pick the matching instances out. """
+        instances = self._cached_instances()
+        if instances is not None:
+            return instances
+
+        nodes = self._list_nodes(**filters)
+        if nodes is None:
+            return self.list_instances()
+
+        return [self._to_instance(node) for node in nodes]
 
-        raise LookupError("Instance with uuid: {} not found".format(
-            instance_uuid))
+    def get_instance_by_uuid(self, instance_uuid):
+        inventory = self._get_inventory(self.list_instances())
+        try:
+            return inventory.by_uuid[instance_uuid]
+        except KeyError:
+            raise LookupError("Instance with uuid: {} not found".format(
+                instance_uuid))
 
-    def get_instance_by_name(self, instance_name):
-        for instance in self.list_instances():
-            if instance.name == instance_name:
-                return instance
+    def _to_instance(self, node):
+        """ Instance record for a libcloud node listed by this backend """
+        raise NotImplementedError()
 
-        raise LookupError("Instance with name: {} not found".format(
-            instance_name))
+    def _instance_size(self, size):
+        """ Size name, from the size an instance record was listed with """
+        return size
 
-    def list_instances_by_type(self, environment, server_type):
-        all_instances = self.list_instances()
-        instances_of_type = []
+    def _instance_created_time(self, created):
+        """ Creation datetime, from the timestamp an instance record was
+            listed with """
+        return datetime.strptime(created, self.CREATED_TIME_FORMAT)
 
-        for instance in all_instances:
-            metadata = self.compute_session.ex_get_metadata_for_node(
-                instance)
-            if (metadata.get('server_type') == server_type and
-                    metadata.get('environment') == environment):
-                instances_of_type.append(instance)
+    def get_instance_by_name(self, instance_name):
+        instances = self._list_instances_matching(Name=instance_name)
+        inventory = self._get_inventory(instances)
+        try:
+            return inventory.by_name[instance_name]
+        except KeyError:
+            raise LookupError("Instance with name: {} not found".format(
+                instance_name))
 
-        instances_of_type.sort(key=lambda i: i.name)
-        return instances_of_type
+    def list_instances_by_type(self, environment, server_type):
+        instances = self._list_instances_matching(
+            environment=environment, server_type=server_type)
+        inventory = self._get_inventory(instances)
+        return inventory.of_type(environment, server_type)
 
-    def list_instance_tags(self, node):
-        return node.extra[self.TAG_KEY]
+    def list_instance_tags(self, instance):
+        return instance.gonzo_tags
 
     def list_availability_zones(self):
-        return self.compute_session.list_locations()
+        return self.catalog.list('zones')
 
     def get_next_az(self, environment, server_type):
-        available_azs = self.list_availability_zones()
-        try:
-            newest_instance_az = self.list_instances_by_type(
-                environment,
-                server_type)[-1].extra['gonzo_az']
-        except IndexError:
-            return available_azs[0]
-
-        if len(available_azs) == 1:
-            return available_azs[0]
-        else:
-            for index, availabie_az in enumerate(available_azs):
-                if availabie_az.name == newest_instance_az:
-                    if (index + 1) == len(available_azs):
-                        return available_azs[0]
-                    else:
-                        return available_azs[index + 1]
+        return self.get_next_azs(environment, server_type, 1)[0]
 
-    def create_instance(self, image_name, name, owner, user_data=None,
-                        security_groups=None, size=None, key_name=None,
-                        volume_size=None):
+    def get_next_azs(self, environment, server_type, count):
+        """ Availability zones for `count` new instances of a type, each
+            going to the zone with the fewest instances of the type (ties
+            going to the first zone by name), counting those placed before
+            it """
+        available_azs = self.list_availability_zones()
+        instances = self._list_instances_matching(
+            environment=environment, server_type=server_type)
+        az_counts = self._get_inventory(instances).az_counts(
+            environment, server_type)
+
+        counts = dict(
+            (az.name, az_counts.get(az.name, 0)) for az in available_azs)
+        azs = []
+        for _ in range(count):
+            az = min(available_azs, key=lambda az: (counts[az.name], az.name))
+            counts[az.name] += 1
+            azs.append(az)
+        return azs
+
+    @staticmethod
+    def parse_instance_name(name):
+        """ (environment, server_type) of e.g. production-platform-app-001
+        """
         instance_name = name.split('-')
         environment = instance_name[0]
         server_type = '-'.join(instance_name[1:-1])
+        return environment, server_type
+
+    def resolve_launch_resources(self, image_name, size=None, key_name=None,
+                                 security_groups=None):
+        """ Look up (creating security groups where necessary) everything
+            `launch_instance` needs, so that it can be shared between
+            instances of the same type """
+
+        if security_groups is None:
+            security_groups = []
 
-        # Image
-        image = self.get_image(image_name)
+        def get_key_name():
+            if key_name is None:
+                return None
+            return self.get_key_pair(key_name).name
 
-        # Key Pair
-        if key_name is not None:
-            key = self.get_key_pair(key_name)
-            key_name = key.name
+        def get_security_groups():
+            self.ensure_security_groups(security_groups)
+            return self.security_groups_for_launch(security_groups)
+
+        # the lookups are independent, so only wait for the slowest
+        return gather({
+            'image': partial(self.get_image, image_name),
+            'size': partial(self.get_instance_size_by_name, size),
+            'key_name': get_key_name,
+            'security_groups': get_security_groups,
+        })
+
+    def launch_instance(self, name, owner, resources, az, user_data=None):
+        """ Request a new instance, without waiting for it to come up """
+        environment, server_type = self.parse_instance_name(name)
 
         # Tags
         tags = self.generate_instance_metadata(
@@ -119,41 +445,79 @@ class Cloud(object):
             server_type
         )
 
-        # Instance Size
-        size = self.get_instance_size_by_name(size)
-
-        # Security Groups
-        if security_groups is None:
-            security_groups = []
-
-        for security_group in security_groups:
-            self.create_if_not_exist_security_group(security_group)
-
-        security_groups_for_launch = self.security_groups_for_launch(
-            security_groups)
-
-        # Availability Zone
-        az = self.get_next_az(environment, server_type)
-
         # Launch Instance
         instance = self.compute_session.create_node(
             name=name,
-            image=image,
-            size=size,
+            image=resources['image'],
+            size=resources['size'],
             location=az,
-            ex_security_groups=security_groups_for_launch,
+            ex_security_groups=resources['security_groups'],
             ex_metadata=tags,
             ex_userdata=user_data,
-            ex_keyname=key_name,
+            ex_keyname=resources['key_name'],
         )
-        self.compute_session.wait_until_running([instance])
-        new_instance = self.get_instance_by_uuid(instance.uuid)
+        self.invalidate_inventory()
+        return instance
+
+    def _waiter(self, describe, is_ready):
+        return Waiter(describe, is_ready, timeout=self.WAIT_TIMEOUT)
+
+    def _describe_nodes(self, node_ids):
+        """ Current state of (at least) the given nodes, in one request """
+        return self.compute_session.list_nodes()
+
+    def wait_for_instances(self, instances, on_running=None, on_failed=None):
+        """ wait_for_instances(instances) -> (running, failed)
+
+        Poll for all `instances` at once until each is running or has
+        failed. Returns dicts keyed on instance id, of refreshed instances
+        and of errors respectively. The callbacks are called as soon as
+        each instance's outcome is known.
+        """
+        def describe(node_ids):
+            return [
+                self._to_instance(node)
+                for node in self._describe_nodes(node_ids)
+            ]
+
+        waiter = self._waiter(describe, _node_is_running)
+        return waiter.wait(
+            instances, on_ready=on_running, on_failed=on_failed)
+
+    def wait_until_running(self, instances):
+        """ Block until all `instances` are running. Returns refreshed
+            instances, in the same order """
+        running, failed = self.wait_for_instances(instances)
+        if failed:
+            raise ConcurrentTaskError(failed)
+        return [running[instance.id] for instance in instances]
+
+    def create_instance(self, image_name, name, owner, user_data=None,
+                        security_groups=None, size=None, key_name=None,
+                        volume_size=None):
+        environment, server_type = self.parse_instance_name(name)
+
+        resolved = gather({
+            'resources': partial(
+                self.resolve_launch_resources, image_name, size=size,
+                key_name=key_name, security_groups=security_groups),
+            'az': partial(self.get_next_az, environment, server_type),
+        })
+        resources, az = resolved['resources'], resolved['az']
+
+        instance = self.launch_instance(
+            name, owner, resources, az, user_data=user_data)
+        [new_instance] = self.wait_until_running([instance])
 
         if volume_size is not None:
             self.create_and_attach_volume(new_instance, volume_size)
 
         return new_instance
 
+    def terminate_instance(self, instance):
+        self.compute_session.destroy_node(instance)
+        self.invalidate_inventory()
+
     def create_and_attach_volume(self, instance, vol_size, vol_type=None,
                                  vol_name=None):
         created_volume = self.create_volume(
@@ -168,47 +532,61 @@ class Cloud(object):
             device='/dev/xvdf'
         )
 
-    def wait_until_volume_available(self, volume):
+    def _describe_volumes(self, volume_ids):
+        return self.compute_session.list_volumes()
 
-        while not self.volume_is_created(volume):
-            time.sleep(1)
+    def wait_until_volume_available(self, volume):
+        waiter = self._waiter(self._describe_volumes, _volume_is_available)
+        _, failed = waiter.wait([volume])
+        if failed:
+            raise failed[volume.id]
         return True
 
     def volume_is_created(self, volume):
-        for vol in self.compute_session.list_volumes():
+        for vol in self._describe_volumes([volume.id]):
             if vol.id == volume.id:
-                if vol.extra['state'] == 'available':
-                    return True
-                elif vol.extra['state'] == 'creating':
-                    return False
-                else:
-                    raise LookupError("Unknown volume state `{}`".format(
-                        vol.extra['state']))
+                return _volume_is_available(vol)
 
         raise LookupError("Unknown volume `{}`".format(volume))
 
+    def _describe_images(self, image_ids):
+        return [
+            self.compute_session.get_image(image_id)
+            for image_id in image_ids
+        ]
+
+    def wait_for_images(self, images, on_available=None, on_failed=None):
+        """ wait_for_images(images) -> (available, failed)
+
+        As `wait_for_instances`, for images being created """
+        waiter = self._waiter(self._describe_images, _image_is_available)
+        return waiter.wait(
+            images, on_ready=on_available, on_failed=on_failed)
+
     def get_az_of_instance(self, instance):
-        instance_az = instance.extra['gonzo_az']
+        instance_az = instance.gonzo_az
 
-        for az in self.list_availability_zones():
-            if az.name == instance_az:
-                return az
+        try:
+            return self.catalog.get('zones', instance_az)
+        except KeyError:
+            return None
 
     def get_instance_size_by_name(self, size_name):
-        for size in self.compute_session.list_sizes():
-            if size_name == getattr(size, self.INSTANCE_SIZE_ATTRIBUTE):
-                return size
-
-        raise LookupError("Unknown size `{}`".format(size_name))
+        try:
+            return self.catalog.get('sizes', size_name)
+        except KeyError:
+            raise LookupError("Unknown size `{}`".format(size_name))
 
     def get_image(self, image_id):
-            return self.compute_session.get_image(image_id)
+        return self.catalog.fetch_one(
+            'images', image_id,
+            partial(self.compute_session.get_image, image_id))
 
     def get_key_pair(self, key_name):
-        for key in self.compute_session.list_key_pairs():
-            if key_name == key.name:
-                return key
-        raise LookupError("Unknown key `{}`".format(key_name))
+        try:
+            return self.catalog.get('key_pairs', key_name)
+        except KeyError:
+            raise LookupError("Unknown key `{}`".format(key_name))
 
     def generate_instance_metadata(self, owner, environment, server_type):
         instance_metadata = {}
@@ -217,53 +595,148 @@ class Cloud(object):
         instance_metadata['server_type'] = server_type
         return instance_metadata
 
+    def ensure_security_groups(self, group_names):
+        """ Create whichever of the named security groups don't exist yet.
+            Existing groups come from a single listing, and the missing ones
+            are created concurrently """
+        missing = [
+            group_name for group_name in group_names
+            if self.get_security_group(group_name) is None
+        ]
+        gather(dict(
+            (group_name, partial(
+                self.create_if_not_exist_security_group, group_name))
+            for group_name in missing
+        ))
+
     def create_if_not_exist_security_group(self, group_name):
 
         try:
             desc = "Rules for {}".format(group_name)
-            self.compute_session.ex_create_security_group(group_name, desc)
+            group = self.compute_session.ex_create_security_group(
+                group_name, desc)
 
         except Exception as exc:  # libcloud doesn't raise anything better
             if not ("exists" in str(exc)):
                 raise
+            group = None  # created since we listed
 
-    def get_security_group(self, group_name):
+        if hasattr(group, self.SECURITY_GROUP_IDENTIFIER):
+            self.catalog.add('security_groups', group)
+        else:
+            # not a group object (e.g. ec2 only returns the new id)
+            self.catalog.invalidate('security_groups')
 
-        for group in self.list_security_groups():
-            if group_name == getattr(group, self.SECURITY_GROUP_IDENTIFIER):
-                return group
+    def get_security_group(self, group_name):
+        try:
+            return self.catalog.get('security_groups', group_name)
+        except KeyError:
+            return None
 
     def list_security_groups(self):
-        group_list_method = getattr(self.compute_session,
-                                    self.SECURITY_GROUP_METHOD)
-        return group_list_method()
+        return self.catalog.list('security_groups')
+
+
+class EC2Listing(object):
+    """ Listings for clouds with EC2's DescribeInstances filters, on tags,
+        instance ids, launch times and states """
+
+    # terminated instances stay listed for about an hour; a running
+    # instance terminated and gone from listings since the last sync
+    # would be missed, so full syncs can't be further apart than that
+    MAX_FULL_SYNC_INTERVAL = 3000
+
+    def _list_nodes(self, **filters):
+        return self.compute_session.list_nodes(
+            ex_filters=tag_filters(filters))
+
+    def _describe_nodes(self, node_ids):
+        return self.compute_session.list_nodes(
+            ex_filters={'instance-id': node_ids})
+
+    def _list_changed_nodes(self, since, known):
+        # launched (or started) since, to the day, or not running
+        launch_times = launch_time_patterns(since)
+        if len(launch_times) > DESCRIBE_BATCH_SIZE:
+            return NotImplemented
+
+        list_nodes = self.compute_session.list_nodes
+        listed = gather({
+            'launched': partial(
+                list_nodes, ex_filters={'launch-time': launch_times}),
+            'not_running': partial(
+                list_nodes,
+                ex_filters={'instance-state-name': EC2_NOT_RUNNING_STATES}),
+        })
+        nodes = listed['launched'] + listed['not_running']
+
+        rechecked, removed_ids = self._recheck_nodes(
+            known, set(node.id for node in nodes))
+        return nodes + rechecked, removed_ids
 
 
 @backend_for('ec2')
-class AWS(Cloud):
+class AWS(EC2Listing, Cloud):
     TAG_KEY = 'tags'
     INSTANCE_SIZE_ATTRIBUTE = 'id'
     SECURITY_GROUP_IDENTIFIER = 'name'
     SECURITY_GROUP_METHOD = 'ex_get_security_groups'
 
     def __init__(self, cloud_config, region):
+        super(AWS, self).__init__(cloud_config, region)
 
         aws_access_id = cloud_config['AWS_ACCESS_KEY_ID']
         aws_secret_key = cloud_config['AWS_SECRET_ACCESS_KEY']
 
         EC2Driver = get_compute_driver(ComputeProvider.EC2)
-        self.compute_session = EC2Driver(
-            aws_access_id, aws_secret_key, region=region)
-
-    def _monkeypatch_instance(self, instance):
-        instance.extra['gonzo_size'] = instance.extra['instance_type']
-        instance.extra['gonzo_tags'] = instance.extra['tags']
-        created_time = datetime.strptime(
-            instance.extra['launch_time'], "%Y-%m-%dT%H:%M:%S.%fZ"
+        self.compute_session = make_thread_safe(EC2Driver(
+            aws_access_id, aws_secret_key, region=region))
+
+    def _iter_node_pages(self, page_size, **filters):
+        # as EC2NodeDriver.list_nodes, a page of up to MaxResults at a time
+        session = self.compute_session
+        params = {
+            'Action': 'DescribeInstances',
+            'MaxResults': min(max(page_size, 5), 1000),
+        }
+        if filters:
+            params.update(session._build_filters(tag_filters(filters)))
+
+        while True:
+            with profiler.timed('compute.list_nodes', session.connection):
+                elem = session.connection.request(
+                    session.path, params=params).object
+            next_token = findtext(elem, 'nextToken', EC2_NAMESPACE)
+
+            nodes = []
+            for reservation in findall(elem, 'reservationSet/item',
+                                       EC2_NAMESPACE):
+                nodes += session._to_nodes(reservation, 'instancesSet/item')
+            del elem
+
+            elastic_ips = session.ex_describe_addresses(nodes)
+            for node in nodes:
+                node.public_ips.extend(elastic_ips.get(node.id, []))
+            yield nodes
+
+            if not next_token:
+                return
+            params = dict(params, NextToken=next_token)
+
+    def _describe_images(self, image_ids):
+        return self.compute_session.list_images(ex_image_ids=image_ids)
+
+    def _to_instance(self, node):
+        extra = node.extra
+        return Instance(
+            node,
+            tags=extra['tags'],
+            size=extra['instance_type'],
+            created=extra['launch_time'],
+            az=extra['availability'],
+            network_address=extra['dns_name'],
+            cloud=self,
         )
-        instance.extra['gonzo_created_time'] = created_time
-        instance.extra['gonzo_az'] = instance.extra['availability']
-        instance.extra['gonzo_network_address'] = instance.extra['dns_name']
 
     def security_groups_for_launch(self, security_group_names):
         return security_group_names
@@ -283,44 +756,100 @@ class AWS(Cloud):
 class Openstack(Cloud):
     TAG_KEY = 'metadata'
     INSTANCE_SIZE_ATTRIBUTE = 'name'
+    CREATED_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S%fZ"
     SECURITY_GROUP_IDENTIFIER = 'name'
     SECURITY_GROUP_METHOD = 'ex_list_security_groups'
 
     def __init__(self, cloud_config, region):
+        super(Openstack, self).__init__(cloud_config, region)
 
         AUTH_URL = cloud_config['AUTH_URL']
         AUTH_USERNAME = cloud_config['USERNAME']
         AUTH_PASSWORD = cloud_config['PASSWORD']
         TENANT_NAME = cloud_config['TENANT_NAME']
 
-        Openstack = get_compute_driver(ComputeProvider.OPENSTACK)
-        self.compute_session = Openstack(AUTH_USERNAME,
-                                         AUTH_PASSWORD,
-                                         ex_force_auth_url=AUTH_URL,
-                                         ex_tenant_name=TENANT_NAME,
-                                         ex_force_auth_version="2.0_password",
-                                         ex_force_service_region=region
-                                         )
+        OpenstackDriver = get_compute_driver(ComputeProvider.OPENSTACK)
+        self.compute_session = make_thread_safe(reuse_openstack_auth(
+            OpenstackDriver(
+                AUTH_USERNAME,
+                AUTH_PASSWORD,
+                ex_force_auth_url=AUTH_URL,
+                ex_tenant_name=TENANT_NAME,
+                ex_force_auth_version="2.0_password",
+                ex_force_service_region=region
+            )))
         self._size_cache = {}
 
+    def _iter_node_pages(self, page_size, **filters):
+        # metadata can't be filtered on server side, so pages hold every
+        # server; iter_instances picks out the matching ones
+        return self._iter_server_pages({'limit': page_size})
+
+    def _list_changed_nodes(self, since, known):
+        # changes include deletions, as servers in the DELETED state (the
+        # only one libcloud maps to TERMINATED)
+        params = {
+            'changes-since': since.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'limit': DEFAULT_PAGE_SIZE,
+        }
+        nodes = []
+        removed_ids = []
+        for page in self._iter_server_pages(params):
+            for node in page:
+                if node.state == NodeState.TERMINATED:
+                    removed_ids.append(node.id)
+                else:
+                    nodes.append(node)
+        return nodes, removed_ids
+
+    def _iter_server_pages(self, params):
+        """ Lists of servers matching `params`, a page of up to
+            params['limit'] at a time """
+        session = self.compute_session
+        while True:
+            with profiler.timed('compute.list_nodes', session.connection):
+                response = session.connection.request(
+                    '/servers/detail', params=params)
+            nodes = session._to_nodes(response.object)
+            # pages can be cut short of the limit (at Nova's
+            # osapi_max_limit), so only a "next" link says there are more
+            has_next = any(
+                link.get('rel') == 'next'
+                for link in response.object.get('servers_links', []))
+            del response
+            yield nodes
+
+            if not nodes or not has_next:
+                return
+            params = dict(params, marker=nodes[-1].id)
+
     def _get_size_name(self, size_id):
         if size_id not in self._size_cache:
-            ex_size = self.compute_session.ex_get_size(size_id)
-            self._size_cache[size_id] = ex_size.name
+            try:
+                size = self.catalog.get('sizes', size_id, attribute='id')
+            except KeyError:
+                # flavors deleted since an instance was created are no
+                # longer listed, but can still be looked up directly
+                size = self.compute_session.ex_get_size(size_id)
+            self._size_cache[size_id] = size.name
 
         return self._size_cache[size_id]
 
-    def _monkeypatch_instance(self, instance):
-        instance.extra['gonzo_tags'] = instance.extra['metadata']
-        instance.extra['gonzo_size'] = self._get_size_name(
-            instance.extra['flavorId'])
-
-        created_time = datetime.strptime(
-            instance.extra['created'], "%Y-%m-%dT%H:%M:%S%fZ"
+    def _to_instance(self, node):
+        extra = node.extra
+        return Instance(
+            node,
+            tags=extra['metadata'],
+            size=extra['flavorId'],
+            created=extra['created'],
+            az=extra['availability_zone'],
+            # servers still building may not have an address yet
+            network_address=node.private_ips[0] if node.private_ips else None,
+            cloud=self,
         )
-        instance.extra['gonzo_created_time'] = created_time
-        instance.extra['gonzo_az'] = instance.extra['availability_zone']
-        instance.extra['gonzo_network_address'] = instance.private_ips[0]
+
+    def _instance_size(self, size_id):
+        return self._get_size_name(size_id)
 
     def security_groups_for_launch(self, security_group_names):
         return [
@@ -1,43 +1,330 @@
+from collections import namedtuple
+import logging
+import os
+import random
+from threading import Lock
+import time
+from xml.etree import ElementTree as ET
+
+from libcloud.dns.drivers.route53 import (API_ROOT, NAMESPACE,
+                                          InvalidChangeBatch)
 from libcloud.dns.providers import get_driver as get_dns_driver
 from libcloud.dns.types import Provider as DNSProvider
+from libcloud.utils.xml import findtext
+
+from gonzo.clouds.profiling import profiler
+from gonzo.clouds.session import throttle_requests
+from gonzo.clouds.throttle import get_throttle
+from gonzo.clouds.waiter import Waiter
+from gonzo.clouds.zone_snapshot import SNAPSHOT_DIR, ZoneSnapshot
+from gonzo.exceptions import ConcurrentTaskError
+
+
+logger = logging.getLogger(__name__)
+dns_backends = {}
+
+DEFAULT_DNS_BACKEND = 'route53'
+
+# attempts at reserving hostnames, while others keep reserving them first
+RESERVE_ATTEMPTS = 5
+# seconds; retries wait up to this, doubling with each attempt
+RESERVE_RETRY_DELAY = 0.2
+
+# Route53's limits on a single change batch: the number of records changed,
+# and the characters in all of their values
+MAX_BATCH_CHANGES = 1000
+MAX_BATCH_VALUE_CHARS = 32000
+
+# seconds to wait for changes to reach every Route53 server
+CHANGE_TIMEOUT = 600
+
+# seconds between full listings of a snapshotted zone, picking up changes
+# that don't alter its record count (e.g. values updated by others)
+SNAPSHOT_FULL_SYNC_INTERVAL = 3600
+
+
+# a submitted change batch, PENDING until it is INSYNC
+Change = namedtuple('Change', ['id', 'status'])
+
+
+def _to_change(data):
+    change_id = findtext(
+        element=data, xpath='ChangeInfo/Id', namespace=NAMESPACE)
+    status = findtext(
+        element=data, xpath='ChangeInfo/Status', namespace=NAMESPACE)
+    return Change(change_id.replace('/change/', ''), status)
+
+
+def _change_is_insync(change):
+    return change.status == 'INSYNC'
+
+
+def dns_backend_for(provider):
+    def wrapper(cls):
+        dns_backends[provider] = cls
+        return cls
+    return wrapper
+
+
+class ChangeBatch(object):
+    """ Changes to the records of `zone`, collected to be applied together
+        by DNS.apply_changes.
+
+        Each create, update or delete is applied atomically, but a batch
+        too big for a single Route53 change batch is split between several.
+    """
+
+    def __init__(self, zone):
+        self.zone = zone
+        # lists of (action, name, type, data, extra), each applied at once
+        self._changes = []
+
+    def __len__(self):
+        return len(self._changes)
+
+    def create(self, name, record_type, value, ttl=None):
+        extra = {} if ttl is None else {'ttl': ttl}
+        self._changes.append([('CREATE', name, record_type, value, extra)])
+
+    def update(self, record, value):
+        """ Replace the value of `record`, as fetched from the zone """
+        self._changes.append([
+            ('DELETE', record.name, record.type, record.data, record.extra),
+            ('CREATE', record.name, record.type, value, record.extra),
+        ])
+
+    def delete(self, record):
+        self._changes.append([
+            ('DELETE', record.name, record.type, record.data, record.extra),
+        ])
+
+    def batches(self, max_changes=MAX_BATCH_CHANGES,
+                max_chars=MAX_BATCH_VALUE_CHARS):
+        """ The changes, in lists within Route53's limits on a change batch
+        """
+        batch = []
+        chars = 0
+        for changes in self._changes:
+            changes_chars = sum(len(change[3]) for change in changes)
+            if batch and (len(batch) + len(changes) > max_changes or
+                          chars + changes_chars > max_chars):
+                yield batch
+                batch = []
+                chars = 0
+            batch.extend(changes)
+            chars += changes_chars
+        if batch:
+            yield batch
 
 
 class DNS(object):
+    """ DNS zones of a cloud, served by the libcloud DNS `driver` of one of
+        the `dns_backends`.
 
-    def __init__(self, aws_access_id, aws_secret_key):
-        R53Driver = get_dns_driver(DNSProvider.ROUTE53)
-        self.dns_session = R53Driver(aws_access_id, aws_secret_key)
+        With a `snapshot_ttl`, records are looked up in local ZoneSnapshots
+        (saved under `snapshot_dir`), checked for changes once they are
+        older than that many seconds. """
+    backend = None
+
+    def __init__(self, driver, rate_limits=None, snapshot_ttl=0,
+                 snapshot_dir=SNAPSHOT_DIR):
+        self.dns_session = profiler.wrap(throttle_requests(
+            driver, get_throttle('dns', self.backend, rate_limits)), 'dns')
+        self.snapshot_ttl = snapshot_ttl
+        self.snapshot_dir = snapshot_dir
+        self._zones = {}
+        self._zones_lock = Lock()
+        self._snapshots = {}
+        self._snapshots_lock = Lock()
+
+    @classmethod
+    def from_config(cls, cloud_config, use_cache=True):
+        """ DNS for a cloud, from the backend named by its DNS_BACKEND """
+        backend = cloud_config.get('DNS_BACKEND', DEFAULT_DNS_BACKEND)
+        try:
+            backend_cls = dns_backends[backend]
+        except KeyError:
+            raise LookupError(
+                "Unknown DNS backend `{}`. Please choose one of {}".format(
+                    backend, dns_backends.keys()))
+
+        # snapshots are opt in: the first lookup (and every full sync)
+        # lists the whole zone, where a single record lookup would do
+        snapshot_ttl = 0
+        if use_cache:
+            snapshot_ttl = cloud_config.get('DNS_SNAPSHOT_TTL', 0)
+        return backend_cls.for_cloud(
+            cloud_config,
+            rate_limits=cloud_config.get('API_RATE_LIMITS'),
+            snapshot_ttl=snapshot_ttl)
+
+    @classmethod
+    def for_cloud(cls, cloud_config, **kwargs):
+        """ The backend's DNS for `cloud_config`, passing on `kwargs` """
+        raise NotImplementedError()
 
     def get_next_host(self, server_name, zone_name):
+        return self.reserve_hosts(server_name, zone_name, 1)[0]
+
+    def reserve_hosts(self, server_name, zone_name, count):
+        """ Names for `count` new hosts of `server_name`, reserved together
+            by advancing its _count record.
+
+            The count is replaced in a single change batch that deletes the
+            value read, so Route53 rejects it if someone else reserved
+            hosts in the meantime, in which case it is retried with the
+            count read from Route53 rather than any zone snapshot. """
         count_record = "_count-{}".format(server_name)
-        record = self.get_dns_record(count_record, zone_name)
-
-        if record:
-            next_count = int(record.data.strip('"')) + 1
-            self.update_dns_record(
-                record=record,
-                value='"{}"'.format(next_count),
-            )
-        else:
-            next_count = 1
-            self.create_dns_record(
-                name=count_record,
-                value='"{}"'.format(next_count),
-                record_type="TXT",
-                zone_name=zone_name
-            )
-        return "%s-%03d" % (server_name, next_count)
+
+        for attempt in range(RESERVE_ATTEMPTS):
+            record = self.get_dns_record(
+                count_record, zone_name, 'TXT', live=attempt > 0)
+            if record:
+                batch = ChangeBatch(record.zone)
+                first = int(record.data.strip('"')) + 1
+                last = first + count - 1
+                batch.update(record, '"{}"'.format(last))
+            else:
+                batch = self.change_batch(zone_name)
+                first = 1
+                last = count
+                batch.create(count_record, 'TXT', '"{}"'.format(last))
+
+            try:
+                self.apply_changes(batch, wait=False)
+            except InvalidChangeBatch:
+                if attempt + 1 == RESERVE_ATTEMPTS:
+                    raise
+                logger.debug("%s changed while reserving hosts, retrying",
+                             count_record)
+                time.sleep(random.uniform(
+                    0, RESERVE_RETRY_DELAY * 2 ** attempt))
+            else:
+                return [
+                    "%s-%03d" % (server_name, number)
+                    for number in range(first, last + 1)
+                ]
+
+    def change_batch(self, zone_name):
+        """ A ChangeBatch, to collect changes to the zone `zone_name` in """
+        return ChangeBatch(self.get_zone(zone_name))
+
+    def apply_changes(self, batch, wait=True):
+        """ Submit the changes collected in ChangeBatch `batch`, in as few
+            Route53 change batches as its limits allow, and (if `wait`)
+            wait for them all to be INSYNC. Returns the change ids """
+        change_ids = []
+        for changes in batch.batches():
+            change_ids.append(self.change_records(batch.zone, changes))
+            self._update_snapshot(batch.zone, changes)
+        if wait and change_ids:
+            self.wait_for_changes(change_ids)
+        return change_ids
+
+    def change_records(self, zone, changes):
+        """ Apply (action, name, type, data, extra) `changes` to the records
+            of `zone` atomically, in a single change batch. Returns the
+            change id """
+        raise NotImplementedError()
+
+    def get_change(self, change_id):
+        """ The Change with `change_id`, with its current status """
+        raise NotImplementedError()
+
+    def _waiter(self, describe, is_ready):
+        return Waiter(describe, is_ready, timeout=CHANGE_TIMEOUT)
+
+    def wait_for_changes(self, change_ids):
+        """ Block until the changes with `change_ids` are all INSYNC,
+            polling each of them once per tick """
+        def describe(change_ids):
+            return [self.get_change(change_id) for change_id in change_ids]
+
+        waiter = self._waiter(describe, _change_is_insync)
+        _, failed = waiter.wait(
+            [Change(change_id, 'PENDING') for change_id in change_ids])
+        if failed:
+            raise ConcurrentTaskError(failed)
 
     def get_zone(self, zone_name):
-        for zone in self.dns_session.iterate_zones():
-            if zone_name == zone.domain[:-1]:
-                return zone
-
-    def get_dns_record(self, record_name, zone):
-        for dns_record in self.dns_session.iterate_records(
-                self.get_zone(zone)):
-            if record_name == dns_record.name:
-                return dns_record
+        """ The zone named `zone_name`, only listing zones the first time
+            it's asked for """
+        with self._zones_lock:
+            if zone_name not in self._zones:
+                for zone in self.dns_session.iterate_zones():
+                    if zone_name == zone.domain[:-1]:
+                        self._zones[zone_name] = zone
+                        break
+            return self._zones.get(zone_name)
+
+    def _snapshot_path(self, zone_name):
+        return os.path.join(
+            self.snapshot_dir, '{}-{}.json'.format(self.backend, zone_name))
+
+    def _load_snapshot(self, zone_name):
+        if self._snapshots.get(zone_name) is None:
+            self._snapshots[zone_name] = ZoneSnapshot.load(
+                self._snapshot_path(zone_name))
+        return self._snapshots[zone_name]
+
+    def _sync_snapshot(self, zone_name, snapshot, now):
+        session = self.dns_session
+        if (snapshot is not None and
+                now - snapshot.full_synced_at < SNAPSHOT_FULL_SYNC_INTERVAL):
+            # the record count only changes when record sets are added or
+            # removed, so fetching it is far cheaper than listing the zone
+            zone = session.get_zone(snapshot.zone_id)
+            if zone.extra['ResourceRecordSetCount'] == snapshot.marker:
+                snapshot.synced_at = now
+                return snapshot
+        else:
+            zone = self.get_zone(zone_name)
+
+        logger.debug("Listing the records of %s", zone_name)
+        return ZoneSnapshot.from_records(
+            zone, session.iterate_records(zone), now)
+
+    def get_snapshot(self, zone_name):
+        """ The ZoneSnapshot of `zone_name`, brought up to date first if
+            it was last checked more than `snapshot_ttl` seconds ago """
+        with self._snapshots_lock:
+            snapshot = self._load_snapshot(zone_name)
+            now = time.time()
+            if (snapshot is None or
+                    now - snapshot.synced_at >= self.snapshot_ttl):
+                snapshot = self._sync_snapshot(zone_name, snapshot, now)
+                snapshot.save(self._snapshot_path(zone_name))
+                self._snapshots[zone_name] = snapshot
+            return snapshot
+
+    def _update_snapshot(self, zone, changes):
+        """ Apply `changes`, just submitted to `zone`, to its snapshot """
+        if not self.snapshot_ttl:
+            return
+        zone_name = zone.domain[:-1]
+        with self._snapshots_lock:
+            snapshot = self._load_snapshot(zone_name)
+            if snapshot is not None:
+                snapshot.apply(changes)
+                snapshot.save(self._snapshot_path(zone_name))
+
+    def get_dns_record(self, record_name, zone_name, record_type=None,
+                       live=False):
+        """ The record (of `record_type`, if given) named `record_name` in
+            the zone. It's looked up in the zone's snapshot, if there is
+            one and not `live`, otherwise fetched on its own rather than by
+            listing the zone """
+        if self.snapshot_ttl and not live:
+            return self.get_snapshot(zone_name).get_record(
+                record_name, record_type, self.dns_session)
+
+        return self._fetch_record(
+            self.get_zone(zone_name), record_name, record_type)
+
+    def _fetch_record(self, zone, record_name, record_type):
+        """ The record (of `record_type`, if given) named `record_name` in
+            `zone`, or None, fetched from the cloud """
+        raise NotImplementedError()
 
     def get_record_type(self, record_name):
         pass
@@ -56,3 +343,76 @@ class DNS(object):
             name=name,
             data=value
         )
+
+
+@dns_backend_for('route53')
+class Route53(DNS):
+    backend = 'route53'
+
+    def __init__(self, aws_access_id, aws_secret_key, **kwargs):
+        R53Driver = get_dns_driver(DNSProvider.ROUTE53)
+        super(Route53, self).__init__(
+            R53Driver(aws_access_id, aws_secret_key), **kwargs)
+
+    @classmethod
+    def for_cloud(cls, cloud_config, **kwargs):
+        return cls(cloud_config['AWS_ACCESS_KEY_ID'],
+                   cloud_config['AWS_SECRET_ACCESS_KEY'],
+                   **kwargs)
+
+    def change_records(self, zone, changes):
+        session = self.dns_session
+
+        request = ET.Element(
+            'ChangeResourceRecordSetsRequest', {'xmlns': NAMESPACE})
+        batch = ET.SubElement(request, 'ChangeBatch')
+        changes_element = ET.SubElement(batch, 'Changes')
+        for action, name, record_type, data, extra in changes:
+            change = ET.SubElement(changes_element, 'Change')
+            ET.SubElement(change, 'Action').text = action
+            rrs = ET.SubElement(change, 'ResourceRecordSet')
+            ET.SubElement(rrs, 'Name').text = '{}.{}'.format(
+                name, zone.domain)
+            ET.SubElement(rrs, 'Type').text = (
+                session.RECORD_TYPE_MAP[record_type])
+            ET.SubElement(rrs, 'TTL').text = str(extra.get('ttl', '0'))
+            records = ET.SubElement(rrs, 'ResourceRecords')
+            record = ET.SubElement(records, 'ResourceRecord')
+            ET.SubElement(record, 'Value').text = data
+
+        session.connection.set_context({'zone_id': zone.id})
+        with profiler.timed('dns.change_records', session.connection):
+            data = session.connection.request(
+                '{}hostedzone/{}/rrset'.format(API_ROOT, zone.id),
+                method='POST', data=ET.tostring(request)).object
+        return _to_change(data).id
+
+    def get_change(self, change_id):
+        session = self.dns_session
+        with profiler.timed('dns.get_change', session.connection):
+            data = session.connection.request(
+                '{}change/{}'.format(API_ROOT, change_id)).object
+        return _to_change(data)
+
+    def _fetch_record(self, zone, record_name, record_type):
+        session = self.dns_session
+
+        # a starting point for the listing rather than a filter, so the
+        # first record returned may not be the one asked for
+        params = {
+            'name': '{}.{}'.format(record_name, zone.domain),
+            'maxitems': '1',
+        }
+        if record_type is not None:
+            params['type'] = record_type
+
+        session.connection.set_context({'zone_id': zone.id})
+        with profiler.timed('dns.get_record', session.connection):
+            data = session.connection.request(
+                '{}hostedzone/{}/rrset'.format(API_ROOT, zone.id),
+                params=params).object
+
+        for dns_record in session._to_records(data=data, zone=zone):
+            if (dns_record.name.lower() == record_name.lower() and
+                    record_type in (None, dns_record.type)):
+                return dns_record
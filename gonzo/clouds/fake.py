@@ -0,0 +1,649 @@
+""" In-memory cloud, for exercising gonzo offline and at scale
+
+A ``fake`` backend simulates a single region of a cloud in process: nodes
+(optionally a pre-built fleet of them), sizes, zones, images, key pairs,
+volumes and security groups. The ``fake`` DNS backend simulates the cloud's
+DNS_ZONE, applying changes atomically as Route53 does, and taking a while
+to propagate them. Every API call can be slowed down by a fixed latency,
+and made to fail at random, e.g.::
+
+    CLOUDS = {
+        'fake': {
+            'BACKEND': 'fake',
+            'DNS_BACKEND': 'fake',
+            'REGIONS': ['fake-1'],
+            'DNS_ZONE': 'example.com',
+            'FAKE_FLEET_SIZE': 10000,
+            'FAKE_LATENCY': 0.05,
+            'FAKE_FAILURE_RATE': {'create_node': 0.1},
+            'FAKE_TERMINATED_TTL': 3600,
+            'FAKE_DNS_LATENCY': 0.1,
+            'FAKE_DNS_PROPAGATION_DELAY': 30,
+            ...
+        },
+    }
+"""
+
+from collections import Counter
+from datetime import datetime, timedelta
+from fnmatch import fnmatch
+from functools import wraps
+from itertools import count
+import random
+from threading import Lock
+import time
+
+from libcloud.common.base import ConnectionKey
+from libcloud.compute.base import (KeyPair, Node, NodeDriver, NodeImage,
+                                   NodeLocation, NodeSize, StorageVolume)
+from libcloud.compute.types import NodeState
+from libcloud.dns.base import DNSDriver, Record, Zone
+from libcloud.dns.drivers.route53 import InvalidChangeBatch
+from libcloud.dns.types import ZoneDoesNotExistError
+
+from gonzo.clouds.compute import Cloud, EC2Listing, backend_for, tag_filters
+from gonzo.clouds.dns import DNS, Change, dns_backend_for
+from gonzo.clouds.instance import Instance
+
+
+LAUNCH_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+
+# as EC2's instance-state-name
+STATE_NAMES = {
+    NodeState.PENDING: 'pending',
+    NodeState.RUNNING: 'running',
+    NodeState.TERMINATED: 'terminated',
+}
+
+FLEET_ENVIRONMENTS = ['production', 'staging', 'test']
+FLEET_SERVER_TYPES = ['web-app', 'platform-app', 'db', 'worker', 'cache']
+FLEET_OWNERS = ['alice', 'bob', 'carol']
+
+SIZES = [
+    # name, ram, disk
+    ('m1.small', 2048, 20),
+    ('m1.medium', 4096, 40),
+    ('m1.large', 8192, 80),
+]
+
+
+class FakeAPIError(Exception):
+    pass
+
+
+class FakeSecurityGroup(object):
+    def __init__(self, id, name, description):
+        self.id = id
+        self.name = name
+        self.description = description
+
+
+class SimulatedAPI(object):
+    """ Call counting, latency and failures for the API calls of a fake
+        driver """
+
+    def _init_simulation(self, latency, failure_rate, seed):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+
+        self.calls = Counter()
+        self._lock = Lock()
+        self._ids = count(1)
+
+    def _next_id(self, prefix):
+        with self._lock:
+            return '{}-{:08x}'.format(prefix, next(self._ids))
+
+    def _simulate(self, method_name):
+        with self._lock:
+            self.calls[method_name] += 1
+            failure_rate = self.failure_rate
+            if isinstance(failure_rate, dict):
+                failure_rate = failure_rate.get(method_name, 0)
+            failed = failure_rate and self.random.random() < failure_rate
+
+        if self.latency:
+            time.sleep(self.latency)
+        if failed:
+            raise FakeAPIError("Simulated failure of {}".format(method_name))
+
+
+def simulated(method):
+    """ Count calls to an API method, applying the driver's latency and
+        failure rate """
+
+    @wraps(method)
+    def api_call(self, *args, **kwargs):
+        self._simulate(method.__name__)
+        return method(self, *args, **kwargs)
+
+    return api_call
+
+
+class FixedPolling(object):
+    """ Waiting that polls every `poll_interval` seconds, when set, rather
+        than backing off, so that offline runs don't sit idle """
+
+    poll_interval = None
+
+    def _waiter(self, describe, is_ready):
+        waiter = super(FixedPolling, self)._waiter(describe, is_ready)
+        if self.poll_interval is not None:
+            waiter.initial_delay = waiter.max_delay = self.poll_interval
+        return waiter
+
+
+class FakeNodeDriver(SimulatedAPI, NodeDriver):
+    """ libcloud compute driver backed by in-memory state
+
+    `latency` is the seconds each API call takes, and `failure_rate` the
+    probability of it raising a FakeAPIError, either for all calls or as a
+    dict by method name. Nodes and volumes become available `boot_time`
+    seconds after being created, and destroyed nodes are still listed (as
+    terminated) for `terminated_ttl` seconds, as on EC2.
+    """
+
+    type = 'fake'
+    name = 'Fake'
+    website = 'http://example.com'
+
+    def __init__(self, region='fake-1', fleet_size=0, latency=0,
+                 failure_rate=0, boot_time=0, seed=None, zone_count=3,
+                 terminated_ttl=3600):
+        super(FakeNodeDriver, self).__init__(key='fake')
+        self._init_simulation(latency, failure_rate, seed)
+        self.region = region
+        self.boot_time = boot_time
+        self.terminated_ttl = terminated_ttl
+
+        self.sizes = [
+            NodeSize(id=name, name=name, ram=ram, disk=disk, bandwidth=None,
+                     price=None, driver=self)
+            for name, ram, disk in SIZES
+        ]
+        self.locations = [
+            NodeLocation(id=zone, name=zone, country='GB', driver=self)
+            for zone in (
+                '{}{}'.format(region, chr(ord('a') + index))
+                for index in range(zone_count))
+        ]
+        self.images = {}
+        self.key_pairs = {}
+        self.security_groups = {}
+        self.volumes = {}
+        self.nodes = {}
+
+        self.add_image('ami-fake', 'gonzo-base')
+        self.add_key_pair('master')
+        self.add_fleet(fleet_size)
+
+    # setup, not counted as API calls
+
+    def add_image(self, image_id, name, state='available'):
+        self.images[image_id] = NodeImage(
+            id=image_id, name=name, driver=self, extra={'state': state})
+        return self.images[image_id]
+
+    def add_key_pair(self, name):
+        self.key_pairs[name] = KeyPair(
+            name=name, public_key='ssh-rsa fake', fingerprint='fa:ke',
+            driver=self)
+        return self.key_pairs[name]
+
+    def add_node(self, name, size, location, tags, launch_time=None,
+                 state=NodeState.RUNNING):
+        node_id = self._next_id('i')
+        launch_time = launch_time or datetime.utcnow()
+        with self._lock:
+            index = len(self.nodes)
+            self.nodes[node_id] = {
+                'id': node_id,
+                'name': name,
+                'state': state,
+                'created': time.time(),
+                'private_ip': '10.{}.{}.{}'.format(
+                    index // 62500 % 256, index // 250 % 250, index % 250 + 1),
+                'extra': {
+                    'tags': dict(tags, Name=name),
+                    'instance_type': size,
+                    'availability': location,
+                    'launch_time': launch_time.strftime(LAUNCH_TIME_FORMAT),
+                    'dns_name': '{}.{}.fake'.format(node_id, self.region),
+                },
+            }
+        return node_id
+
+    def add_fleet(self, size):
+        """ Add `size` running instances, spread across environments, server
+            types and zones, launched over the preceding days """
+        started = datetime.utcnow() - timedelta(seconds=size * 60)
+        groups = [
+            (environment, server_type)
+            for environment in FLEET_ENVIRONMENTS
+            for server_type in FLEET_SERVER_TYPES
+        ]
+        for index in range(size):
+            environment, server_type = groups[index % len(groups)]
+            number = index // len(groups) + 1
+            self.add_node(
+                name='{}-{}-{:03d}'.format(environment, server_type, number),
+                size=SIZES[index % len(SIZES)][0],
+                location=self.locations[number % len(self.locations)].name,
+                tags={
+                    'environment': environment,
+                    'server_type': server_type,
+                    'owner': FLEET_OWNERS[index % len(FLEET_OWNERS)],
+                },
+                launch_time=started + timedelta(seconds=index * 60),
+            )
+
+    # nodes
+
+    def _state(self, record):
+        state = record['state']
+        if (state == NodeState.PENDING and
+                time.time() - record['created'] >= self.boot_time):
+            state = record['state'] = NodeState.RUNNING
+        return state
+
+    def _records(self):
+        """ Node records, in the order they were created, forgetting those
+            terminated more than `terminated_ttl` seconds ago """
+        now = time.time()
+        with self._lock:
+            for node_id, record in self.nodes.items():
+                terminated = record.get('terminated')
+                if terminated and now - terminated > self.terminated_ttl:
+                    del self.nodes[node_id]
+            # ids are allocated in order
+            return [self.nodes[node_id] for node_id in sorted(self.nodes)]
+
+    def _to_node(self, record):
+        return Node(
+            id=record['id'],
+            name=record['name'],
+            state=self._state(record),
+            public_ips=[],
+            private_ips=[record['private_ip']],
+            driver=self,
+            extra=dict(record['extra'], tags=dict(record['extra']['tags'])),
+        )
+
+    def _matches(self, record, filters):
+        for key, value in filters.items():
+            if not isinstance(value, (list, tuple)):
+                value = [value]
+            if key == 'instance-id':
+                actual = record['id']
+            elif key == 'instance-state-name':
+                actual = STATE_NAMES[self._state(record)]
+            elif key == 'launch-time':
+                launch_time = record['extra']['launch_time']
+                if not any(fnmatch(launch_time, pattern) for pattern in value):
+                    return False
+                continue
+            elif key.startswith('tag:'):
+                actual = record['extra']['tags'].get(key[len('tag:'):])
+            else:
+                raise FakeAPIError("Unsupported filter `{}`".format(key))
+            if actual not in value:
+                return False
+        return True
+
+    @simulated
+    def list_nodes(self, ex_filters=None):
+        records = self._records()
+        if ex_filters:
+            records = [
+                record for record in records
+                if self._matches(record, ex_filters)
+            ]
+        return [self._to_node(record) for record in records]
+
+    @simulated
+    def ex_list_nodes_page(self, ex_filters=None, max_results=None,
+                           next_token=None):
+        """ (nodes, next_token) for a page of up to `max_results` nodes,
+            paged as EC2's DescribeInstances """
+        start = int(next_token or 0)
+        records = self._records()
+        if ex_filters:
+            records = [
+                record for record in records
+                if self._matches(record, ex_filters)
+            ]
+        end = len(records) if max_results is None else start + max_results
+        next_token = str(end) if end < len(records) else None
+        page = [self._to_node(record) for record in records[start:end]]
+        return page, next_token
+
+    @simulated
+    def create_node(self, name, size, image, location=None,
+                    ex_security_groups=None, ex_metadata=None,
+                    ex_userdata=None, ex_keyname=None, **kwargs):
+        if location is None:
+            location = self.locations[0]
+        node_id = self.add_node(
+            name, size.name, location.name, ex_metadata or {},
+            state=NodeState.PENDING)
+        node = self._to_node(self.nodes[node_id])
+        node.state = NodeState.PENDING
+        return node
+
+    @simulated
+    def destroy_node(self, node):
+        with self._lock:
+            record = self.nodes.get(node.id)
+            if record is not None:
+                record['state'] = NodeState.TERMINATED
+                record['terminated'] = time.time()
+        return True
+
+    # catalog
+
+    @simulated
+    def list_sizes(self, location=None):
+        return list(self.sizes)
+
+    @simulated
+    def list_locations(self):
+        return list(self.locations)
+
+    @simulated
+    def list_images(self, location=None, ex_image_ids=None):
+        if ex_image_ids is None:
+            return list(self.images.values())
+        return [
+            self.images[image_id] for image_id in ex_image_ids
+            if image_id in self.images
+        ]
+
+    @simulated
+    def get_image(self, image_id):
+        try:
+            return self.images[image_id]
+        except KeyError:
+            raise FakeAPIError("No such image `{}`".format(image_id))
+
+    @simulated
+    def list_key_pairs(self):
+        return list(self.key_pairs.values())
+
+    @simulated
+    def ex_list_security_groups(self):
+        return list(self.security_groups.values())
+
+    @simulated
+    def ex_create_security_group(self, name, description):
+        with self._lock:
+            if name in self.security_groups:
+                raise FakeAPIError(
+                    "Security group `{}` already exists".format(name))
+            group = FakeSecurityGroup(
+                'sg-{:08x}'.format(len(self.security_groups) + 1),
+                name, description)
+            self.security_groups[name] = group
+        return group
+
+    # volumes
+
+    @simulated
+    def create_volume(self, size, name, location=None, snapshot=None,
+                      ex_volume_type=None):
+        volume_id = self._next_id('vol')
+        self.volumes[volume_id] = (time.time(), StorageVolume(
+            id=volume_id, name=name, size=size, driver=self,
+            extra={'state': 'creating'}))
+        return self.volumes[volume_id][1]
+
+    @simulated
+    def list_volumes(self):
+        volumes = []
+        for created, volume in self.volumes.values():
+            if time.time() - created >= self.boot_time:
+                volume.extra['state'] = 'available'
+            volumes.append(volume)
+        return volumes
+
+    @simulated
+    def attach_volume(self, node, volume, device=None):
+        volume.extra['attached_to'] = node.id
+        return True
+
+
+@backend_for('fake')
+class Fake(FixedPolling, EC2Listing, Cloud):
+    TAG_KEY = 'tags'
+    INSTANCE_SIZE_ATTRIBUTE = 'name'
+    SECURITY_GROUP_IDENTIFIER = 'name'
+    SECURITY_GROUP_METHOD = 'ex_list_security_groups'
+    CREATED_TIME_FORMAT = LAUNCH_TIME_FORMAT
+
+    def __init__(self, cloud_config, region):
+        super(Fake, self).__init__(cloud_config, region)
+        self.compute_session = FakeNodeDriver(
+            region=region,
+            fleet_size=cloud_config.get('FAKE_FLEET_SIZE', 0),
+            latency=cloud_config.get('FAKE_LATENCY', 0),
+            failure_rate=cloud_config.get('FAKE_FAILURE_RATE', 0),
+            boot_time=cloud_config.get('FAKE_BOOT_TIME', 0),
+            seed=cloud_config.get('FAKE_SEED'),
+            terminated_ttl=cloud_config.get('FAKE_TERMINATED_TTL', 3600),
+        )
+        self.poll_interval = cloud_config.get('FAKE_POLL_INTERVAL')
+
+    def _iter_node_pages(self, page_size, **filters):
+        next_token = None
+        while True:
+            nodes, next_token = self.compute_session.ex_list_nodes_page(
+                ex_filters=tag_filters(filters), max_results=page_size,
+                next_token=next_token)
+            yield nodes
+            if next_token is None:
+                return
+
+    def _to_instance(self, node):
+        extra = node.extra
+        return Instance(
+            node,
+            tags=extra['tags'],
+            size=extra['instance_type'],
+            created=extra['launch_time'],
+            az=extra['availability'],
+            network_address=node.private_ips[0] if node.private_ips else None,
+            cloud=self,
+        )
+
+    def security_groups_for_launch(self, security_group_names):
+        return security_group_names
+
+    def create_volume(self, instance, vol_name, vol_size, vol_type=None):
+        return self.compute_session.create_volume(
+            name=vol_name,
+            size=vol_size,
+            location=self.get_az_of_instance(instance),
+        )
+
+
+class FakeDNSDriver(SimulatedAPI, DNSDriver):
+    """ libcloud DNS driver backed by in-memory zones
+
+    Changes are applied as by Route53: a batch of them at once, or not at
+    all (raising InvalidChangeBatch) if it creates a record set that exists
+    or deletes a record that doesn't. Each batch is PENDING for
+    `propagation_delay` seconds before it's INSYNC. `latency`,
+    `failure_rate` and `seed` are as for FakeNodeDriver.
+
+    Several DNS objects sharing a driver act as gonzo processes sharing a
+    zone, e.g. to simulate concurrent launches contending for hostnames.
+    """
+
+    type = 'fake'
+    name = 'Fake DNS'
+    website = 'http://example.com'
+    connectionCls = ConnectionKey
+
+    def __init__(self, zones=(), latency=0, failure_rate=0,
+                 propagation_delay=0, seed=None):
+        super(FakeDNSDriver, self).__init__(key='fake')
+        self._init_simulation(latency, failure_rate, seed)
+        self.propagation_delay = propagation_delay
+
+        self.domains = {}
+        # {zone id: {(name, type): {'ttl': ttl, 'values': [value, ...]}}}
+        self.record_sets = {}
+        # submission times, by change id
+        self.changes = {}
+
+        for domain in zones:
+            self.add_zone(domain)
+
+    # setup, not counted as API calls
+
+    def add_zone(self, domain):
+        zone_id = self._next_id('Z')
+        with self._lock:
+            self.domains[zone_id] = '{}.'.format(domain)
+            self.record_sets[zone_id] = {}
+        return zone_id
+
+    # zones and records
+
+    def _to_zone(self, zone_id):
+        if zone_id not in self.domains:
+            raise ZoneDoesNotExistError(
+                value='', driver=self, zone_id=zone_id)
+        return Zone(
+            zone_id, self.domains[zone_id], 'master', None, self,
+            extra={'ResourceRecordSetCount': len(self.record_sets[zone_id])})
+
+    def _to_records(self, zone, key, record_set):
+        name, record_type = key
+        return [
+            Record(
+                id='{}:{}'.format(record_type, name), name=name,
+                type=record_type, data=value, zone=zone, driver=self,
+                extra={'ttl': record_set['ttl']})
+            for value in record_set['values']
+        ]
+
+    @simulated
+    def iterate_zones(self):
+        with self._lock:
+            return iter([
+                self._to_zone(zone_id) for zone_id in sorted(self.domains)
+            ])
+
+    @simulated
+    def get_zone(self, zone_id):
+        with self._lock:
+            return self._to_zone(zone_id)
+
+    @simulated
+    def iterate_records(self, zone):
+        with self._lock:
+            record_sets = sorted(self.record_sets[zone.id].items())
+        records = []
+        for key, record_set in record_sets:
+            records.extend(self._to_records(zone, key, record_set))
+        return iter(records)
+
+    @simulated
+    def ex_get_record(self, zone, name, record_type=None):
+        """ The record (of `record_type`, if given) named `name`, or None
+        """
+        with self._lock:
+            record_sets = sorted(self.record_sets[zone.id].items())
+        for key, record_set in record_sets:
+            if key[0] == name.lower() and record_type in (None, key[1]):
+                return self._to_records(zone, key, record_set)[0]
+        return None
+
+    @simulated
+    def ex_change_records(self, zone, changes):
+        """ Apply (action, name, type, data, extra) `changes` atomically,
+            returning the change id """
+        change_id = self._next_id('C')
+        with self._lock:
+            record_sets = self.record_sets[zone.id]
+            changed = {}
+            for action, name, record_type, data, extra in changes:
+                key = (name.lower(), record_type)
+                if key in changed:
+                    record_set = changed[key]
+                else:
+                    record_set = record_sets.get(key)
+                    if record_set is not None:
+                        record_set = dict(
+                            record_set, values=list(record_set['values']))
+
+                if action == 'DELETE':
+                    if record_set is None or data not in record_set['values']:
+                        raise InvalidChangeBatch(
+                            "Tried to delete resource record set {} {} but "
+                            "it was not found".format(name, record_type),
+                            driver=self)
+                    record_set['values'].remove(data)
+                    changed[key] = record_set if record_set['values'] else None
+                elif action == 'CREATE':
+                    if record_set is not None:
+                        raise InvalidChangeBatch(
+                            "Tried to create resource record set {} {} but "
+                            "it already exists".format(name, record_type),
+                            driver=self)
+                    changed[key] = {
+                        'ttl': int(extra.get('ttl', 0)),
+                        'values': [data],
+                    }
+                else:
+                    raise FakeAPIError(
+                        "Unsupported action `{}`".format(action))
+
+            for key, record_set in changed.items():
+                if record_set is None:
+                    record_sets.pop(key, None)
+                else:
+                    record_sets[key] = record_set
+            self.changes[change_id] = time.time()
+        return change_id
+
+    @simulated
+    def ex_get_change(self, change_id):
+        with self._lock:
+            submitted = self.changes.get(change_id)
+        if submitted is None:
+            raise FakeAPIError("No such change `{}`".format(change_id))
+        if time.time() - submitted < self.propagation_delay:
+            return Change(change_id, 'PENDING')
+        return Change(change_id, 'INSYNC')
+
+
+@dns_backend_for('fake')
+class FakeDNS(FixedPolling, DNS):
+    backend = 'fake'
+
+    def __init__(self, driver=None, poll_interval=None, **kwargs):
+        super(FakeDNS, self).__init__(driver or FakeDNSDriver(), **kwargs)
+        self.poll_interval = poll_interval
+
+    @classmethod
+    def for_cloud(cls, cloud_config, **kwargs):
+        driver = FakeDNSDriver(
+            zones=[cloud_config['DNS_ZONE']],
+            latency=cloud_config.get('FAKE_DNS_LATENCY', 0),
+            failure_rate=cloud_config.get('FAKE_DNS_FAILURE_RATE', 0),
+            propagation_delay=cloud_config.get(
+                'FAKE_DNS_PROPAGATION_DELAY', 0),
+            seed=cloud_config.get('FAKE_SEED'),
+        )
+        return cls(driver, cloud_config.get('FAKE_POLL_INTERVAL'), **kwargs)
+
+    def change_records(self, zone, changes):
+        return self.dns_session.ex_change_records(zone, changes)
+
+    def get_change(self, change_id):
+        return self.dns_session.ex_get_change(change_id)
+
+    def _fetch_record(self, zone, record_name, record_type):
+        return self.dns_session.ex_get_record(zone, record_name, record_type)
@@ -0,0 +1,105 @@
+""" Compact records of the instances in a listing
+
+Listings can hold many thousands of instances, of which callers typically
+need a handful of fields. Instances keep those fields (rather than the
+libcloud Node, with its large `extra` dict), and only work out the ones
+that are expensive to compute (e.g. parsing timestamps, or looking up
+flavor names) when they are first used.
+"""
+
+import hashlib
+
+from libcloud.compute.types import NodeState
+
+
+_UNSET = object()
+
+
+class Instance(object):
+    """ The parts of a libcloud Node gonzo uses
+
+    `size` and `created` are as given by the cloud, and are converted into
+    `gonzo_size` and `gonzo_created_time` by the `cloud`'s
+    `_instance_size` and `_instance_created_time` when first needed.
+    """
+
+    __slots__ = (
+        'id', 'name', 'state', 'public_ips', 'private_ips', 'driver',
+        'gonzo_tags', 'gonzo_az', 'gonzo_network_address',
+        '_size', '_created', '_gonzo_size', '_gonzo_created_time', '_uuid',
+        '_cloud',
+    )
+
+    def __init__(self, node, tags, size=None, created=None, az=None,
+                 network_address=None, cloud=None):
+        self.id = node.id
+        self.name = node.name
+        self.state = node.state
+        self.public_ips = node.public_ips
+        self.private_ips = node.private_ips
+        self.driver = node.driver
+        self.gonzo_tags = tags
+        self.gonzo_az = az
+        self.gonzo_network_address = network_address
+
+        self._size = size
+        self._created = created
+        self._gonzo_size = _UNSET
+        self._gonzo_created_time = _UNSET
+        self._uuid = None
+        self._cloud = cloud
+
+    def __repr__(self):
+        return '<Instance: id={}, name={}, state={}>'.format(
+            self.id, self.name, NodeState.tostring(self.state))
+
+    @property
+    def gonzo_size(self):
+        if self._gonzo_size is _UNSET:
+            size = self._size
+            if self._cloud is not None and size is not None:
+                size = self._cloud._instance_size(size)
+            self._gonzo_size = size
+        return self._gonzo_size
+
+    @property
+    def gonzo_created_time(self):
+        if self._gonzo_created_time is _UNSET:
+            created = self._created
+            if self._cloud is not None and created is not None:
+                created = self._cloud._instance_created_time(created)
+            self._gonzo_created_time = created
+        return self._gonzo_created_time
+
+    @property
+    def uuid(self):
+        # as libcloud's Node.uuid, so the two can be used interchangeably
+        if self._uuid is None:
+            self._uuid = hashlib.sha1(
+                '{}:{}'.format(self.id, self.driver.type)).hexdigest()
+        return self._uuid
+
+    @property
+    def extra(self):
+        """ The gonzo_* fields, as they used to be stored in Node.extra """
+        return {
+            'gonzo_size': self.gonzo_size,
+            'gonzo_tags': self.gonzo_tags,
+            'gonzo_created_time': self.gonzo_created_time,
+            'gonzo_az': self.gonzo_az,
+            'gonzo_network_address': self.gonzo_network_address,
+        }
+
+    def __getstate__(self):
+        # lazy fields not worked out yet stay that way
+        state = {}
+        for slot in self.__slots__:
+            value = getattr(self, slot)
+            if value is not _UNSET:
+                state[slot] = value
+        return state
+
+    def __setstate__(self, state):
+        self._gonzo_size = self._gonzo_created_time = _UNSET
+        for slot, value in state.items():
+            setattr(self, slot, value)
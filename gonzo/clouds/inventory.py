@@ -0,0 +1,103 @@
+""" In-memory indexes over a single instance listing, and snapshots of
+listings that can be kept up to date incrementally
+"""
+
+from collections import Counter, defaultdict
+
+from libcloud.compute.types import NodeState
+
+
+class Inventory(object):
+    """ Wraps a listing of Instance records, lazily building the
+        lookup tables needed to answer queries without rescanning it.
+    """
+
+    def __init__(self, instances):
+        self.instances = instances
+        self._by_type = None
+        self._az_counts = None
+        self._by_name = None
+        self._by_uuid = None
+
+    def _index_on(self, attribute):
+        index = {}
+        for instance in self.instances:
+            # first match wins, as with a linear scan
+            index.setdefault(getattr(instance, attribute), instance)
+        return index
+
+    @property
+    def by_name(self):
+        if self._by_name is None:
+            self._by_name = self._index_on('name')
+        return self._by_name
+
+    @property
+    def by_uuid(self):
+        if self._by_uuid is None:
+            self._by_uuid = self._index_on('uuid')
+        return self._by_uuid
+
+    @property
+    def by_type(self):
+        """ instances keyed on (environment, server_type), sorted by name """
+        if self._by_type is None:
+            by_type = defaultdict(list)
+            for instance in self.instances:
+                tags = instance.gonzo_tags
+                key = (tags.get('environment'), tags.get('server_type'))
+                by_type[key].append(instance)
+
+            for instances_of_type in by_type.values():
+                instances_of_type.sort(key=lambda i: i.name)
+            self._by_type = dict(by_type)
+        return self._by_type
+
+    def of_type(self, environment, server_type):
+        return list(self.by_type.get((environment, server_type), []))
+
+    def az_counts(self, environment, server_type):
+        """ Counter of the availability zones of the type's instances,
+            excluding terminated ones """
+        if self._az_counts is None:
+            az_counts = defaultdict(Counter)
+            for instance in self.instances:
+                if instance.state == NodeState.TERMINATED:
+                    continue
+                tags = instance.gonzo_tags
+                key = (tags.get('environment'), tags.get('server_type'))
+                az_counts[key][instance.gonzo_az] += 1
+            self._az_counts = dict(az_counts)
+        return self._az_counts.get((environment, server_type), Counter())
+
+
+class InventorySnapshot(object):
+    """ A listing as of the last sync, which later syncs can merge just the
+        changes into
+
+    `synced_at` and `full_synced_at` are when the last sync, and the last
+    full listing, started.
+    """
+
+    def __init__(self, instances, synced_at):
+        self.instances = instances
+        self.synced_at = synced_at
+        self.full_synced_at = synced_at
+
+    def merge(self, changed, removed_ids, synced_at):
+        """ Replace instances with their `changed` versions (adding any new
+            ones) and drop those with `removed_ids` """
+        changed = dict((instance.id, instance) for instance in changed)
+        removed_ids = set(removed_ids)
+
+        instances = []
+        for instance in self.instances:
+            if instance.id not in removed_ids:
+                instances.append(changed.pop(instance.id, instance))
+        instances.extend(sorted(
+            (instance for instance in changed.values()
+             if instance.id not in removed_ids),
+            key=lambda instance: instance.name))
+
+        self.instances = instances
+        self.synced_at = synced_at
@@ -0,0 +1,138 @@
+""" Timing of the calls gonzo makes to cloud APIs
+
+When enabled (``gonzo --profile``), compute and DNS drivers are wrapped so
+that every call records its duration and the size of the responses it
+received, to be summarised per operation when the command ends.
+"""
+
+from contextlib import contextmanager
+from functools import wraps
+import inspect
+import math
+from threading import Lock
+import time
+
+
+def percentile(values, percent):
+    """ Nearest-rank `percent` percentile of the sorted list `values` """
+    if not values:
+        return None
+    rank = int(math.ceil(percent / 100.0 * len(values)))
+    return values[max(0, rank - 1)]
+
+
+class ProfiledSession(object):
+    """ Proxy for a libcloud driver, recording each public method call as an
+        operation named `<family>.<method>` """
+
+    def __init__(self, session, family, profiler):
+        self._session = session
+        self._family = family
+        self._profiler = profiler
+
+    def __getattr__(self, name):
+        attr = getattr(self._session, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        operation = '{}.{}'.format(self._family, name)
+        connection = getattr(self._session, 'connection', None)
+        profiler = self._profiler
+
+        if inspect.isgeneratorfunction(attr):
+            # iterate_* methods only make requests as they are iterated over
+            @wraps(attr)
+            def profiled_iterator(*args, **kwargs):
+                return profiler.timed_iterator(
+                    operation, connection, attr(*args, **kwargs))
+            return profiled_iterator
+
+        @wraps(attr)
+        def profiled(*args, **kwargs):
+            with profiler.timed(operation, connection):
+                return attr(*args, **kwargs)
+
+        return profiled
+
+
+class Profiler(object):
+    """ Durations and response sizes of calls, by operation """
+
+    def __init__(self, clock=None):
+        self.enabled = False
+        self.clock = clock or time.time
+        self._calls = {}
+        self._lock = Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def record(self, operation, duration, size=0):
+        with self._lock:
+            self._calls.setdefault(operation, []).append((duration, size))
+
+    @contextmanager
+    def timed(self, operation, connection=None):
+        """ Record the time spent in the body as a call to `operation`,
+            along with the bytes received by `connection` meanwhile """
+        if not self.enabled:
+            yield
+            return
+
+        received = getattr(connection, 'received_bytes', 0)
+        started = self.clock()
+        try:
+            yield
+        finally:
+            size = getattr(connection, 'received_bytes', 0) - received
+            self.record(operation, self.clock() - started, size)
+
+    def timed_iterator(self, operation, connection, iterator):
+        """ Record the time spent iterating over `iterator` as one call """
+        duration = 0
+        size = 0
+        try:
+            while True:
+                received = getattr(connection, 'received_bytes', 0)
+                started = self.clock()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    duration += self.clock() - started
+                    size += getattr(connection, 'received_bytes', 0) - received
+                yield item
+        finally:
+            self.record(operation, duration, size)
+
+    def wrap(self, session, family):
+        """ `session` wrapped to record its calls, if profiling is enabled
+        """
+        if not self.enabled:
+            return session
+        return ProfiledSession(session, family, self)
+
+    def summary(self):
+        """ Count, p50 and p95 latency (in seconds), total time and bytes
+            received for each operation, slowest in total first """
+        with self._lock:
+            calls = dict(
+                (operation, list(records))
+                for operation, records in self._calls.items())
+
+        summary = []
+        for operation, records in calls.items():
+            durations = sorted(duration for duration, _ in records)
+            summary.append({
+                'operation': operation,
+                'count': len(records),
+                'p50': percentile(durations, 50),
+                'p95': percentile(durations, 95),
+                'total': sum(durations),
+                'bytes': sum(size for _, size in records),
+            })
+        return sorted(summary, key=lambda row: row['total'], reverse=True)
+
+
+profiler = Profiler()
@@ -0,0 +1,227 @@
+""" Helpers for sharing libcloud drivers between threads and processes
+
+libcloud connections open a new HTTP connection for every request, storing
+it (and the request context) on the connection object. When one driver is
+used from several threads, these need to be kept per thread; they are also
+kept open between requests, rather than reconnecting every time. Requests
+can be sent through a Throttle, to keep within the cloud's rate limits.
+
+OpenStack auth tokens are saved to disk, so that separate gonzo commands
+(e.g. chained fab tasks) authenticate once between them.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from libcloud.common.openstack import OpenStackServiceCatalog
+from libcloud.utils.iso8601 import parse_date
+
+from gonzo.clouds.profiling import profiler
+from gonzo.clouds.throttle import is_throttled
+from gonzo.config import CACHE_DIR
+
+
+logger = logging.getLogger(__name__)
+
+AUTH_CACHE_DIR = os.path.join(CACHE_DIR, 'auth')
+
+# seconds an idle HTTP connection is kept for reuse; below the idle timeout
+# of the cloud APIs' load balancers, so that they don't close it under us
+KEEP_ALIVE_IDLE = 30
+
+
+class _PerThread(object):
+    """ Data descriptor keeping a separate value of an attribute for each
+        thread, starting from `default()` """
+
+    def __init__(self, name, default):
+        self.name = name
+        self.default = default
+
+    def _local(self, obj):
+        return obj.__dict__.setdefault(
+            '_gonzo_thread_local', threading.local())
+
+    def __get__(self, obj, cls=None):
+        if obj is None:
+            return self
+        local = self._local(obj)
+        try:
+            return getattr(local, self.name)
+        except AttributeError:
+            value = self.default()
+            setattr(local, self.name, value)
+            return value
+
+    def __set__(self, obj, value):
+        setattr(self._local(obj), self.name, value)
+
+
+def _keep_alive_connect(connect):
+    """ Wrap a libcloud `Connection.connect` to reuse this thread's open
+        HTTP connection to the same endpoint, if it was recently used """
+
+    def keep_alive_connect(self, host=None, port=None, base_url=None):
+        endpoint = (host or self.host, port or self.port, self.secure,
+                    base_url or getattr(self, 'base_url', None))
+        now = time.time()
+        connection, last_used = self.kept_alive.get(endpoint, (None, None))
+        if connection is None or now - last_used > KEEP_ALIVE_IDLE:
+            if connection is not None:
+                connection.close()
+            connect(self, host=host, port=port, base_url=base_url)
+            connection = self.connection
+        self.connection = connection
+        self.kept_alive[endpoint] = (connection, now)
+
+    return keep_alive_connect
+
+
+def _throttled_request(request):
+    """ Wrap a libcloud `Connection.request` to go through the connection's
+        throttle, if it has one """
+
+    def throttled_request(self, *args, **kwargs):
+        if self.throttle is None:
+            return request(self, *args, **kwargs)
+
+        def attempt():
+            self.last_status = None
+            return request(self, *args, **kwargs)
+
+        return self.throttle.call(
+            attempt, lambda error: is_throttled(error, self.last_status))
+
+    return throttled_request
+
+
+def _recording(response_cls):
+    """ Subclass of a libcloud Response class, recording the HTTP status of
+        each response on the connection (as errors don't include it), and
+        counting the bytes received """
+
+    class RecordingResponse(response_cls):
+        def success(self):
+            self.connection.last_status = self.status
+            self.connection.received_bytes += len(self.body or '')
+            return super(RecordingResponse, self).success()
+
+    return RecordingResponse
+
+
+_thread_safe_classes = {}
+
+
+def make_thread_safe(driver):
+    """ Make the connection of a libcloud `driver` safe to use from several
+        threads at once, keeping HTTP connections alive. Returns the driver
+    """
+    connection = driver.connection
+    connection_cls = type(connection)
+
+    if connection_cls in _thread_safe_classes.values():
+        return driver
+
+    if connection_cls not in _thread_safe_classes:
+        _thread_safe_classes[connection_cls] = type(
+            'ThreadSafe{}'.format(connection_cls.__name__),
+            (connection_cls,),
+            {
+                'connection': _PerThread('connection', lambda: None),
+                'context': _PerThread('context', dict),
+                'kept_alive': _PerThread('kept_alive', dict),
+                'connect': _keep_alive_connect(connection_cls.connect),
+                'throttle': None,
+                'last_status': _PerThread('last_status', lambda: None),
+                'request': _throttled_request(connection_cls.request),
+                'received_bytes': _PerThread('received_bytes', int),
+                'responseCls': _recording(connection_cls.responseCls),
+            })
+
+    connection.__class__ = _thread_safe_classes[connection_cls]
+    return driver
+
+
+def throttle_requests(driver, throttle):
+    """ Send all requests made by `driver` through `throttle`. Returns the
+        driver """
+    make_thread_safe(driver)
+    driver.connection.throttle = throttle
+    return driver
+
+
+def _auth_cache_path(auth, cache_dir):
+    identity = '{} {} {}'.format(
+        auth.auth_url, auth.user_id, auth.tenant_name)
+    return os.path.join(
+        cache_dir, '{}.json'.format(hashlib.sha1(identity).hexdigest()))
+
+
+def _load_auth(auth, path):
+    try:
+        with open(path) as auth_file:
+            saved = json.load(auth_file)
+        auth.auth_token = saved['auth_token']
+        auth.auth_token_expires = parse_date(saved['expires'])
+        auth.auth_user_info = saved['user_info']
+        auth.urls = saved['urls']
+    except IOError:
+        return False
+    except Exception as ex:  # corrupt or incompatible file
+        logger.debug("Ignoring unreadable auth token `%s`: %s", path, ex)
+        return False
+    return auth.is_token_valid()
+
+
+def _save_auth(auth, path):
+    saved = {
+        'auth_token': auth.auth_token,
+        'expires': auth.auth_token_expires.isoformat(),
+        'user_info': auth.auth_user_info,
+        'urls': auth.urls,
+    }
+    directory = os.path.dirname(path)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    # the token is a credential, so only readable by the user
+    temp_path = '{}.{}.tmp'.format(path, os.getpid())
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600)
+    with os.fdopen(fd, 'w') as auth_file:
+        json.dump(saved, auth_file)
+    os.rename(temp_path, path)
+
+
+def reuse_openstack_auth(driver, cache_dir=AUTH_CACHE_DIR):
+    """ Start an OpenStack `driver` from the auth token saved under
+        `cache_dir` while it is valid, and save any new token it gets.
+        Returns the driver """
+    connection = driver.connection
+    auth = connection.get_auth_class()
+    path = _auth_cache_path(auth, cache_dir)
+
+    if _load_auth(auth, path):
+        connection.auth_token = auth.auth_token
+        connection.auth_token_expires = auth.auth_token_expires
+        connection.auth_user_info = auth.auth_user_info
+        connection.service_catalog = OpenStackServiceCatalog(
+            service_catalog=auth.urls,
+            auth_version=connection._auth_version)
+
+    authenticate = auth.authenticate
+
+    def authenticate_and_save(*args, **kwargs):
+        with profiler.timed('compute.authenticate'):
+            result = authenticate(*args, **kwargs)
+        try:
+            _save_auth(auth, path)
+        except (IOError, OSError) as ex:
+            logger.debug("Unable to save auth token: %s", ex)
+        return result
+
+    auth.authenticate = authenticate_and_save
+    return driver
@@ -0,0 +1,152 @@
+""" Client side rate limiting of cloud API requests
+
+Each API family (compute requests to one region, or DNS requests) gets a
+Throttle, shared by every thread using it: a token bucket limiting the rate
+requests are sent at, and retries (with decorrelated jitter backoff) of
+requests the cloud rejected for being over its rate limit.
+"""
+
+import logging
+import random
+from threading import Lock
+import time
+
+
+logger = logging.getLogger(__name__)
+
+# requests per second, per API family. Route53 allows 5 per account; EC2
+# limits vary by call, but a sustained 20 stays well clear of them
+DEFAULT_RATE_LIMITS = {
+    'compute': 20,
+    'dns': 5,
+}
+
+# HTTP statuses and error codes used by the clouds to reject requests for
+# exceeding their rate limits
+THROTTLED_STATUSES = (413, 429)
+THROTTLED_CODES = (
+    'RequestLimitExceeded',  # EC2
+    'Throttling',  # Route53
+    'PriorRequestNotComplete',  # Route53
+)
+
+
+def is_throttled(error, status=None):
+    """ Whether `error`, raised by a request that got an HTTP `status`
+        response, means the request was rejected as over the rate limit """
+    if status in THROTTLED_STATUSES:
+        return True
+    message = str(error)
+    return any(code in message for code in THROTTLED_CODES)
+
+
+class TokenBucket(object):
+    """ Allows `rate` acquisitions per second on average, in bursts of up to
+        `burst` """
+
+    def __init__(self, rate, burst=None, sleep=None, clock=None):
+        self.rate = float(rate)
+        self.burst = burst or max(1, rate)
+        self.sleep = sleep or time.sleep
+        self.clock = clock or time.time
+
+        self._tokens = self.burst
+        self._updated = self.clock()
+        self._lock = Lock()
+
+    def acquire(self):
+        """ Take a token, waiting until one is available """
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # tokens may go negative, queueing callers behind each other
+            self._tokens -= 1
+            wait = -self._tokens / self.rate
+
+        if wait > 0:
+            self.sleep(wait)
+
+
+class Throttle(object):
+    """ Rate limit and retry policy for one API family """
+
+    def __init__(self, name, rate=None, max_retries=6, base_delay=0.5,
+                 max_delay=30, sleep=None, clock=None):
+        self.name = name
+        self.bucket = None
+        if rate:
+            self.bucket = TokenBucket(rate, sleep=sleep, clock=clock)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep or time.sleep
+
+        self.requests = 0
+        self.throttled = 0
+        self._lock = Lock()
+
+    def _count(self, throttled=False):
+        with self._lock:
+            self.requests += 1
+            if throttled:
+                self.throttled += 1
+
+    def call(self, request, is_throttled):
+        """ Call `request()` within the rate limit, retrying it while
+            `is_throttled(error)` is true of the exception it raises """
+        delay = self.base_delay
+        attempt = 0
+        while True:
+            if self.bucket is not None:
+                self.bucket.acquire()
+            try:
+                result = request()
+            except Exception as ex:
+                if not is_throttled(ex):
+                    self._count()
+                    raise
+                self._count(throttled=True)
+                if attempt >= self.max_retries:
+                    raise
+            else:
+                self._count()
+                return result
+
+            attempt += 1
+            # "decorrelated jitter", spreading out retries from many threads
+            delay = min(self.max_delay,
+                        random.uniform(self.base_delay, delay * 3))
+            logger.debug("%s request throttled, retrying in %.1fs",
+                         self.name, delay)
+            self.sleep(delay)
+
+
+_throttles = {}
+_throttles_lock = Lock()
+
+
+def get_throttle(family, scope, rate_limits=None):
+    """ The Throttle shared by requests of API `family` (e.g. compute) to
+        `scope` (e.g. a cloud region), limited to the rate given for the
+        family in `rate_limits` or DEFAULT_RATE_LIMITS """
+    name = '{} {}'.format(family, scope)
+    with _throttles_lock:
+        if name not in _throttles:
+            limits = dict(DEFAULT_RATE_LIMITS)
+            limits.update(rate_limits or {})
+            _throttles[name] = Throttle(name, rate=limits.get(family))
+        return _throttles[name]
+
+
+def throttle_report():
+    """ (name, requests, throttled) for each API family that was throttled
+    """
+    with _throttles_lock:
+        throttles = sorted(_throttles.items())
+    return [
+        (name, throttle.requests, throttle.throttled)
+        for name, throttle in throttles
+        if throttle.throttled
+    ]
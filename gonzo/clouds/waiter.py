@@ -0,0 +1,98 @@
+""" Waiting on many cloud resources at once
+
+A Waiter polls every resource it is still waiting on with a single batched
+describe call per tick, backing off exponentially (with jitter) between
+ticks, and gives up on whatever is left at an overall deadline.
+"""
+
+import logging
+import random
+import time
+
+from gonzo.clouds.profiling import profiler
+from gonzo.exceptions import UnhealthyResourceError, WaitTimeoutError
+
+
+logger = logging.getLogger(__name__)
+
+
+class Waiter(object):
+    """ Wait for resources to reach a target state
+
+    `describe(ids)` returns the current state of (at least) the resources
+    with the given ids, in one call to the cloud. `is_ready(resource)`
+    says whether a resource has reached the target state, raising
+    UnhealthyResourceError if it never will.
+    """
+
+    def __init__(self, describe, is_ready, initial_delay=1, max_delay=20,
+                 backoff=1.5, timeout=600, sleep=None, clock=None):
+        self.describe = describe
+        self.is_ready = is_ready
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.backoff = backoff
+        self.timeout = timeout
+        self.sleep = sleep or time.sleep
+        self.clock = clock or time.time
+
+    def _delays(self):
+        delay = self.initial_delay
+        while True:
+            # "equal jitter", so that concurrent waiters spread out without
+            # ever polling much faster than intended
+            yield delay / 2.0 + random.uniform(0, delay / 2.0)
+            delay = min(self.max_delay, delay * self.backoff)
+
+    def wait(self, resources, on_ready=None, on_failed=None):
+        """ wait(resources) -> (ready, failed)
+
+        Returns two dicts keyed on resource id: refreshed resources that
+        reached the target state, and errors for those that failed or were
+        still pending at the deadline. `on_ready(resource)` and
+        `on_failed(resource_id, error)` are called as soon as each outcome
+        is known.
+        """
+        with profiler.timed('wait'):
+            return self._wait(resources, on_ready, on_failed)
+
+    def _wait(self, resources, on_ready, on_failed):
+        ready = {}
+        failed = {}
+        pending = set(resource.id for resource in resources)
+        deadline = self.clock() + self.timeout
+        delays = self._delays()
+
+        def fail(resource_id, error):
+            pending.discard(resource_id)
+            failed[resource_id] = error
+            if on_failed is not None:
+                on_failed(resource_id, error)
+
+        while pending:
+            delay = next(delays)
+            if self.clock() + delay > deadline:
+                for resource_id in sorted(pending):
+                    fail(resource_id, WaitTimeoutError(
+                        "Timed out waiting for {}".format(resource_id)))
+                break
+
+            self.sleep(delay)
+            for resource in self.describe(sorted(pending)):
+                if resource.id not in pending:
+                    continue
+                try:
+                    if not self.is_ready(resource):
+                        continue
+                except UnhealthyResourceError as ex:
+                    fail(resource.id, ex)
+                    continue
+
+                pending.discard(resource.id)
+                ready[resource.id] = resource
+                if on_ready is not None:
+                    on_ready(resource)
+
+            logger.debug("Still waiting for %d resource(s)", len(pending))
+
+        return ready, failed
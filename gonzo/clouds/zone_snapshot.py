@@ -0,0 +1,134 @@
+""" Local copies of DNS zones, answering record lookups without API calls
+
+A ZoneSnapshot holds every record of a zone, saved as a compact JSON file
+under ``~/.gonzo/cache/dns``. Changes gonzo makes are applied to it as
+they're submitted, and its `marker` (the number of record sets the zone
+should have) tells whether anyone else has added or removed records since,
+without listing the zone again.
+"""
+
+import json
+import logging
+import os
+
+from libcloud.dns.base import Record, Zone
+
+from gonzo.config import CACHE_DIR
+
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = os.path.join(CACHE_DIR, 'dns')
+
+
+def _public_extra(extra):
+    # libcloud keeps references to other records under private keys
+    return dict(
+        (key, value) for key, value in (extra or {}).items()
+        if not key.startswith('_'))
+
+
+class ZoneSnapshot(object):
+    """ The records of a zone as of `synced_at`, when it was last checked
+        for changes, or `full_synced_at`, when it was last listed.
+
+        `marker` is the zone's ResourceRecordSetCount when it was listed,
+        adjusted for the changes applied to the snapshot since.
+    """
+
+    def __init__(self, zone_id, domain, records, marker, synced_at,
+                 full_synced_at=None):
+        self.zone_id = zone_id
+        self.domain = domain
+        # {name: {type: [[value, extra], ...]}}, names in lower case
+        self.records = records
+        self.marker = marker
+        self.synced_at = synced_at
+        if full_synced_at is None:
+            full_synced_at = synced_at
+        self.full_synced_at = full_synced_at
+
+    @classmethod
+    def from_records(cls, zone, records, synced_at):
+        """ Snapshot of `zone` (as fetched, with its record set count) from
+            the libcloud `records` listed from it """
+        snapshot = cls(zone.id, zone.domain, {}, 0, synced_at)
+        for record in records:
+            snapshot._add(record.name, record.type, record.data, record.extra)
+        snapshot.marker = zone.extra['ResourceRecordSetCount']
+        return snapshot
+
+    @classmethod
+    def load(cls, path):
+        """ The snapshot saved at `path`, or None if there isn't one """
+        try:
+            with open(path) as snapshot_file:
+                return cls(**json.load(snapshot_file))
+        except IOError:
+            return None
+        except Exception as ex:  # corrupt or incompatible file
+            logger.debug("Ignoring unreadable zone snapshot `%s`: %s",
+                         path, ex)
+            return None
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        temp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temp_path, 'w') as snapshot_file:
+            json.dump({
+                'zone_id': self.zone_id,
+                'domain': self.domain,
+                'records': self.records,
+                'marker': self.marker,
+                'synced_at': self.synced_at,
+                'full_synced_at': self.full_synced_at,
+            }, snapshot_file, separators=(',', ':'))
+        os.rename(temp_path, path)
+
+    def _add(self, name, record_type, data, extra):
+        types = self.records.setdefault(name.lower(), {})
+        if record_type not in types:
+            types[record_type] = []
+            self.marker += 1
+        types[record_type].append([data, _public_extra(extra)])
+
+    def _remove(self, name, record_type):
+        types = self.records.get(name.lower(), {})
+        if record_type in types:
+            del types[record_type]
+            self.marker -= 1
+            if not types:
+                del self.records[name.lower()]
+
+    def apply(self, changes):
+        """ Apply (action, name, type, data, extra) `changes`, as submitted
+            to the zone. Each change replaces (or deletes) the whole record
+            set of its name and type, whatever values the snapshot had for
+            it, as the change could only succeed if those were out of date
+        """
+        for action, name, record_type, data, extra in changes:
+            self._remove(name, record_type)
+            if action != 'DELETE':
+                self._add(name, record_type, data,
+                          {'ttl': int(extra.get('ttl', 0))})
+
+    def zone(self, driver=None):
+        return Zone(self.zone_id, self.domain, 'master', None, driver)
+
+    def get_record(self, name, record_type=None, driver=None):
+        """ The libcloud Record (of `record_type`, if given) named `name`,
+            or None if there's no such record """
+        types = self.records.get(name.lower(), {})
+        if record_type is None and types:
+            record_type = sorted(types)[0]
+        if not types.get(record_type):
+            return None
+
+        data, extra = types[record_type][0]
+        return Record(
+            id='{}:{}'.format(record_type, name), name=name,
+            type=record_type, data=data, zone=self.zone(driver),
+            driver=driver, extra=dict(extra))
@@ -8,6 +8,7 @@ from gonzo.exceptions import ConfigurationError
 PROJECT_ROOT = '/srv'
 GONZO_HOME = os.path.join(os.path.expanduser("~"), '.gonzo/')
 STATE_FILE = os.path.join(GONZO_HOME, '.state')
+CACHE_DIR = os.path.join(GONZO_HOME, 'cache')
 
 
 def get_config_module(gonzo_home=GONZO_HOME):
@@ -124,6 +125,10 @@ class ConfigProxy(object):
         except KeyError:
             raise ConfigurationError('Invalid cloud: {}'.format(cloud))
 
+    @property
+    def CLOUD_NAME(self):
+        return global_state['cloud']
+
     @property
     def REGION(self):
         return global_state['region']
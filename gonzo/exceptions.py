@@ -16,3 +16,26 @@ class MultipleResourcesError(Exception):
 
 class UnhealthyResourceError(Exception):
     pass
+
+
+class WaitTimeoutError(Exception):
+    pass
+
+
+class ConcurrentTaskError(Exception):
+    """ One or more of a set of concurrently run tasks failed. `errors` maps
+        each failed task to the exception it raised """
+
+    def __init__(self, errors):
+        flattened = {}
+        for key, error in errors.items():
+            if isinstance(error, ConcurrentTaskError):
+                flattened.update(error.errors)
+            else:
+                flattened[key] = error
+        self.errors = flattened
+
+        message = '; '.join(
+            '{}: {}'.format(key, error)
+            for key, error in sorted(flattened.items()))
+        super(ConcurrentTaskError, self).__init__(message)
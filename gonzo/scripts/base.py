@@ -1,13 +1,19 @@
 import argparse
+import json
 import logging
+import sys
+import time
 
 import argcomplete
 
 import gonzo
+from gonzo.clouds.profiling import profiler
+from gonzo.clouds.throttle import throttle_report
 from gonzo.exceptions import ConfigurationError
 from gonzo.scripts import config
 from gonzo.scripts import launch as launch
 from gonzo.scripts import list_
+from gonzo.scripts.utils import print_table
 
 
 def get_parser():
@@ -17,9 +23,18 @@ def get_parser():
         version='%(prog)s {}'.format(gonzo.VERSION))
     parser.add_argument(
         '--cloud', default=None, help="specify cloud")
+    parser.add_argument(
+        '--no-cache', dest='use_cache', action='store_false', default=True,
+        help="ignore cached cloud listings and query the cloud directly")
     parser.add_argument(
         '--log-level', action='store', help="Log level",
         default=logging.WARN)
+    parser.add_argument(
+        '--profile', action='store_true', default=False,
+        help="print the count and latency of each cloud API operation")
+    parser.add_argument(
+        '--profile-json', metavar='FILE', default=None,
+        help="write the --profile data to FILE as JSON")
 
     subparsers = parser.add_subparsers(help='subcommand help')
 
@@ -44,10 +59,56 @@ def main():
 
     logging.basicConfig(level=args.log_level)
 
+    if args.profile or args.profile_json:
+        profiler.enable()
+    started = time.time()
+
     try:
         args.main(args)
     except ConfigurationError as ex:
         print "Configuration error: {}".format(ex)
+    finally:
+        print_throttle_report()
+        if args.profile:
+            print_profile()
+        if args.profile_json:
+            write_profile(args.profile_json, time.time() - started)
+
+
+profile_headers = ["operation", "count", "p50 ms", "p95 ms", "total s", "KB"]
+
+
+def profile_row(row, use_color='auto'):
+    return [
+        row['operation'],
+        row['count'],
+        '{:.0f}'.format(row['p50'] * 1000),
+        '{:.0f}'.format(row['p95'] * 1000),
+        '{:.2f}'.format(row['total']),
+        '{:.1f}'.format(row['bytes'] / 1024.0),
+    ]
+
+
+def print_profile():
+    print >> sys.stderr, "Cloud API calls, slowest in total first:"
+    print_table(profile_row, profile_headers, profiler.summary(),
+                sortby=None, stream=sys.stderr)
+
+
+def write_profile(path, wall_time):
+    with open(path, 'w') as profile_file:
+        json.dump({
+            'command': sys.argv[1:],
+            'wall_time': wall_time,
+            'operations': profiler.summary(),
+        }, profile_file, indent=2)
+
+
+def print_throttle_report():
+    for name, requests, throttled in throttle_report():
+        print >> sys.stderr, (
+            "{}: {} of {} request(s) throttled by the cloud and retried"
+            .format(name, throttled, requests))
 
 if __name__ == '__main__':
     main()
@@ -6,59 +6,46 @@ from functools import partial
 import logging
 import os
 import sys
-from time import sleep
+from threading import Lock
+from time import time
+
+from libcloud.common.types import LibcloudError
 
 from gonzo.helpers.document_loader import get_parsed_document
 from gonzo.clouds import get_current_cloud
 from gonzo.clouds.dns import DNS
 from gonzo.config import config_proxy
-from gonzo.exceptions import DataError
+from gonzo.exceptions import ConcurrentTaskError, DataError
 from gonzo.scripts.utils import colorize
-from gonzo.utils import abort, csv_dict, csv_list
+from gonzo.utils import (abort, csv_dict, csv_list, positive_int,
+                         run_concurrently, DEFAULT_WORKERS)
 
 
 logger = logging.getLogger(__name__)
 
 
-def wait_for_instance_boot(instance, use_color='auto'):
-    colorize_ = partial(colorize, use_color=use_color)
-    stdout = sys.stdout
-
-    print colorize_('Created instance', 'yellow'), instance.id
-    n = 0
-    sleep(1)
-    while not instance.is_running():
-        stdout.write("\r{}... {}s".format(instance.update(), n))
-        stdout.flush()
-        n += 1
-        sleep(1)
-    stdout.write("\r{} after {}s\n".format(instance.update(), n))
-    stdout.flush()
+def get_user_data(hostname, cloud_config, args):
+    if args.user_data_params is None:
+        user_data_params = cloud_config.get('USER_DATA_PARAMS')
+    else:
+        user_data_params = args.user_data_params
 
+    user_data_uri = args.user_data_uri
+    if not user_data_uri:
+        user_data_uri = cloud_config.get('DEFAULT_USER_DATA')
+    if user_data_uri is None:
+        return {}
 
-def launch(args):
-    """ Launch instances """
-    cloud_config = config_proxy.get_cloud(args.cloud)
-    cloud = get_current_cloud(args.cloud)
+    return get_parsed_document(
+        hostname, user_data_uri,
+        'USER_DATA_PARAMS', user_data_params
+    )
 
-    # Instantiate DNS
-    dns = DNS(cloud_config['AWS_ACCESS_KEY_ID'],
-              cloud_config['AWS_SECRET_ACCESS_KEY'])
 
+def get_launch_options(args, cloud_config):
     # Server Type
     server_type = ("-").join(args.env_type.split("-")[-2:])
 
-    # Instance Full Name
-    zone_name = cloud_config['DNS_ZONE']
-
-    full_instance_name = dns.get_next_host(
-        args.env_type,
-        zone_name
-    )
-
-    # Owner
-    username = os.environ.get('USER')
-
     # Instance Size
     if args.size is None:
         sizes = config_proxy.SIZES
@@ -79,32 +66,72 @@ def launch(args):
     else:
         image_id = args.image_id
 
-    # User Data
-    if args.user_data_params is None:
-        user_data_params = cloud_config.get('USER_DATA_PARAMS')
-    else:
-        user_data_params = args.user_data_params
+    return {
+        'size': size,
+        'security_groups': security_groups,
+        'image_name': image_id,
+        'key_name': cloud_config.get('PUBLIC_KEY_NAME'),
+    }
+
+
+def get_dns_aliases(args):
+    """ Names to point at the instance, from its `--dns-tag` tag """
+    extra_tags = args.extra_tags or {}
+    if args.dns_tag not in extra_tags:
+        return []
+    return csv_list(extra_tags[args.dns_tag])
+
+
+def add_dns_records(batch, instance, cloud_config):
+    """ Add the hostname of a new `instance` to the DNS ChangeBatch `batch` """
+    batch.create(instance.name,
+                 cloud_config['DNS_TYPE'],
+                 instance.gonzo_network_address)
+
+
+def add_dns_aliases(dns, batch, instance, aliases, cloud_config):
+    """ Add a CNAME to `instance` for each of `aliases` to the DNS ChangeBatch
+        `batch`, repointing those that already exist (e.g. at the instance
+        this one replaces) """
+    fqdn = '{}.{}'.format(instance.name, cloud_config['DNS_ZONE'])
+    for alias in aliases:
+        record = dns.get_dns_record(
+            alias, cloud_config['DNS_ZONE'], 'CNAME', live=True)
+        if record is None:
+            batch.create(alias, 'CNAME', fqdn)
+        elif record.data.rstrip('.') != fqdn:
+            batch.update(record, fqdn)
 
-    if not args.user_data_uri:
-        user_data_uri = cloud_config.get('DEFAULT_USER_DATA')
-        if user_data_uri is None:
-            user_data = {}
-        else:
-            user_data = get_parsed_document(
-                full_instance_name, user_data_uri,
-                'USER_DATA_PARAMS', user_data_params
-            )
+
+def launch(args):
+    """ Launch instances """
+    cloud_config = config_proxy.get_cloud(args.cloud)
+    cloud = get_current_cloud(args.cloud, use_cache=args.use_cache)
+
+    # Instantiate DNS
+    dns = DNS.from_config(cloud_config, use_cache=args.use_cache)
+
+    if args.count > 1:
+        return launch_fleet(args, cloud, dns, cloud_config)
+
+    # Instance Full Name
+    zone_name = cloud_config['DNS_ZONE']
+
+    full_instance_name = dns.get_next_host(
+        args.env_type,
+        zone_name
+    )
+
+    # Owner
+    username = os.environ.get('USER')
 
     # Launch Instance
     instance = cloud.create_instance(
         name=full_instance_name,
-        size=size,
-        user_data=user_data,
-        image_name=image_id,
-        security_groups=security_groups,
+        user_data=get_user_data(full_instance_name, cloud_config, args),
         owner=username,
-        key_name=cloud_config.get('PUBLIC_KEY_NAME'),
-        volume_size=args.volume_size
+        volume_size=args.volume_size,
+        **get_launch_options(args, cloud_config)
     )
 
     print "Instance created: {}.{}".format(
@@ -112,17 +139,117 @@ def launch(args):
         cloud_config['DNS_ZONE']
     )
 
-    dns.create_dns_record(instance.name,
-                          instance.extra['gonzo_network_address'],
-                          cloud_config['DNS_TYPE'],
-                          cloud_config['DNS_ZONE'])
+    # the hostname goes in on its own, so a bad alias can't keep it out
+    dns_changes = dns.change_batch(zone_name)
+    add_dns_records(dns_changes, instance, cloud_config)
+    change_ids = dns.apply_changes(dns_changes, wait=False)
+
+    alias_changes = dns.change_batch(zone_name)
+    add_dns_aliases(dns, alias_changes, instance, get_dns_aliases(args),
+                    cloud_config)
+    change_ids.extend(dns.apply_changes(alias_changes, wait=False))
+    if change_ids:
+        dns.wait_for_changes(change_ids)
+
+
+def launch_fleet(args, cloud, dns, cloud_config, max_workers=DEFAULT_WORKERS):
+    """ Launch `args.count` instances of the same type at once """
+    colorize_ = partial(colorize, use_color=args.color)
+    output_lock = Lock()
+
+    def report(name, message, colour=None):
+        if colour is not None:
+            message = colorize_(message, colour)
+        with output_lock:
+            sys.stdout.write("{}: {}\n".format(name, message))
+            sys.stdout.flush()
+
+    if get_dns_aliases(args):
+        raise DataError(
+            "DNS aliases (--dns-tag) can only point at a single instance")
+
+    started = time()
+    zone_name = cloud_config['DNS_ZONE']
+    username = os.environ.get('USER')
+
+    names = dns.reserve_hosts(args.env_type, zone_name, args.count)
+    environment, server_type = cloud.parse_instance_name(names[0])
+
+    options = get_launch_options(args, cloud_config)
+    image_name = options.pop('image_name')
+    resources = cloud.resolve_launch_resources(image_name, **options)
+    azs = cloud.get_next_azs(environment, server_type, len(names))
+
+    def launch_one(name, az):
+        user_data = get_user_data(name, cloud_config, args)
+        instance = cloud.launch_instance(
+            name, username, resources, az, user_data=user_data)
+        report(name, "created in {}".format(az.name), 'yellow')
+        return instance
+
+    launched, errors = run_concurrently(
+        dict(
+            (name, partial(launch_one, name, az))
+            for name, az in zip(names, azs)
+        ),
+        max_workers=max_workers,
+    )
+    for name, error in sorted(errors.items()):
+        report(name, "failed: {}".format(error), 'red')
+
+    pending = [launched[name] for name in names if name in launched]
+    print "Waiting for {} instance(s) to start...".format(len(pending))
+    names_by_id = dict((instance.id, instance.name) for instance in pending)
+    running, failed = cloud.wait_for_instances(
+        pending,
+        on_running=lambda instance: report(
+            instance.name, "started after {:.0f}s".format(time() - started)),
+        on_failed=lambda instance_id, error: report(
+            names_by_id[instance_id], "failed: {}".format(error), 'red'),
+    )
+    instances = [
+        running[instance.id] for instance in pending
+        if instance.id in running
+    ]
+
+    def finish_one(instance):
+        if args.volume_size is not None:
+            cloud.create_and_attach_volume(instance, args.volume_size)
+        return instance
+
+    finished, finish_errors = run_concurrently(
+        dict(
+            (instance.name, partial(finish_one, instance))
+            for instance in instances
+        ),
+        max_workers=max_workers,
+    )
+    for name, error in sorted(finish_errors.items()):
+        report(name, "failed: {}".format(error), 'red')
+
+    # hostnames for the whole fleet, in as few changes as possible
+    dns_changes = dns.change_batch(zone_name)
+    for instance in instances:
+        if instance.name in finished:
+            add_dns_records(dns_changes, instance, cloud_config)
+    dns.apply_changes(dns_changes)
+    for instance in instances:
+        if instance.name in finished:
+            report(instance.name, "running as {}.{}".format(
+                instance.name, zone_name), 'green')
+
+    print "Launched {} of {} instance(s) in {:.1f}s".format(
+        len(finished), len(names), time() - started)
+    return [instance for instance in instances if instance.name in finished]
 
 
 def main(args):
     try:
         launch(args)
-    except DataError as ex:
+    except (ConcurrentTaskError, DataError) as ex:
         abort(ex.message)
+    except LibcloudError as ex:
+        abort("DNS changes failed: {}".format(ex.value))
 
 
 env_type_pair_help = """
@@ -153,6 +280,9 @@ records are suffixed with the current cloud's DNS_ZONE config.
 def init_parser(parser):
     parser.add_argument(
         '--volume-size', dest="volume_size")
+    parser.add_argument(
+        '--count', dest='count', type=positive_int, default=1,
+        help="Number of instances to launch (default: 1)")
     parser.add_argument(
         'env_type', metavar='environment-server_type', help=env_type_pair_help)
     parser.add_argument(
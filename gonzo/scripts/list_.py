@@ -3,11 +3,14 @@
 """
 
 from functools import partial
+import sys
 
 from libcloud.compute.types import NodeState
 
-from gonzo.scripts.utils import colorize, print_table, format_uptime
-from gonzo.clouds import get_current_cloud
+from gonzo.scripts.utils import (colorize, format_uptime, print_table,
+                                 print_streaming_table)
+from gonzo.clouds import (get_all_cloud_regions, get_cloud_regions,
+                          get_current_cloud, list_instances_across)
 
 
 headers = [
@@ -26,7 +29,7 @@ def print_instance_summary(instance, use_color='auto'):
     colorize_ = partial(colorize, use_color=use_color)
 
     name = colorize_(instance.name, "yellow")
-    instance_type = instance.extra['gonzo_size']
+    instance_type = instance.gonzo_size
 
     if instance.state == NodeState.RUNNING:
         status_colour = "green"
@@ -36,15 +39,15 @@ def print_instance_summary(instance, use_color='auto'):
     instance_status = NodeState.tostring(instance.state)
     status = colorize_(instance_status, status_colour)
 
-    if 'owner' in instance.extra['gonzo_tags']:
-        owner = instance.extra['gonzo_tags']['owner']
+    if 'owner' in instance.gonzo_tags:
+        owner = instance.gonzo_tags['owner']
     else:
         owner = "---"
 
-    uptime = format_uptime(instance.extra['gonzo_created_time'])
+    uptime = format_uptime(instance.gonzo_created_time)
     uptime = colorize_(uptime, "blue")
 
-    availability_zone = instance.extra['gonzo_az']
+    availability_zone = instance.gonzo_az
 
     result_list = [
         name,
@@ -57,18 +60,82 @@ def print_instance_summary(instance, use_color='auto'):
     return result_list
 
 
+def print_located_instance_summary(located_instance, use_color='auto',
+                                   show_cloud=False):
+    """ Summary info line for a ((cloud name, region), instance) pair,
+        followed by where the instance is """
+    (cloud_name, region), instance = located_instance
+    location = [region]
+    if show_cloud:
+        location.insert(0, cloud_name)
+    return print_instance_summary(instance, use_color) + location
+
+
+def sorted_instances(instances, order, key=lambda instance: instance):
+    """ `instances` sorted by name, or youngest first by age """
+    if order == 'age':
+        def sort_key(item):
+            created_time = key(item).gonzo_created_time
+            return (created_time is None, created_time)
+        return sorted(instances, key=sort_key, reverse=True)
+    return sorted(instances, key=lambda item: key(item).name)
+
+
+def list_across(args, cloud_regions, show_cloud=False):
+    """ Print summary info for instances in all of the (cloud name, region)
+        `cloud_regions`, as a single table """
+
+    instances_by_cloud, errors = list_instances_across(
+        cloud_regions, use_cache=args.use_cache, timeout=args.timeout)
+
+    for (cloud_name, region), error in sorted(errors.items()):
+        location = region
+        if show_cloud:
+            location = '{}/{}'.format(cloud_name, region)
+        print >> sys.stderr, "Unable to list {}: {}".format(location, error)
+
+    located_instances = [
+        (cloud_region, instance)
+        for cloud_region, instances in instances_by_cloud.items()
+        for instance in instances
+    ]
+    located_instances = sorted_instances(
+        located_instances, args.order, key=lambda located: located[1])
+
+    location_headers = ['region']
+    if show_cloud:
+        location_headers.insert(0, 'cloud')
+    print_table(
+        partial(print_located_instance_summary, show_cloud=show_cloud),
+        headers + location_headers, located_instances,
+        use_color=args.color, sortby=None)
+    return located_instances
+
+
 def list_(args):
     """ Print summary info for all running instances, or all instances
         in any state (e.g. terminated) if args.only_running == True
 
     """
 
+    if args.all_clouds:
+        return list_across(args, get_all_cloud_regions(), show_cloud=True)
+
+    if args.all_regions:
+        return list_across(args, get_cloud_regions(args.cloud))
+
     # Get Config.py
-    cloud = get_current_cloud(args.cloud)
+    cloud = get_current_cloud(args.cloud, use_cache=args.use_cache)
 
-    instances = cloud.list_instances()
+    if args.stream:
+        # rows are printed page by page as the cloud returns them
+        print_streaming_table(print_instance_summary, headers,
+                              cloud.iter_instances(), use_color=args.color)
+        return None
+
+    instances = sorted_instances(cloud.list_instances(), args.order)
     print_table(print_instance_summary, headers, instances,
-                use_color=args.color)
+                use_color=args.color, sortby=None)
     return instances
 
 
@@ -83,6 +150,20 @@ def init_parser(parser):
     parser.add_argument(
         '--all', dest='only_running', action='store_false', default=True,
         help='include terminating instances')
+    parser.add_argument(
+        '--stream', dest='stream', action='store_true', default=False,
+        help='print instances as they are listed, unsorted, rather than '
+             'once the whole listing has arrived')
+    parser.add_argument(
+        '--all-regions', dest='all_regions', action='store_true',
+        default=False, help="list instances in all of the cloud's regions")
+    parser.add_argument(
+        '--all-clouds', dest='all_clouds', action='store_true',
+        default=False, help='list instances in every region of every cloud')
+    parser.add_argument(
+        '--timeout', dest='timeout', type=int, default=60,
+        help='seconds to wait for each region with --all-regions or '
+             '--all-clouds (default: 60)')
     parser.add_argument(
         '--color', dest='color', nargs='?', default='auto',
         choices=['never', 'auto', 'always'],
@@ -1,8 +1,14 @@
+from itertools import islice
+import re
 import sys
 from datetime import datetime
 from prettytable import PrettyTable
 
 
+ANSI_ESCAPE = re.compile(r'\x1b\[[0-9;]*m')
+ENCODING = 'UTF-8'
+
+
 def colorize(msg, colour, use_color='auto'):
     colour_map = {
         'red': '\x1b[31m',
@@ -25,13 +31,13 @@ def colorize(msg, colour, use_color='auto'):
 
 
 def print_table(row_definer, headers, objects, show_header=True,
-                use_color='auto'):
+                use_color='auto', sortby="name", stream=None):
     tableoutput = PrettyTable(headers)
     for column in headers:
         tableoutput.align[column] = "l"
 
     tableoutput.header = show_header
-    tableoutput.sortby = "name"
+    tableoutput.sortby = sortby
     tableoutput.vertical_char = " "
     tableoutput.horizontal_char = " "
 
@@ -39,7 +45,56 @@ def print_table(row_definer, headers, objects, show_header=True,
     for object in objects:
         tableoutput.add_row(row_definer(object, use_color))
 
-    print tableoutput.get_string(print_empty=True)
+    print >> (stream or sys.stdout), tableoutput.get_string(print_empty=True)
+
+
+def _unicode(value):
+    """ `value` as unicode, decoding byte strings as PrettyTable does """
+    if not isinstance(value, basestring):
+        value = str(value)
+    if not isinstance(value, unicode):
+        value = unicode(value, ENCODING, 'strict')
+    return value
+
+
+def _visible_width(text):
+    return len(ANSI_ESCAPE.sub('', text))
+
+
+def print_streaming_table(row_definer, headers, objects, show_header=True,
+                          use_color='auto', stream=None, sample_size=100):
+    """ Print `objects` laid out as by print_table, but as they arrive
+        rather than once all of them have. Columns are sized to fit the
+        first `sample_size` rows; later rows may overflow them. """
+    stream = stream or sys.stdout
+    objects = iter(objects)
+    sample = [
+        [_unicode(cell) for cell in row_definer(object, use_color)]
+        for object in islice(objects, sample_size)
+    ]
+
+    widths = [len(header) for header in headers]
+    for row in sample:
+        widths = [
+            max(width, _visible_width(cell))
+            for width, cell in zip(widths, row)
+        ]
+
+    def print_row(row):
+        cells = [
+            cell + u' ' * (width - _visible_width(cell))
+            for width, cell in zip(widths, row)
+        ]
+        print >> stream, (u'  ' + u'   '.join(cells)).encode(ENCODING)
+
+    if show_header:
+        print_row([_unicode(header) for header in headers])
+    for row in sample:
+        print_row(row)
+    stream.flush()
+
+    for object in objects:
+        print_row([_unicode(cell) for cell in row_definer(object, use_color)])
 
 
 def format_uptime(start_time):
@@ -7,7 +7,7 @@ from gonzo.config import config_proxy as config
 
 
 def get_hostname_dns(inst):
-    return "{}.{}".format(inst.name, config.CLOUD['DNS_ZONE'])
+    return "{}.{}".format(inst.name, config.get_cloud()['DNS_ZONE'])
 
 
 @task
@@ -34,8 +34,10 @@ def group(*env_type_pairs):
         # env_type_pair is e.g. produiction-platform-app
         # we want production, and platform-app
         environment, server_type = env_type_pair.split("-", 1)
-        instances = cloud.list_instances_by_type(
-            environment=environment, server_type=server_type)
+        instances = sorted(
+            cloud.iter_instances(
+                environment=environment, server_type=server_type),
+            key=lambda inst: inst.name)
         env.hosts.extend([get_hostname_dns(inst) for inst in instances])
 
     print env.hosts
@@ -40,6 +40,10 @@ CLOUDS = {
         # domain to hold host information
         'DNS_ZONE': 'example.com',
         'DNS_TYPE': 'CNAME',
+        # DNS backend holding DNS_ZONE: 'route53' (the default, using the
+        # AWS keys above) or 'fake', an in-memory zone for testing and
+        # benchmarking offline
+        # 'DNS_BACKEND': 'route53',
 
         # Default cloud-init script to pass when creating new instances.
         # Can be overridden with --user-data.
@@ -48,6 +52,32 @@ CLOUDS = {
         'DEFAULT_USER_DATA': None,
         # Extra params to use when rendering user data template.
         'USER_DATA_PARAMS': {},
+
+        # Seconds for which instance listings are cached in ~/.gonzo/cache
+        # and shared between commands. 0 disables caching; it can also be
+        # bypassed for a single command with `gonzo --no-cache`.
+        'INVENTORY_CACHE_TTL': 60,
+        # Seconds between full listings of the instances, when set. Between
+        # them, a listing whose cache has expired is brought up to date by
+        # asking only for instances launched since or not running (EC2),
+        # or changed since (OpenStack), the last one. On EC2 it's limited
+        # to 3000, as terminated instances are only listed for about an
+        # hour.
+        # 'INVENTORY_FULL_SYNC_INTERVAL': 1800,
+        # Seconds for which sizes, images, key pairs, zones and security
+        # groups are cached, overriding the defaults for any listed here.
+        # 'CATALOG_CACHE_TTLS': {'security_groups': 600},
+        # Requests per second sent to the compute and DNS APIs (default 20
+        # and 5), shared by all of a command's threads. Requests the cloud
+        # throttles anyway are retried with backoff.
+        # 'API_RATE_LIMITS': {'compute': 20, 'dns': 5},
+        # Seconds for which DNS lookups (e.g. of hostname counts) are
+        # answered from a local snapshot of the zone, before checking
+        # whether its records have changed. Building the snapshot lists
+        # the whole zone (again every hour), so it only pays off for
+        # commands making many lookups (default 0: always ask Route53 for
+        # the record).
+        # 'DNS_SNAPSHOT_TTL': 300,
     },
 }
 
@@ -1,5 +1,18 @@
+from argparse import ArgumentTypeError
 import csv
+import logging
 import sys
+import time
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+
+from gonzo.exceptions import ConcurrentTaskError, WaitTimeoutError
+
+
+logger = logging.getLogger(__name__)
+
+# upper bound on threads used to talk to a cloud at once
+DEFAULT_WORKERS = 10
 
 
 def last_index(list_, value):
@@ -18,6 +31,11 @@ def last_index(list_, value):
     return found
 
 
+def chunks(list_, size):
+    """ Consecutive slices of `list_` of at most `size` items """
+    return [list_[start:start + size] for start in range(0, len(list_), size)]
+
+
 def abort(message=None):
     if message is not None:
         print >> sys.stderr, message
@@ -33,3 +51,78 @@ def csv_list(value):
 def csv_dict(value):
     for line in csv.reader([value], skipinitialspace=True):
         return dict(kv.split('=') for kv in line)
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise ArgumentTypeError("{} is not a positive number".format(value))
+    return number
+
+
+def run_concurrently(tasks, max_workers=DEFAULT_WORKERS, timeout=None):
+    """ run_concurrently(tasks) -> (results, errors)
+
+    Call each of the callables in the dict `tasks` from a bounded pool of
+    threads, waiting for all of them. Returns two dicts with the keys of
+    `tasks`: return values of the calls that succeeded, and exceptions
+    raised by those that failed.
+
+    Given a `timeout` (in seconds), tasks still running when it expires are
+    left behind and reported as failed with a WaitTimeoutError.
+    """
+
+    def call(key, task):
+        try:
+            return task()
+        except Exception:
+            logger.debug("Task %s failed", key, exc_info=True)
+            raise
+
+    results = {}
+    errors = {}
+    if not tasks:
+        return results, errors
+
+    deadline = None
+    if timeout is not None:
+        deadline = time.time() + timeout
+
+    pool = ThreadPool(min(max_workers, len(tasks)))
+    timed_out = False
+    try:
+        pending = [
+            (key, pool.apply_async(call, (key, task)))
+            for key, task in tasks.items()
+        ]
+        for key, async_result in pending:
+            remaining = None
+            if deadline is not None:
+                remaining = max(0, deadline - time.time())
+            try:
+                results[key] = async_result.get(remaining)
+            except TimeoutError:
+                timed_out = True
+                errors[key] = WaitTimeoutError(
+                    "Timed out after {}s".format(timeout))
+            except Exception as ex:
+                errors[key] = ex
+    finally:
+        pool.close()
+        # the worker threads are daemons, so stragglers don't hold up exit
+        if not timed_out:
+            pool.join()
+
+    return results, errors
+
+
+def gather(tasks, max_workers=DEFAULT_WORKERS):
+    """ gather(tasks) -> results
+
+    As `run_concurrently`, but only returns once all tasks have succeeded,
+    raising a ConcurrentTaskError reporting every failure otherwise.
+    """
+    results, errors = run_concurrently(tasks, max_workers=max_workers)
+    if errors:
+        raise ConcurrentTaskError(errors)
+    return results
@@ -0,0 +1,101 @@
+from mock import Mock, patch
+
+from gonzo.clouds.cache import ResourceCache
+
+
+class FakeResource(object):
+    def __init__(self, name, driver):
+        self.name = name
+        self.driver = driver
+
+
+def make_cache(tmpdir, driver=None):
+    return ResourceCache(driver, 'cloudname', 'regionname',
+                         cache_dir=str(tmpdir))
+
+
+def test_missing(tmpdir):
+    cache = make_cache(tmpdir)
+    assert cache.get('instances', ttl=60) is None
+
+
+def test_round_trip_between_caches(tmpdir):
+    driver = Mock()
+    make_cache(tmpdir, driver).set(
+        'instances', [FakeResource('foo', driver)])
+
+    new_driver = Mock()
+    cached = make_cache(tmpdir, new_driver).get('instances', ttl=60)
+    assert [resource.name for resource in cached] == ['foo']
+    assert cached[0].driver is new_driver
+
+
+def test_set_leaves_driver_attached(tmpdir):
+    driver = Mock()
+    resource = FakeResource('foo', driver)
+    make_cache(tmpdir, driver).set('instances', [resource])
+    assert resource.driver is driver
+
+
+def test_keyed_by_cloud_and_region(tmpdir):
+    make_cache(tmpdir).set('instances', ['foo'])
+    other_region = ResourceCache(None, 'cloudname', 'otherregion',
+                                 cache_dir=str(tmpdir))
+    assert other_region.get('instances', ttl=60) is None
+
+
+@patch('gonzo.clouds.cache.time.time')
+def test_expiry(time, tmpdir):
+    time.return_value = 1000
+    make_cache(tmpdir).set('instances', ['foo'])
+
+    time.return_value = 1061
+    assert make_cache(tmpdir).get('instances', ttl=60) is None
+    assert make_cache(tmpdir).get('instances', ttl=120) == ['foo']
+
+
+def test_zero_ttl_disables(tmpdir):
+    cache = make_cache(tmpdir)
+    cache.set('instances', ['foo'])
+    assert cache.get('instances', ttl=0) is None
+
+
+def test_invalidate(tmpdir):
+    cache = make_cache(tmpdir)
+    cache.set('instances', ['foo'])
+    cache.invalidate('instances')
+    assert cache.get('instances', ttl=60) is None
+    assert make_cache(tmpdir).get('instances', ttl=60) is None
+
+
+def test_corrupt_file_ignored(tmpdir):
+    cache = make_cache(tmpdir)
+    cache.set('instances', ['foo'])
+    with open(cache._path('instances'), 'wb') as cache_file:
+        cache_file.write('not a pickle')
+    assert make_cache(tmpdir).get('instances', ttl=60) is None
+
+
+def test_nested_driver_references(tmpdir):
+    driver = Mock()
+    resource = FakeResource('foo', driver)
+    resource.zone = FakeResource('zone', driver)
+    make_cache(tmpdir, driver).set('zones', [resource])
+
+    new_driver = Mock()
+    [cached] = make_cache(tmpdir, new_driver).get('zones', ttl=60)
+    assert cached.zone.driver is new_driver
+
+
+def test_owner_references(tmpdir):
+    owner = Mock()
+    resource = FakeResource('foo', None)
+    resource.owner = owner
+    ResourceCache(None, 'cloudname', 'regionname', cache_dir=str(tmpdir),
+                  owner=owner).set('instances', [resource])
+
+    new_owner = Mock()
+    [cached] = ResourceCache(
+        None, 'cloudname', 'regionname', cache_dir=str(tmpdir),
+        owner=new_owner).get('instances', ttl=60)
+    assert cached.owner is new_owner
@@ -0,0 +1,91 @@
+from mock import Mock
+import pytest
+
+from gonzo.clouds.cache import ResourceCache
+from gonzo.clouds.catalog import Catalog
+
+
+class Resource(object):
+    def __init__(self, name):
+        self.name = name
+        self.id = name
+
+
+def make_catalog(list_sizes, cache=None):
+    return Catalog({
+        'sizes': (list_sizes, 'name'),
+        'images': (None, 'id'),
+    }, cache=cache)
+
+
+def test_fetched_once():
+    list_sizes = Mock(return_value=[Resource('small'), Resource('large')])
+    catalog = make_catalog(list_sizes)
+
+    assert catalog.get('sizes', 'small').name == 'small'
+    assert catalog.get('sizes', 'large').name == 'large'
+    assert [size.name for size in catalog.list('sizes')] == [
+        'small', 'large']
+    assert list_sizes.call_count == 1
+
+
+def test_unknown_after_fetch():
+    list_sizes = Mock(return_value=[Resource('small')])
+    catalog = make_catalog(list_sizes)
+
+    with pytest.raises(KeyError):
+        catalog.get('sizes', 'huge')
+    assert list_sizes.call_count == 1
+
+
+def test_persisted(tmpdir):
+    list_sizes = Mock(return_value=[Resource('small')])
+    cache = ResourceCache(None, 'cloud', 'region', str(tmpdir))
+    make_catalog(list_sizes, cache).get('sizes', 'small')
+
+    cache = ResourceCache(None, 'cloud', 'region', str(tmpdir))
+    assert make_catalog(list_sizes, cache).get('sizes', 'small')
+    assert list_sizes.call_count == 1
+
+
+def test_refetch_on_miss(tmpdir):
+    list_sizes = Mock(return_value=[Resource('small')])
+    cache = ResourceCache(None, 'cloud', 'region', str(tmpdir))
+    make_catalog(list_sizes, cache).list('sizes')
+
+    list_sizes.return_value = [Resource('small'), Resource('large')]
+    cache = ResourceCache(None, 'cloud', 'region', str(tmpdir))
+    catalog = make_catalog(list_sizes, cache)
+    assert catalog.get('sizes', 'large').name == 'large'
+    assert list_sizes.call_count == 2
+
+
+def test_fetch_one():
+    catalog = make_catalog(Mock())
+    fetch = Mock(return_value=Resource('ami-1'))
+
+    assert catalog.fetch_one('images', 'ami-1', fetch).id == 'ami-1'
+    assert catalog.fetch_one('images', 'ami-1', fetch).id == 'ami-1'
+    assert fetch.call_count == 1
+
+
+def test_add_and_invalidate():
+    list_sizes = Mock(return_value=[Resource('small')])
+    catalog = make_catalog(list_sizes)
+
+    catalog.add('sizes', Resource('custom'))
+    assert catalog.get('sizes', 'custom').name == 'custom'
+    assert list_sizes.call_count == 1
+
+    catalog.invalidate('sizes')
+    catalog.list('sizes')
+    assert list_sizes.call_count == 2
+
+
+def test_get_by_other_attribute():
+    small = Resource('small')
+    small.id = '1'
+    catalog = make_catalog(Mock(return_value=[small]))
+    assert catalog.get('sizes', '1', attribute='id') is small
+    with pytest.raises(KeyError):
+        catalog.get('sizes', 'small', attribute='id')
@@ -1,20 +1,34 @@
-from mock import Mock
+from datetime import datetime
+from xml.etree import ElementTree as ET
+
+from libcloud.compute.base import Node
+from libcloud.compute.providers import get_driver
+from libcloud.compute.types import Provider
+from libcloud.compute.types import NodeState
+from mock import Mock, patch
 import pytest
 
-from gonzo.clouds.compute import Cloud
+from gonzo.clouds import (get_all_cloud_regions, get_cloud,
+                          get_cloud_regions, list_instances_across)
+from gonzo.clouds.cache import ResourceCache
+from gonzo.clouds.compute import (AWS, Cloud, Openstack,
+                                  launch_time_patterns)
+from gonzo.clouds.instance import Instance
+from gonzo.exceptions import ConcurrentTaskError
 
 
-def make_fake_instance(**kwargs):
-    instance = Mock(extra={})
-    for key, value in kwargs.items():
-        instance.extra[key] = value
-    return instance
+def make_fake_instance(environment='testing', server_type='foo',
+                       state=NodeState.RUNNING, **kwargs):
+    return Mock(gonzo_tags={
+        'environment': environment, 'server_type': server_type,
+    }, state=state, **kwargs)
 
 
 class MockCloud(Cloud):
     def __init__(self, zones, instances):
         self.zones = zones
         self.instances = instances
+        self.listings = 0
 
     def list_availability_zones(self):
         zone_list = []
@@ -24,7 +38,8 @@ class MockCloud(Cloud):
             zone_list.append(mock)
         return zone_list
 
-    def list_instances_by_type(self, server_type, instance_type):
+    def _list_instances_matching(self, **filters):
+        self.listings += 1
         return self.instances
 
 
@@ -32,12 +47,15 @@ def test_get_next_az_foo():
     cloud = MockCloud(
         zones=['a'], instances=[make_fake_instance(gonzo_az='x')]
     )
-    az = cloud.get_next_az(environment="testing", server_type=["foo", "bar"])
+    az = cloud.get_next_az(environment="testing", server_type="foo")
     assert az.name == 'a'
 
 
 def test_get_next_az_unknown_zone():
-    pass
+    # instances in zones no longer offered don't count
+    cloud = MockCloud(
+        zones=['a', 'b'], instances=[make_fake_instance(gonzo_az='x')])
+    assert cloud.get_next_az('testing', 'foo').name == 'a'
 
 
 @pytest.mark.parametrize(
@@ -47,7 +65,8 @@ def test_get_next_az_unknown_zone():
         (['a', 'b'], ['a'], 'b'),
         (['a', 'b'], ['b'], 'a'),
         (['a', 'b'], ['a', 'b'], 'a'),
-        (['a', 'b'], ['a', 'a', 'b'], 'a'),  # always uses "newest"
+        (['a', 'b'], ['a', 'a', 'b'], 'b'),  # least populated
+        (['b', 'a'], ['a', 'b'], 'a'),  # ties go to the first by name
     ])
 def test_get_next_az(zones, instance_zones, expected):
     instances = [
@@ -57,12 +76,578 @@ def test_get_next_az(zones, instance_zones, expected):
     cloud = MockCloud(zones=zones, instances=instances)
     az = cloud.get_next_az(
         environment="testing",
-        server_type=["foo", "bar"]
+        server_type="foo"
     )
     assert az.name == expected
 
 
+def test_get_next_az_counts_only_live_instances_of_type():
+    cloud = MockCloud(zones=['a', 'b'], instances=[
+        make_fake_instance(gonzo_az='a'),
+        make_fake_instance(gonzo_az='b', state=NodeState.TERMINATED),
+        make_fake_instance(gonzo_az='b', server_type='bar'),
+        make_fake_instance(gonzo_az='b', environment='prod'),
+    ])
+    assert cloud.get_next_az('testing', 'foo').name == 'b'
+
+
 def test_missing_backend():
     with pytest.raises(LookupError) as exc_info:
         Cloud.from_config({}, "region")
     assert 'No backend specified' in str(exc_info.value)
+
+
+def make_node(node_id='i-1', name='test-foo-001', **extra):
+    return Node(node_id, name, NodeState.RUNNING, [], [], None, extra=extra)
+
+
+def to_instance(node):
+    return Instance(node, tags=node.extra.get('gonzo_tags', {}))
+
+
+class ListingCloud(Cloud):
+    def __init__(self, nodes):
+        self.compute_session = Mock()
+        self.compute_session.list_nodes.return_value = nodes
+
+    def _to_instance(self, node):
+        return to_instance(node)
+
+
+def test_list_instances_uncached():
+    cloud = ListingCloud([make_node()])
+    cloud.list_instances()
+    cloud.list_instances()
+    assert cloud.compute_session.list_nodes.call_count == 2
+
+
+def test_list_instances_cached(tmpdir):
+    cloud = ListingCloud([make_node()])
+    cloud.cache = ResourceCache(None, 'cloud', 'region', str(tmpdir))
+    cloud.inventory_ttl = 60
+
+    cloud.list_instances()
+    cached = cloud.list_instances()
+    assert [instance.name for instance in cached] == ['test-foo-001']
+    assert cloud.compute_session.list_nodes.call_count == 1
+
+    cloud.invalidate_inventory()
+    cloud.list_instances()
+    assert cloud.compute_session.list_nodes.call_count == 2
+
+
+def test_terminate_instance_invalidates(tmpdir):
+    cloud = ListingCloud([make_node()])
+    cloud.cache = ResourceCache(None, 'cloud', 'region', str(tmpdir))
+    cloud.inventory_ttl = 60
+
+    instance = cloud.list_instances()[0]
+    assert isinstance(instance, Instance)
+    cloud.terminate_instance(instance)
+    cloud.compute_session.destroy_node.assert_called_once_with(instance)
+
+    cloud.list_instances()
+    assert cloud.compute_session.list_nodes.call_count == 2
+
+
+def make_typed_node(name):
+    environment, server_type = name.split('-', 1)
+    server_type = server_type.rsplit('-', 1)[0]
+    return make_node(
+        node_id=name, name=name,
+        gonzo_tags={'environment': environment, 'server_type': server_type})
+
+
+def test_list_instances_by_type_single_listing():
+    cloud = ListingCloud([
+        make_typed_node('prod-web-app-002'),
+        make_typed_node('prod-web-db-001'),
+        make_typed_node('prod-web-app-001'),
+        make_typed_node('test-web-app-001'),
+    ])
+    cloud._to_instance = to_instance
+
+    instances = cloud.list_instances_by_type('prod', 'web-app')
+    assert [i.name for i in instances] == [
+        'prod-web-app-001', 'prod-web-app-002']
+    assert cloud.list_instances_by_type('prod', 'missing') == []
+
+    assert cloud.compute_session.list_nodes.call_count == 2
+    assert not cloud.compute_session.ex_get_metadata_for_node.called
+
+
+def test_list_instances_by_type_cached(tmpdir):
+    cloud = ListingCloud([
+        make_typed_node('prod-web-app-001'),
+        make_typed_node('prod-web-db-001'),
+    ])
+    cloud._to_instance = to_instance
+    cloud.cache = ResourceCache(None, 'cloud', 'region', str(tmpdir))
+    cloud.inventory_ttl = 60
+
+    cloud.list_instances_by_type('prod', 'web-app')
+    instances = cloud.list_instances_by_type('prod', 'web-db')
+    assert [i.name for i in instances] == ['prod-web-db-001']
+    assert cloud.compute_session.list_nodes.call_count == 1
+
+
+def test_aws_list_instances_by_type_filters_server_side():
+    cloud = AWS.__new__(AWS)
+    cloud.compute_session = Mock()
+    cloud.compute_session.list_nodes.return_value = [
+        make_typed_node('prod-web-app-001')]
+    cloud._to_instance = to_instance
+
+    instances = cloud.list_instances_by_type('prod', 'web-app')
+    assert [i.name for i in instances] == ['prod-web-app-001']
+    cloud.compute_session.list_nodes.assert_called_once_with(ex_filters={
+        'tag:environment': 'prod',
+        'tag:server_type': 'web-app',
+    })
+
+
+def test_get_instance_by_name_and_uuid():
+    foo, bar = make_node('i-1', 'foo'), make_node('i-2', 'bar')
+    foo.driver = bar.driver = Mock(type='fake')
+    cloud = ListingCloud([foo, bar])
+
+    assert cloud.get_instance_by_name('bar').id == 'i-2'
+    assert cloud.get_instance_by_uuid(foo.uuid).id == 'i-1'
+    with pytest.raises(LookupError):
+        cloud.get_instance_by_name('baz')
+    with pytest.raises(LookupError):
+        cloud.get_instance_by_uuid('missing')
+
+
+def test_aws_get_instance_by_name_filters_server_side():
+    foo = make_node('i-1', 'foo')
+    cloud = AWS.__new__(AWS)
+    cloud.compute_session = Mock()
+    cloud.compute_session.list_nodes.return_value = [foo]
+    cloud._to_instance = to_instance
+
+    assert cloud.get_instance_by_name('foo').id == 'i-1'
+    cloud.compute_session.list_nodes.assert_called_once_with(
+        ex_filters={'tag:Name': 'foo'})
+
+
+@pytest.mark.parametrize(
+    ('instance_zones', 'count', 'expected'),
+    [
+        ([], 3, ['a', 'b', 'c']),
+        (['a'], 4, ['b', 'c', 'a', 'b']),
+        (['c'], 2, ['a', 'b']),
+    ])
+def test_get_next_azs(instance_zones, count, expected):
+    instances = [
+        make_fake_instance(gonzo_az=zone) for zone in instance_zones
+    ]
+    cloud = MockCloud(zones=['a', 'b', 'c'], instances=instances)
+    azs = cloud.get_next_azs('testing', 'foo', count)
+    assert [az.name for az in azs] == expected
+    assert cloud.listings == 1
+
+
+def test_get_next_azs_balances_uneven_zones():
+    instances = [
+        make_fake_instance(gonzo_az=zone) for zone in ['a'] * 4 + ['b']]
+    cloud = MockCloud(zones=['a', 'b', 'c'], instances=instances)
+    azs = cloud.get_next_azs('testing', 'foo', 6)
+    assert [az.name for az in azs] == ['c', 'b', 'c', 'b', 'c', 'b']
+
+
+def test_parse_instance_name():
+    assert Cloud.parse_instance_name('production-platform-app-001') == (
+        'production', 'platform-app')
+
+
+@patch('gonzo.clouds.waiter.time')
+def test_wait_until_running_keeps_order(time):
+    time.time.return_value = 0
+    foo, bar = make_node('i-1', 'foo'), make_node('i-2', 'bar')
+    cloud = ListingCloud([])
+    cloud.compute_session.list_nodes.return_value = [
+        make_node('i-2', 'bar'), make_node('i-1', 'foo')]
+    for node in cloud.compute_session.list_nodes.return_value:
+        node.private_ips = ['10.0.0.1']
+
+    assert [i.name for i in cloud.wait_until_running([foo, bar])] == [
+        'foo', 'bar']
+    assert cloud.compute_session.list_nodes.call_count == 1
+
+
+@patch('gonzo.clouds.waiter.time')
+def test_openstack_wait_until_running_while_building(time):
+    time.time.return_value = 0
+    extra = {'metadata': {}, 'flavorId': '1', 'availability_zone': 'nova',
+             'created': '2014-01-02T03:04:05Z'}
+    building = make_node('i-1', 'foo', **extra)
+    building.state = NodeState.PENDING
+    running = make_node('i-1', 'foo', **extra)
+    running.private_ips = ['10.0.0.1']
+    cloud = Openstack.__new__(Openstack)
+    cloud.compute_session = Mock()
+    cloud.compute_session.list_nodes.side_effect = [[building], [running]]
+
+    [instance] = cloud.wait_until_running([building])
+    assert instance.gonzo_network_address == '10.0.0.1'
+    assert cloud.compute_session.list_nodes.call_count == 2
+
+
+@patch('gonzo.clouds.waiter.time')
+def test_wait_until_running_failed(time):
+    time.time.return_value = 0
+    foo = make_node('i-1', 'foo')
+    cloud = ListingCloud([])
+    terminated = make_node('i-1', 'foo')
+    terminated.state = NodeState.TERMINATED
+    cloud.compute_session.list_nodes.return_value = [terminated]
+
+    with pytest.raises(ConcurrentTaskError) as exc_info:
+        cloud.wait_until_running([foo])
+    assert 'i-1: Instance foo is TERMINATED' in str(exc_info.value)
+
+
+def test_aws_describes_only_pending_nodes():
+    cloud = AWS.__new__(AWS)
+    cloud.compute_session = Mock()
+    cloud._describe_nodes(['i-1', 'i-2'])
+    cloud.compute_session.list_nodes.assert_called_once_with(
+        ex_filters={'instance-id': ['i-1', 'i-2']})
+
+
+@patch('gonzo.clouds.waiter.time')
+def test_wait_until_volume_available(time):
+    time.time.return_value = 0
+    cloud = ListingCloud([])
+    cloud.compute_session.list_volumes.side_effect = [
+        [Mock(id='vol-1', extra={'state': 'creating'})],
+        [Mock(id='vol-1', extra={'state': 'available'})],
+    ]
+    assert cloud.wait_until_volume_available(Mock(id='vol-1'))
+    assert cloud.compute_session.list_volumes.call_count == 2
+
+
+def test_resolve_launch_resources_reports_all_errors():
+    cloud = ListingCloud([])
+    cloud.get_image = Mock(side_effect=LookupError("Unknown image"))
+    cloud.get_instance_size_by_name = Mock(
+        side_effect=LookupError("Unknown size"))
+    cloud.get_key_pair = Mock()
+    cloud.security_groups_for_launch = Mock()
+
+    with pytest.raises(ConcurrentTaskError) as exc_info:
+        cloud.resolve_launch_resources('ami-1', size='huge', key_name='key')
+
+    assert sorted(exc_info.value.errors) == ['image', 'size']
+    assert 'Unknown image' in str(exc_info.value)
+    assert 'Unknown size' in str(exc_info.value)
+
+
+def test_resolve_launch_resources():
+    cloud = ListingCloud([])
+    cloud.get_image = Mock(return_value='image')
+    cloud.get_instance_size_by_name = Mock(return_value='size')
+    cloud.get_key_pair = Mock()
+    cloud.get_key_pair.return_value.name = 'key'
+    cloud.ensure_security_groups = Mock()
+    cloud.security_groups_for_launch = Mock(return_value=['sg'])
+
+    assert cloud.resolve_launch_resources(
+        'ami-1', size='m1.small', key_name='key', security_groups=['sg']
+    ) == {
+        'image': 'image',
+        'size': 'size',
+        'key_name': 'key',
+        'security_groups': ['sg'],
+    }
+
+
+def make_openstack(sizes):
+    cloud = Openstack.__new__(Openstack)
+    Cloud.__init__(cloud, {}, None)
+    cloud.compute_session = Mock()
+    cloud.compute_session.list_sizes.return_value = sizes
+    cloud._size_cache = {}
+    return cloud
+
+
+def make_size(size_id, name):
+    size = Mock(id=size_id)
+    size.name = name
+    return size
+
+
+def test_openstack_size_names_from_one_listing():
+    cloud = make_openstack(
+        [make_size('1', 'm1.tiny'), make_size('2', 'm1.small')])
+
+    assert cloud._get_size_name('1') == 'm1.tiny'
+    assert cloud._get_size_name('2') == 'm1.small'
+    assert cloud.compute_session.list_sizes.call_count == 1
+    assert not cloud.compute_session.ex_get_size.called
+
+
+def test_openstack_size_name_of_deleted_flavor():
+    cloud = make_openstack([make_size('1', 'm1.tiny')])
+    cloud.compute_session.ex_get_size.return_value = make_size('9', 'old')
+
+    assert cloud._get_size_name('9') == 'old'
+    assert cloud._get_size_name('9') == 'old'
+    cloud.compute_session.ex_get_size.assert_called_once_with('9')
+
+
+class SecurityGroupCloud(Cloud):
+    INSTANCE_SIZE_ATTRIBUTE = 'name'
+    SECURITY_GROUP_IDENTIFIER = 'name'
+    SECURITY_GROUP_METHOD = 'ex_list_security_groups'
+
+    def __init__(self, existing):
+        super(SecurityGroupCloud, self).__init__({}, None)
+        self.compute_session = Mock()
+        self.compute_session.ex_list_security_groups.return_value = [
+            make_group(name) for name in existing]
+        self.compute_session.ex_create_security_group.side_effect = (
+            lambda name, description: make_group(name))
+
+
+def make_group(name):
+    group = Mock()
+    group.name = name
+    return group
+
+
+def test_ensure_security_groups_creates_missing_only():
+    cloud = SecurityGroupCloud(existing=['gonzo', 'web'])
+
+    cloud.ensure_security_groups(['gonzo', 'web', 'app', 'db'])
+
+    session = cloud.compute_session
+    assert session.ex_list_security_groups.call_count == 1
+    assert sorted(
+        call_args[0][0]
+        for call_args in session.ex_create_security_group.call_args_list
+    ) == ['app', 'db']
+
+    # created groups are resolved without listing again
+    assert cloud.get_security_group('db').name == 'db'
+    assert session.ex_list_security_groups.call_count == 1
+
+
+def test_ensure_security_groups_created_elsewhere():
+    cloud = SecurityGroupCloud(existing=[])
+    cloud.compute_session.ex_create_security_group.side_effect = Exception(
+        "Security group app already exists")
+
+    cloud.ensure_security_groups(['app'])
+
+    cloud.compute_session.ex_list_security_groups.return_value = [
+        make_group('app')]
+    assert cloud.get_security_group('app').name == 'app'
+
+
+@patch('gonzo.clouds.config_proxy')
+@patch('gonzo.clouds.Cloud.from_config')
+def test_get_cloud_is_shared(from_config, config_proxy):
+    from_config.side_effect = lambda config, region, **kwargs: Mock()
+
+    cloud = get_cloud('aws', 'east')
+
+    assert get_cloud('aws', 'east') is cloud
+    assert get_cloud('aws', 'west') is not cloud
+    assert get_cloud('aws', 'east', use_cache=False) is not cloud
+    assert from_config.call_count == 3
+
+
+@patch('gonzo.clouds.config_proxy')
+def test_get_cloud_regions(config_proxy):
+    config_proxy.get_cloud.return_value = {'REGIONS': ['east', 'west']}
+    config_proxy.CLOUD_NAME = 'aws'
+
+    assert get_cloud_regions() == [('aws', 'east'), ('aws', 'west')]
+
+
+@patch('gonzo.clouds.config_proxy')
+def test_get_all_cloud_regions(config_proxy):
+    config_proxy.CLOUDS = {
+        'aws': {'REGIONS': ['east', 'west']},
+        'openstack': {'REGIONS': ['RegionOne']},
+    }
+
+    assert sorted(get_all_cloud_regions()) == [
+        ('aws', 'east'), ('aws', 'west'), ('openstack', 'RegionOne')]
+
+
+@patch('gonzo.clouds.get_cloud')
+def test_list_instances_across(get_cloud):
+    east, west = Mock(), Mock()
+    east.list_instances.return_value = ['a']
+    west.list_instances.side_effect = ValueError('down')
+
+    def get_cloud_(name, region, use_cache):
+        if name == 'broken':
+            raise LookupError("No backend specified!")
+        return {'east': east, 'west': west}[region]
+    get_cloud.side_effect = get_cloud_
+
+    instances, errors = list_instances_across(
+        [('aws', 'east'), ('aws', 'west'), ('broken', 'east')],
+        use_cache=False)
+
+    assert instances == {('aws', 'east'): ['a']}
+    assert sorted(errors) == [('aws', 'west'), ('broken', 'east')]
+    assert isinstance(errors[('broken', 'east')], LookupError)
+
+
+def test_iter_instances_single_page():
+    cloud = ListingCloud([
+        make_typed_node('prod-web-app-001'),
+        make_typed_node('prod-web-db-001'),
+    ])
+    instances = cloud.iter_instances(environment='prod', server_type='web-db')
+    assert [i.name for i in instances] == ['prod-web-db-001']
+    cloud.compute_session.list_nodes.assert_called_once_with()
+
+
+def test_iter_instances_cached(tmpdir):
+    cloud = ListingCloud([make_node()])
+    cloud.cache = ResourceCache(None, 'cloud', 'region', str(tmpdir))
+    cloud.inventory_ttl = 60
+    cloud.list_instances()
+
+    assert [i.name for i in cloud.iter_instances()] == ['test-foo-001']
+    assert cloud.compute_session.list_nodes.call_count == 1
+
+
+EC2_PAGE = """<?xml version="1.0" encoding="UTF-8"?>
+<DescribeInstancesResponse
+    xmlns="http://ec2.amazonaws.com/doc/2013-10-15/">
+  <reservationSet>{}</reservationSet>{}
+</DescribeInstancesResponse>"""
+
+EC2_RESERVATION = """
+<item>
+  <instancesSet>
+    <item>
+      <instanceId>{0}</instanceId>
+      <instanceState><name>running</name></instanceState>
+      <tagSet><item><key>Name</key><value>{0}</value></item></tagSet>
+    </item>
+  </instancesSet>
+</item>"""
+
+
+def ec2_page(instance_ids, next_token=None):
+    token = ''
+    if next_token:
+        token = '<nextToken>{}</nextToken>'.format(next_token)
+    body = EC2_PAGE.format(
+        ''.join(EC2_RESERVATION.format(id_) for id_ in instance_ids), token)
+    return Mock(object=ET.fromstring(body))
+
+
+def test_aws_iter_instances_pages():
+    driver = get_driver(Provider.EC2)('key', 'secret', region='eu-west-1')
+    driver.connection.request = Mock(side_effect=[
+        ec2_page(['i-1', 'i-2'], next_token='abc'),
+        ec2_page(['i-3']),
+    ])
+    driver.ex_describe_addresses = Mock(return_value={})
+    cloud = AWS.__new__(AWS)
+    cloud.compute_session = driver
+    cloud._to_instance = to_instance
+
+    instances = cloud.iter_instances(page_size=2)
+    assert next(instances).id == 'i-1'
+    assert driver.connection.request.call_count == 1
+
+    assert [i.id for i in instances] == ['i-2', 'i-3']
+    first, second = [
+        kwargs['params'] for _, kwargs in
+        driver.connection.request.call_args_list]
+    assert first['MaxResults'] == 5  # EC2's minimum
+    assert 'NextToken' not in first
+    assert second['NextToken'] == 'abc'
+
+
+def server_page(nodes, next_link=True):
+    links = []
+    if next_link:
+        links.append({'rel': 'next', 'href': 'http://nova/servers/detail'})
+    return Mock(object={'servers': nodes, 'servers_links': links})
+
+
+def test_openstack_iter_instances_pages():
+    session = Mock()
+    session.connection.request.side_effect = [
+        server_page([make_node('a', 'a'), make_node('b', 'b')]),
+        server_page([make_node('c', 'c')], next_link=False),
+    ]
+    session._to_nodes.side_effect = lambda page: page['servers']
+    cloud = Openstack.__new__(Openstack)
+    cloud.compute_session = session
+    cloud._to_instance = to_instance
+
+    assert [i.id for i in cloud.iter_instances(page_size=2)] == [
+        'a', 'b', 'c']
+    assert [
+        kwargs['params'] for _, kwargs in
+        session.connection.request.call_args_list] == [
+        {'limit': 2}, {'limit': 2, 'marker': 'b'}]
+
+
+def test_openstack_iter_instances_pages_capped_by_server():
+    # osapi_max_limit returns fewer servers than asked for, with a link
+    session = Mock()
+    session.connection.request.side_effect = [
+        server_page([make_node('a', 'a')]),
+        server_page([make_node('b', 'b')]),
+        server_page([]),
+    ]
+    session._to_nodes.side_effect = lambda page: page['servers']
+    cloud = Openstack.__new__(Openstack)
+    cloud.compute_session = session
+    cloud._to_instance = to_instance
+
+    assert [i.id for i in cloud.iter_instances(page_size=1000)] == ['a', 'b']
+    assert session.connection.request.call_count == 3
+
+
+def test_launch_time_patterns():
+    assert launch_time_patterns(
+        datetime(2014, 1, 30, 23), now=datetime(2014, 2, 1, 1)) == [
+        '2014-01-30*', '2014-01-31*', '2014-02-01*']
+
+
+def test_aws_changed_nodes_include_stopped():
+    # running when last synced, and stopped since
+    stopped = make_node('i-1', 'foo')
+    stopped.state = NodeState.STOPPED
+
+    def list_nodes(ex_filters):
+        if 'stopped' in ex_filters.get('instance-state-name', []):
+            return [stopped]
+        return []
+    cloud = AWS.__new__(AWS)
+    cloud.compute_session = Mock()
+    cloud.compute_session.list_nodes.side_effect = list_nodes
+
+    assert cloud._list_changed_nodes(
+        datetime.utcnow(), [to_instance(make_node('i-1', 'foo'))]) == (
+        [stopped], [])
+
+
+def test_openstack_changed_nodes():
+    changed = make_node('a', 'a')
+    deleted = Node('b', 'b', NodeState.TERMINATED, [], [], None)
+    session = Mock()
+    session.connection.request.return_value = server_page(
+        [], next_link=False)
+    session._to_nodes.return_value = [changed, deleted]
+    cloud = Openstack.__new__(Openstack)
+    cloud.compute_session = session
+
+    assert cloud._list_changed_nodes(datetime(2014, 1, 2, 3, 4, 5), []) == (
+        [changed], ['b'])
+    _, kwargs = session.connection.request.call_args
+    assert kwargs['params']['changes-since'] == '2014-01-02T03:04:05Z'
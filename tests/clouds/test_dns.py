@@ -0,0 +1,325 @@
+import time
+from xml.etree import ElementTree as ET
+
+from libcloud.dns.base import Record, Zone
+from libcloud.dns.drivers.route53 import InvalidChangeBatch
+from mock import Mock, patch
+import pytest
+
+from gonzo.clouds.dns import ChangeBatch, Route53
+
+
+RRSET = """<?xml version="1.0" encoding="UTF-8"?>
+<ListResourceRecordSetsResponse
+    xmlns="https://route53.amazonaws.com/doc/2012-02-29/">
+  <ResourceRecordSets>
+    <ResourceRecordSet>
+      <Name>{name}.example.com.</Name>
+      <Type>{type}</Type>
+      <TTL>300</TTL>
+      <ResourceRecords>
+        <ResourceRecord><Value>{value}</Value></ResourceRecord>
+      </ResourceRecords>
+    </ResourceRecordSet>
+  </ResourceRecordSets>
+  <IsTruncated>true</IsTruncated>
+  <MaxItems>1</MaxItems>
+</ListResourceRecordSetsResponse>"""
+
+
+CHANGE = """<?xml version="1.0" encoding="UTF-8"?>
+<{response} xmlns="https://route53.amazonaws.com/doc/2012-02-29/">
+  <ChangeInfo>
+    <Id>/change/{id}</Id>
+    <Status>{status}</Status>
+    <SubmittedAt>2014-01-01T00:00:00.000Z</SubmittedAt>
+  </ChangeInfo>
+</{response}>"""
+
+
+def rrset(name, type_, value):
+    return Mock(object=ET.fromstring(
+        RRSET.format(name=name, type=type_, value=value)))
+
+
+def change(change_id, status, response='GetChangeResponse'):
+    return Mock(object=ET.fromstring(
+        CHANGE.format(id=change_id, status=status, response=response)))
+
+
+class Route53API(object):
+    """ Responses to Route53 requests: `read` to record queries, `posted`
+        change batches, and `statuses` of changes by id """
+
+    def __init__(self):
+        self.read = Mock()
+        self.post = Mock()
+        self.posted = []
+        self.statuses = {}
+
+    def __call__(self, path, params=None, method='GET', data=None):
+        if method == 'POST':
+            self.post()
+            change_id = 'C{}'.format(len(self.posted) + 1)
+            self.posted.append(ET.fromstring(data))
+            self.statuses.setdefault(change_id, ['INSYNC'])
+            return change(change_id, 'PENDING',
+                          'ChangeResourceRecordSetsResponse')
+        if '/change/' in path:
+            change_id = path.rsplit('/', 1)[1]
+            return change(change_id, self.statuses[change_id].pop(0))
+        return self.read(path, params=params)
+
+    def changes(self, number=-1):
+        """ (action, name, type, value) of each change in a posted batch """
+        namespace = '{https://route53.amazonaws.com/doc/2012-02-29/}'
+        return [
+            tuple(
+                element.text for element in change.iter()
+                if element.tag.replace(namespace, '') in (
+                    'Action', 'Name', 'Type', 'Value'))
+            for change in self.posted[number].iter(namespace + 'Change')
+        ]
+
+
+@pytest.fixture
+def dns():
+    dns = Route53('key', 'secret')
+    session = dns.dns_session
+    zone = Zone('Z1', 'example.com.', 'master', None, session)
+    session.iterate_zones = Mock(return_value=iter([
+        Zone('Z2', 'example.org.', 'master', None, session), zone]))
+    session.iterate_records = Mock()
+    session.connection.request = dns.route53 = Route53API()
+    return dns
+
+
+def test_zone_looked_up_once(dns):
+    assert dns.get_zone('example.com').id == 'Z1'
+    assert dns.get_zone('example.com').id == 'Z1'
+    assert dns.dns_session.iterate_zones.call_count == 1
+
+
+def test_get_dns_record_queries_by_name(dns):
+    request = dns.route53.read
+    request.return_value = rrset('_count-prod-web', 'TXT', '"4"')
+
+    record = dns.get_dns_record('_count-prod-web', 'example.com', 'TXT')
+
+    assert record.data == '"4"'
+    assert not dns.dns_session.iterate_records.called
+    (path,), kwargs = request.call_args
+    assert path.endswith('/hostedzone/Z1/rrset')
+    assert kwargs['params'] == {
+        'name': '_count-prod-web.example.com.',
+        'type': 'TXT',
+        'maxitems': '1',
+    }
+
+
+def test_get_dns_record_missing(dns):
+    # the query returns the next record along when there's no such record
+    dns.route53.read.return_value = rrset(
+        'prod-web-001', 'CNAME', 'host.example.net')
+    assert dns.get_dns_record('_count-prod-web', 'example.com') is None
+
+
+def test_get_next_host(dns):
+    dns.route53.read.return_value = rrset(
+        '_count-prod-web', 'TXT', '"4"')
+    assert dns.get_next_host('prod-web', 'example.com') == 'prod-web-005'
+    assert dns.dns_session.iterate_zones.call_count == 1
+
+
+def test_reserve_hosts(dns):
+    dns.route53.read.return_value = rrset(
+        '_count-prod-web', 'TXT', '"4"')
+
+    assert dns.reserve_hosts('prod-web', 'example.com', 3) == [
+        'prod-web-005', 'prod-web-006', 'prod-web-007']
+
+    # the old count is swapped for the new one in a single change batch
+    assert dns.route53.changes() == [
+        ('DELETE', '_count-prod-web.example.com.', 'TXT', '"4"'),
+        ('CREATE', '_count-prod-web.example.com.', 'TXT', '"7"'),
+    ]
+
+
+def test_reserve_hosts_first(dns):
+    dns.route53.read.return_value = rrset(
+        'prod-web-001', 'CNAME', 'host.example.net')
+
+    assert dns.reserve_hosts('prod-web', 'example.com', 2) == [
+        'prod-web-001', 'prod-web-002']
+    assert dns.route53.changes() == [
+        ('CREATE', '_count-prod-web.example.com.', 'TXT', '"2"')]
+
+
+@patch('gonzo.clouds.dns.time.sleep')
+def test_reserve_hosts_retries_conflicts(sleep, dns):
+    # someone else reserved hosts between our read and change
+    dns.route53.read.side_effect = [
+        rrset('_count-prod-web', 'TXT', '"4"'),
+        rrset('_count-prod-web', 'TXT', '"6"'),
+    ]
+    dns.route53.post.side_effect = [
+        InvalidChangeBatch('not found', None), None]
+
+    assert dns.reserve_hosts('prod-web', 'example.com', 2) == [
+        'prod-web-007', 'prod-web-008']
+    assert sleep.call_count == 1
+
+
+@patch('gonzo.clouds.dns.time.sleep')
+def test_reserve_hosts_gives_up(sleep, dns):
+    dns.route53.read.return_value = rrset(
+        '_count-prod-web', 'TXT', '"4"')
+    dns.route53.post.side_effect = InvalidChangeBatch('not found', None)
+
+    with pytest.raises(InvalidChangeBatch):
+        dns.reserve_hosts('prod-web', 'example.com', 2)
+    assert dns.route53.post.call_count == 5
+
+
+def test_change_batch_limits():
+    batch = ChangeBatch(Mock())
+    for number in range(5):
+        batch.create('host-{}'.format(number), 'CNAME', 'x' * 10)
+    record = Mock(data='y' * 10, extra={})
+    record.name, record.type = 'host-9', 'CNAME'
+    batch.update(record, 'z' * 10)
+
+    assert len(batch) == 6
+    assert [len(changes) for changes in batch.batches(max_changes=3)] == [
+        3, 2, 2]
+    # an update's delete and create are never split up
+    assert [len(changes) for changes in batch.batches(max_changes=6)] == [
+        5, 2]
+    assert [len(changes) for changes in batch.batches(max_chars=25)] == [
+        2, 2, 1, 2]
+
+
+@patch('gonzo.clouds.waiter.time.sleep')
+def test_apply_changes(sleep, dns):
+    batch = dns.change_batch('example.com')
+    for number in range(1, 1001):
+        batch.create('prod-web-{:03d}'.format(number), 'CNAME',
+                     'host-{}.example.net'.format(number))
+    batch.create('www', 'CNAME', 'prod-web-001.example.com', ttl=60)
+    dns.route53.statuses['C2'] = ['PENDING', 'PENDING', 'INSYNC']
+
+    # more changes than fit in one change batch
+    assert dns.apply_changes(batch) == ['C1', 'C2']
+
+    assert len(dns.route53.changes(0)) == 1000
+    assert dns.route53.changes(0)[0] == (
+        'CREATE', 'prod-web-001.example.com.', 'CNAME',
+        'host-1.example.net')
+    assert dns.route53.changes(1) == [
+        ('CREATE', 'www.example.com.', 'CNAME', 'prod-web-001.example.com')]
+    # each change is polled until it's INSYNC
+    assert dns.route53.statuses == {'C1': [], 'C2': []}
+    assert sleep.call_count == 3
+
+
+def test_apply_no_changes(dns):
+    assert dns.apply_changes(dns.change_batch('example.com')) == []
+    assert dns.route53.posted == []
+
+
+def zone_records(zone):
+    return [
+        Record('TXT:_count-prod-web', '_count-prod-web', 'TXT', '"4"',
+               zone, None, extra={'ttl': 0}),
+        Record('CNAME:prod-web-004', 'prod-web-004', 'CNAME',
+               'host-4.example.net', zone, None, extra={'ttl': 0}),
+    ]
+
+
+@pytest.fixture
+def snapshot_dns(tmpdir):
+    dns = Route53(
+        'key', 'secret', snapshot_ttl=300, snapshot_dir=str(tmpdir))
+    session = dns.dns_session
+    zone = Zone('Z1', 'example.com.', 'master', None, session,
+                extra={'ResourceRecordSetCount': 2})
+    session.iterate_zones = Mock(side_effect=lambda: iter([zone]))
+    session.get_zone = Mock(return_value=zone)
+    session.iterate_records = Mock(side_effect=zone_records)
+    session.connection.request = dns.route53 = Route53API()
+    return dns
+
+
+def test_snapshot_lookups(snapshot_dns):
+    dns = snapshot_dns
+    record = dns.get_dns_record('_count-prod-web', 'example.com', 'TXT')
+    assert record.data == '"4"'
+    assert dns.get_dns_record('prod-web-005', 'example.com') is None
+    assert dns.dns_session.iterate_records.call_count == 1
+
+    # later commands read the saved snapshot
+    later = Route53('key', 'secret', snapshot_ttl=300,
+                    snapshot_dir=dns.snapshot_dir)
+    later.dns_session.iterate_records = Mock()
+    later.dns_session.connection.request = Mock()
+    record = later.get_dns_record('prod-web-004', 'example.com')
+    assert record.data == 'host-4.example.net'
+    assert not later.dns_session.iterate_records.called
+    assert not later.dns_session.connection.request.called
+
+
+def test_snapshot_checked_for_changes(snapshot_dns):
+    dns = snapshot_dns
+    dns.get_snapshot('example.com')
+
+    with patch('gonzo.clouds.dns.time.time', return_value=time.time() + 400):
+        # the record count hasn't changed, so the zone isn't listed again
+        dns.get_snapshot('example.com')
+        assert dns.dns_session.iterate_records.call_count == 1
+
+        # but has once records are added behind our back
+        dns.dns_session.get_zone.return_value = Zone(
+            'Z1', 'example.com.', 'master', None, dns.dns_session,
+            extra={'ResourceRecordSetCount': 3})
+        dns.snapshot_ttl = 0
+        dns.get_snapshot('example.com')
+        assert dns.dns_session.iterate_records.call_count == 2
+
+
+def test_reserve_hosts_from_snapshot(snapshot_dns):
+    dns = snapshot_dns
+    assert dns.reserve_hosts('prod-web', 'example.com', 2) == [
+        'prod-web-005', 'prod-web-006']
+    assert dns.reserve_hosts('prod-web', 'example.com', 1) == [
+        'prod-web-007']
+
+    # counts were read from the snapshot, kept up to date with our changes
+    assert not dns.route53.read.called
+    assert dns.route53.changes() == [
+        ('DELETE', '_count-prod-web.example.com.', 'TXT', '"6"'),
+        ('CREATE', '_count-prod-web.example.com.', 'TXT', '"7"'),
+    ]
+    assert dns.get_snapshot('example.com').marker == 2
+
+
+@patch('gonzo.clouds.dns.time.sleep')
+def test_reserve_hosts_stale_snapshot(sleep, snapshot_dns):
+    # someone else reserved hosts since the snapshot was taken
+    dns = snapshot_dns
+    dns.route53.read.return_value = rrset('_count-prod-web', 'TXT', '"9"')
+    dns.route53.post.side_effect = [
+        InvalidChangeBatch('not found', None), None, None]
+
+    assert dns.reserve_hosts('prod-web', 'example.com', 1) == [
+        'prod-web-010']
+    assert dns.route53.read.call_count == 1
+
+    # the snapshot holds the count written, rather than the stale one
+    assert dns.reserve_hosts('prod-web', 'example.com', 1) == [
+        'prod-web-011']
+    assert dns.route53.read.call_count == 1
+    assert dns.route53.post.call_count == 3
+    assert dns.route53.changes() == [
+        ('DELETE', '_count-prod-web.example.com.', 'TXT', '"10"'),
+        ('CREATE', '_count-prod-web.example.com.', 'TXT', '"11"'),
+    ]
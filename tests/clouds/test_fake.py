@@ -0,0 +1,273 @@
+from threading import Thread
+import time
+
+from libcloud.compute.types import NodeState
+from libcloud.dns.drivers.route53 import InvalidChangeBatch
+from mock import patch
+import pytest
+
+from gonzo.clouds import fake  # noqa
+from gonzo.clouds.cache import ResourceCache
+from gonzo.clouds.compute import Cloud
+from gonzo.clouds.dns import DNS
+from gonzo.clouds.fake import (Fake, FakeAPIError, FakeDNS, FakeDNSDriver,
+                               FakeNodeDriver)
+
+
+def make_cloud(**config):
+    cloud_config = {
+        'BACKEND': 'fake',
+        'FAKE_POLL_INTERVAL': 0,
+    }
+    cloud_config.update(config)
+    return Cloud.from_config(cloud_config, 'fake-1')
+
+
+def test_fleet():
+    cloud = make_cloud(FAKE_FLEET_SIZE=30)
+
+    instances = cloud.list_instances()
+
+    assert len(instances) == 30
+    assert len(set(instance.name for instance in instances)) == 30
+    assert all(instance.state == NodeState.RUNNING for instance in instances)
+    assert cloud.compute_session.calls['list_nodes'] == 1
+
+
+def test_clouds_have_their_own_catalog_lock():
+    assert make_cloud()._catalog_lock is not make_cloud()._catalog_lock
+
+
+def test_list_instances_by_type():
+    cloud = make_cloud(FAKE_FLEET_SIZE=30)
+
+    instances = cloud.list_instances_by_type('production', 'web-app')
+
+    assert [instance.name for instance in instances] == [
+        'production-web-app-001', 'production-web-app-002']
+
+
+def test_get_instance_by_name():
+    cloud = make_cloud(FAKE_FLEET_SIZE=30)
+    instance = cloud.get_instance_by_name('staging-db-001')
+    assert instance.extra['gonzo_tags']['environment'] == 'staging'
+    assert cloud.get_instance_by_uuid(instance.uuid).name == 'staging-db-001'
+
+
+def test_create_instance():
+    cloud = make_cloud()
+
+    instance = cloud.create_instance(
+        'ami-fake', 'production-web-app-001', 'alice', size='m1.small',
+        key_name='master', security_groups=['web-app', 'gonzo'],
+        volume_size=10)
+
+    assert instance.state == NodeState.RUNNING
+    assert instance.extra['gonzo_az'] == 'fake-1a'
+    assert instance.extra['gonzo_tags']['owner'] == 'alice'
+    assert sorted(cloud.compute_session.security_groups) == [
+        'gonzo', 'web-app']
+    [(_, volume)] = cloud.compute_session.volumes.values()
+    assert volume.extra['attached_to'] == instance.id
+
+    # next instance goes to the next zone
+    az = cloud.get_next_az('production', 'web-app')
+    assert az.name == 'fake-1b'
+
+
+def test_terminate_instance():
+    cloud = make_cloud(FAKE_FLEET_SIZE=3, FAKE_TERMINATED_TTL=60)
+    [instance] = cloud.list_instances()[:1]
+    cloud.terminate_instance(instance)
+
+    # still listed as terminated for a while, as on EC2
+    [terminated] = [
+        listed for listed in cloud.list_instances()
+        if listed.id == instance.id]
+    assert terminated.state == NodeState.TERMINATED
+
+    with patch('gonzo.clouds.fake.time.time', return_value=time.time() + 61):
+        assert len(cloud.list_instances()) == 2
+
+
+def test_failure_injection():
+    driver = FakeNodeDriver(failure_rate={'list_nodes': 1}, seed=1)
+    with pytest.raises(FakeAPIError):
+        driver.list_nodes()
+    assert driver.list_sizes()
+    assert driver.calls['list_nodes'] == 1
+
+
+def test_boot_time():
+    driver = FakeNodeDriver(boot_time=60)
+    node = driver.create_node(
+        'production-db-001', driver.sizes[0], driver.get_image('ami-fake'))
+    [listed] = driver.list_nodes()
+    assert node.state == listed.state == NodeState.PENDING
+
+
+def test_iter_instances_pages():
+    cloud = make_cloud(FAKE_FLEET_SIZE=30)
+
+    instances = list(cloud.iter_instances(page_size=4))
+    assert len(set(instance.name for instance in instances)) == 30
+    assert cloud.compute_session.calls['ex_list_nodes_page'] == 8
+
+    web_apps = cloud.iter_instances(
+        page_size=4, environment='production', server_type='web-app')
+    assert [instance.name for instance in web_apps] == [
+        'production-web-app-001', 'production-web-app-002']
+
+
+def test_incremental_inventory_sync(tmpdir):
+    cloud = make_cloud(FAKE_FLEET_SIZE=30)
+    cloud.cache = ResourceCache(
+        cloud.compute_session, 'fake', 'fake-1', str(tmpdir), owner=cloud)
+    cloud.inventory_ttl = 60
+    cloud.full_sync_interval = 600
+    calls = cloud.compute_session.calls
+
+    instances = cloud.list_instances()
+    assert len(instances) == 30
+    assert calls['list_nodes'] == 1
+
+    # launches and terminations invalidate the listing, but not the snapshot
+    launched = cloud.compute_session.create_node(
+        'test-db-099', cloud.compute_session.sizes[0],
+        cloud.compute_session.get_image('ami-fake'))
+    cloud.invalidate_inventory()
+    cloud.terminate_instance(instances[0])
+
+    synced = dict((i.id, i) for i in cloud.list_instances())
+    assert len(synced) == 31
+    assert synced[launched.id].name == 'test-db-099'
+    assert synced[instances[0].id].state == NodeState.TERMINATED
+    # launch-time and transitional state queries, however big the fleet
+    assert calls['list_nodes'] == 3
+    assert cloud.list_instances() is cloud.list_instances()
+
+    # terminated instances disappear from EC2 (and the fake) after a while,
+    # and are found to be gone by looking them up by id
+    cloud.invalidate_inventory()
+    cloud.compute_session.terminated_ttl = -1
+    synced = cloud.list_instances()
+    assert len(synced) == 30
+    assert calls['list_nodes'] == 6
+
+
+def test_full_inventory_sync_interval(tmpdir):
+    cloud = make_cloud(FAKE_FLEET_SIZE=3)
+    cloud.cache = ResourceCache(
+        cloud.compute_session, 'fake', 'fake-1', str(tmpdir), owner=cloud)
+    cloud.full_sync_interval = 600
+
+    cloud.list_instances()
+    cloud.list_instances()
+    assert cloud.compute_session.calls['list_nodes'] == 3
+
+    with patch('gonzo.clouds.compute.time.time',
+               return_value=time.time() + 601):
+        cloud.list_instances()
+    assert cloud.compute_session.calls['list_nodes'] == 4
+
+
+def test_full_inventory_sync_interval_limited():
+    cloud_config = {'BACKEND': 'fake', 'INVENTORY_FULL_SYNC_INTERVAL': 600}
+    cloud = Cloud.from_config(cloud_config, 'fake-1', name='fake',
+                              use_cache=True)
+    assert cloud.full_sync_interval == 600
+
+    cloud_config['INVENTORY_FULL_SYNC_INTERVAL'] = 86400
+    cloud = Cloud.from_config(cloud_config, 'fake-1', name='fake',
+                              use_cache=True)
+    # EC2 (and the fake) stop listing terminated instances after an hour
+    assert cloud.full_sync_interval == Fake.MAX_FULL_SYNC_INTERVAL
+
+
+def make_dns(**config):
+    cloud_config = {
+        'DNS_BACKEND': 'fake',
+        'DNS_ZONE': 'example.com',
+        'FAKE_POLL_INTERVAL': 0,
+    }
+    cloud_config.update(config)
+    return DNS.from_config(cloud_config, use_cache=False)
+
+
+def test_dns_snapshots_opt_in():
+    assert make_dns().snapshot_ttl == 0
+    config = {'DNS_BACKEND': 'fake', 'DNS_ZONE': 'example.com'}
+    assert DNS.from_config(config).snapshot_ttl == 0
+    config['DNS_SNAPSHOT_TTL'] = 300
+    assert DNS.from_config(config).snapshot_ttl == 300
+    assert DNS.from_config(config, use_cache=False).snapshot_ttl == 0
+
+
+def test_dns_records():
+    dns = make_dns()
+    assert isinstance(dns, FakeDNS)
+
+    batch = dns.change_batch('example.com')
+    batch.create('prod-web-001', 'CNAME', 'host-1.example.net')
+    batch.create('www', 'CNAME', 'prod-web-001.example.com', ttl=60)
+    dns.apply_changes(batch)
+
+    record = dns.get_dns_record('www', 'example.com')
+    assert record.data == 'prod-web-001.example.com'
+    assert record.extra == {'ttl': 60}
+    assert dns.get_dns_record('www', 'example.com', 'TXT') is None
+    zone = dns.get_zone('example.com')
+    assert dns.dns_session.get_zone(zone.id).extra == {
+        'ResourceRecordSetCount': 2}
+
+
+def test_dns_changes_atomic():
+    dns = make_dns()
+    batch = dns.change_batch('example.com')
+    batch.create('prod-web-001', 'CNAME', 'host-1.example.net')
+    dns.apply_changes(batch)
+
+    # the second create fails, so neither is applied
+    batch = dns.change_batch('example.com')
+    batch.create('prod-web-002', 'CNAME', 'host-2.example.net')
+    batch.create('prod-web-001', 'CNAME', 'host-3.example.net')
+    with pytest.raises(InvalidChangeBatch):
+        dns.apply_changes(batch)
+    assert dns.get_dns_record('prod-web-002', 'example.com') is None
+    assert dns.get_dns_record('prod-web-001', 'example.com').data == (
+        'host-1.example.net')
+
+
+def test_dns_propagation():
+    dns = make_dns(FAKE_DNS_PROPAGATION_DELAY=30)
+    batch = dns.change_batch('example.com')
+    batch.create('prod-web-001', 'CNAME', 'host-1.example.net')
+    [change_id] = dns.apply_changes(batch, wait=False)
+
+    assert dns.get_change(change_id).status == 'PENDING'
+    with patch('gonzo.clouds.fake.time.time',
+               return_value=time.time() + 30):
+        assert dns.get_change(change_id).status == 'INSYNC'
+
+
+@patch('gonzo.clouds.dns.time.sleep')
+def test_concurrent_host_reservations(sleep):
+    # several launches at once, each with its own view of the zone
+    driver = FakeDNSDriver(zones=['example.com'], latency=0.001)
+    reserved = []
+
+    def launch():
+        dns = FakeDNS(driver)
+        reserved.extend(dns.reserve_hosts('prod-web', 'example.com', 3))
+
+    threads = [Thread(target=launch) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(reserved) == [
+        'prod-web-{:03d}'.format(number) for number in range(1, 16)]
+    record = FakeDNS(driver).get_dns_record(
+        '_count-prod-web', 'example.com')
+    assert record.data == '"15"'
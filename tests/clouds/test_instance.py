@@ -0,0 +1,100 @@
+from datetime import datetime
+import cPickle as pickle
+
+from libcloud.compute.base import Node
+from libcloud.compute.types import NodeState
+from mock import Mock
+
+from gonzo.clouds.compute import AWS, Openstack
+from gonzo.clouds.instance import Instance
+
+
+class FakeDriver(object):
+    type = 'ec2'
+
+
+def make_node(**extra):
+    return Node('i-1', 'prod-web-001', NodeState.RUNNING, ['1.2.3.4'],
+                ['10.0.0.1'], FakeDriver(), extra=extra)
+
+
+def make_instance(cloud=None):
+    return Instance(
+        make_node(), tags={'owner': 'alice'}, size='m1.small',
+        created='2014-01-02T03:04:05.000Z', az='us-east-1a',
+        network_address='foo.example.com', cloud=cloud)
+
+
+def test_fields_copied_from_node():
+    instance = make_instance()
+    assert instance.id == 'i-1'
+    assert instance.name == 'prod-web-001'
+    assert instance.state == NodeState.RUNNING
+    assert instance.public_ips == ['1.2.3.4']
+    assert instance.private_ips == ['10.0.0.1']
+    assert instance.gonzo_tags == {'owner': 'alice'}
+    assert instance.gonzo_az == 'us-east-1a'
+    assert instance.gonzo_network_address == 'foo.example.com'
+
+
+def test_no_extra_dict_kept():
+    assert not hasattr(make_instance(), '__dict__')
+
+
+def test_uuid_matches_node():
+    assert make_instance().uuid == make_node().uuid
+
+
+def test_lazy_fields_computed_once():
+    cloud = Mock()
+    cloud._instance_created_time.return_value = datetime(2014, 1, 2)
+    instance = make_instance(cloud)
+    assert not cloud._instance_created_time.called
+
+    assert instance.gonzo_created_time == datetime(2014, 1, 2)
+    assert instance.gonzo_created_time == datetime(2014, 1, 2)
+    cloud._instance_created_time.assert_called_once_with(
+        '2014-01-02T03:04:05.000Z')
+
+
+def test_aws_instance():
+    cloud = AWS.__new__(AWS)
+    instance = cloud._to_instance(make_node(
+        tags={'Name': 'prod-web-001'}, instance_type='m1.small',
+        launch_time='2014-01-02T03:04:05.000Z', availability='us-east-1a',
+        dns_name='foo.example.com'))
+    assert instance.gonzo_size == 'm1.small'
+    assert instance.gonzo_created_time == datetime(2014, 1, 2, 3, 4, 5)
+    assert instance.extra == {
+        'gonzo_size': 'm1.small',
+        'gonzo_tags': {'Name': 'prod-web-001'},
+        'gonzo_created_time': datetime(2014, 1, 2, 3, 4, 5),
+        'gonzo_az': 'us-east-1a',
+        'gonzo_network_address': 'foo.example.com',
+    }
+
+
+def test_openstack_flavor_resolved_lazily():
+    cloud = Openstack.__new__(Openstack)
+    cloud._get_size_name = Mock(return_value='m1.small')
+    instance = cloud._to_instance(make_node(
+        metadata={}, flavorId='2', created='2014-01-02T03:04:05Z',
+        availability_zone='nova'))
+    assert instance.name == 'prod-web-001'
+    assert not cloud._get_size_name.called
+
+    assert instance.gonzo_size == 'm1.small'
+    cloud._get_size_name.assert_called_once_with('2')
+    assert instance.gonzo_created_time.date() == datetime(2014, 1, 2).date()
+    assert instance.gonzo_network_address == '10.0.0.1'
+
+
+def test_pickle_round_trip():
+    instance = make_instance()
+    instance.gonzo_created_time  # one lazy field worked out, one not
+
+    loaded = pickle.loads(pickle.dumps(instance, pickle.HIGHEST_PROTOCOL))
+    assert loaded.name == instance.name
+    assert loaded.gonzo_tags == instance.gonzo_tags
+    assert loaded.gonzo_size == 'm1.small'
+    assert loaded.gonzo_created_time == '2014-01-02T03:04:05.000Z'
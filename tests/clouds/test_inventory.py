@@ -0,0 +1,38 @@
+from mock import Mock
+
+from gonzo.clouds.inventory import Inventory, InventorySnapshot
+
+
+def make_instance(instance_id, name, **tags):
+    instance = Mock(id=instance_id, gonzo_tags=tags)
+    instance.name = name
+    return instance
+
+
+def test_by_type_sorted_by_name():
+    inventory = Inventory([
+        make_instance('i-2', 'prod-web-002', environment='prod',
+                      server_type='web'),
+        make_instance('i-1', 'prod-web-001', environment='prod',
+                      server_type='web'),
+    ])
+    assert [i.name for i in inventory.of_type('prod', 'web')] == [
+        'prod-web-001', 'prod-web-002']
+    assert inventory.of_type('prod', 'db') == []
+
+
+def test_snapshot_merge():
+    snapshot = InventorySnapshot([
+        make_instance('i-1', 'a'),
+        make_instance('i-2', 'b'),
+        make_instance('i-3', 'c'),
+    ], synced_at=100)
+
+    changed = make_instance('i-2', 'b')
+    snapshot.merge([
+        make_instance('i-5', 'e'), changed, make_instance('i-4', 'd'),
+    ], removed_ids=['i-3'], synced_at=200)
+
+    assert [i.id for i in snapshot.instances] == ['i-1', 'i-2', 'i-4', 'i-5']
+    assert snapshot.instances[1] is changed
+    assert (snapshot.synced_at, snapshot.full_synced_at) == (200, 100)
@@ -0,0 +1,92 @@
+from mock import Mock
+
+from gonzo.clouds.profiling import Profiler, ProfiledSession, percentile
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeSession(object):
+    def __init__(self, clock):
+        self.clock = clock
+        self.connection = Mock(received_bytes=0)
+        self.type = 'fake'
+
+    def list_nodes(self):
+        self.clock.now += 0.5
+        self.connection.received_bytes += 100
+        return ['node']
+
+    def iterate_records(self):
+        for record in ['a', 'b']:
+            self.clock.now += 0.25
+            self.connection.received_bytes += 10
+            yield record
+
+
+def make_profiled():
+    clock = FakeClock()
+    profiler = Profiler(clock=clock)
+    profiler.enable()
+    session = FakeSession(clock)
+    return profiler, profiler.wrap(session, 'compute')
+
+
+def test_percentile():
+    values = range(1, 101)
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile([3], 95) == 3
+    assert percentile([], 50) is None
+
+
+def test_disabled_profiler_does_not_wrap():
+    profiler = Profiler()
+    session = Mock()
+    assert profiler.wrap(session, 'compute') is session
+
+
+def test_profiled_calls():
+    profiler, session = make_profiled()
+    assert isinstance(session, ProfiledSession)
+
+    assert session.list_nodes() == ['node']
+    session.list_nodes()
+    assert session.type == 'fake'
+
+    [row] = profiler.summary()
+    assert row == {
+        'operation': 'compute.list_nodes',
+        'count': 2,
+        'p50': 0.5,
+        'p95': 0.5,
+        'total': 1.0,
+        'bytes': 200,
+    }
+
+
+def test_profiled_iterator():
+    profiler, session = make_profiled()
+
+    assert list(session.iterate_records()) == ['a', 'b']
+
+    [row] = profiler.summary()
+    assert row['operation'] == 'compute.iterate_records'
+    assert row['count'] == 1
+    assert row['total'] == 0.5
+    assert row['bytes'] == 20
+
+
+def test_summary_slowest_first():
+    profiler = Profiler()
+    profiler.record('dns.get_zone', 0.1)
+    profiler.record('compute.list_nodes', 0.2)
+    profiler.record('dns.get_zone', 0.3)
+
+    assert [row['operation'] for row in profiler.summary()] == [
+        'dns.get_zone', 'compute.list_nodes']
@@ -0,0 +1,153 @@
+from datetime import datetime, timedelta
+import json
+import os
+import threading
+
+from libcloud.common.openstack_identity import (
+    OpenStackIdentity_2_0_Connection)
+from libcloud.compute.providers import get_driver
+from libcloud.compute.types import Provider
+from mock import patch
+
+from gonzo.clouds.session import make_thread_safe, reuse_openstack_auth
+
+
+def make_driver():
+    return get_driver(Provider.EC2)('key', 'secret', region='eu-west-1')
+
+
+def test_connection_per_thread():
+    driver = make_thread_safe(make_driver())
+    connection = driver.connection
+    connection.connect()
+    main_http_connection = connection.connection
+    assert main_http_connection is not None
+
+    seen = []
+
+    def other_thread():
+        seen.append(connection.connection)
+        connection.connect()
+        seen.append(connection.connection)
+
+    thread = threading.Thread(target=other_thread)
+    thread.start()
+    thread.join()
+
+    assert seen[0] is None
+    assert seen[1] is not main_http_connection
+    assert connection.connection is main_http_connection
+
+
+def test_context_per_thread():
+    driver = make_thread_safe(make_driver())
+    driver.connection.set_context({'foo': 'bar'})
+
+    seen = []
+    thread = threading.Thread(
+        target=lambda: seen.append(driver.connection.context))
+    thread.start()
+    thread.join()
+
+    assert seen == [{}]
+    assert driver.connection.context == {'foo': 'bar'}
+
+
+def test_idempotent():
+    driver = make_thread_safe(make_driver())
+    cls = type(driver.connection)
+    make_thread_safe(driver)
+    assert type(driver.connection) is cls
+    assert type(make_thread_safe(make_driver()).connection) is cls
+
+
+@patch('gonzo.clouds.session.time.time')
+def test_keep_alive(time):
+    time.return_value = 1000
+    driver = make_thread_safe(make_driver())
+    connection = driver.connection
+    connection.connect()
+    http_connection = connection.connection
+
+    time.return_value = 1010
+    connection.connect()
+    assert connection.connection is http_connection
+
+    connection.connect(host='elsewhere.example.com')
+    assert connection.connection is not http_connection
+
+    time.return_value = 1100
+    connection.connect()
+    assert connection.connection is not http_connection
+
+
+def make_openstack_driver():
+    return get_driver(Provider.OPENSTACK)(
+        'user', 'password',
+        ex_force_auth_url='http://keystone.example.com:5000',
+        ex_tenant_name='tenant',
+        ex_force_auth_version='2.0_password',
+        ex_force_service_region='RegionOne')
+
+
+SERVICE_CATALOG = [{
+    'type': 'compute',
+    'name': 'nova',
+    'endpoints': [{
+        'region': 'RegionOne',
+        'publicURL': 'http://nova.example.com:8774/v2/tenant',
+    }],
+}]
+
+
+def fake_authenticate(self, **kwargs):
+    self.auth_token = 'new-token'
+    self.auth_token_expires = datetime.utcnow() + timedelta(hours=1)
+    self.auth_user_info = {}
+    self.urls = SERVICE_CATALOG
+    return self
+
+
+def saved_tokens(tmpdir):
+    tokens = []
+    for name in os.listdir(str(tmpdir)):
+        with open(os.path.join(str(tmpdir), name)) as auth_file:
+            tokens.append(json.load(auth_file)['auth_token'])
+    return tokens
+
+
+@patch.object(OpenStackIdentity_2_0_Connection, 'authenticate',
+              fake_authenticate)
+def test_openstack_auth_saved_and_reused(tmpdir):
+    driver = reuse_openstack_auth(make_openstack_driver(), str(tmpdir))
+    driver.connection._populate_hosts_and_request_paths()
+    assert saved_tokens(tmpdir) == ['new-token']
+
+    with patch.object(OpenStackIdentity_2_0_Connection,
+                      'authenticate') as authenticate:
+        driver = reuse_openstack_auth(make_openstack_driver(), str(tmpdir))
+        driver.connection._populate_hosts_and_request_paths()
+
+    assert not authenticate.called
+    assert driver.connection.auth_token == 'new-token'
+    assert driver.connection.host == 'nova.example.com'
+
+
+@patch.object(OpenStackIdentity_2_0_Connection, 'authenticate',
+              fake_authenticate)
+def test_openstack_auth_expired(tmpdir):
+    driver = reuse_openstack_auth(make_openstack_driver(), str(tmpdir))
+    driver.connection._populate_hosts_and_request_paths()
+
+    [name] = os.listdir(str(tmpdir))
+    path = os.path.join(str(tmpdir), name)
+    with open(path) as auth_file:
+        saved = json.load(auth_file)
+    saved.update(auth_token='old-token', expires='2014-01-01T00:00:00Z')
+    with open(path, 'w') as auth_file:
+        json.dump(saved, auth_file)
+
+    driver = reuse_openstack_auth(make_openstack_driver(), str(tmpdir))
+    driver.connection._populate_hosts_and_request_paths()
+    assert driver.connection.auth_token == 'new-token'
+    assert saved_tokens(tmpdir) == ['new-token']
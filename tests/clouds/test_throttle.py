@@ -0,0 +1,147 @@
+from libcloud.compute.providers import get_driver
+from libcloud.compute.types import Provider
+from mock import Mock
+import pytest
+
+from gonzo.clouds.session import throttle_requests
+from gonzo.clouds.throttle import (Throttle, TokenBucket, get_throttle,
+                                   is_throttled, throttle_report)
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def test_is_throttled():
+    assert is_throttled(Exception('RequestLimitExceeded: slow down'))
+    assert is_throttled(Exception('Throttling: Rate exceeded'))
+    assert is_throttled(Exception('overLimit'), status=413)
+    assert not is_throttled(Exception('InvalidAMIID.NotFound'), status=400)
+
+
+def test_token_bucket():
+    clock = FakeClock()
+    bucket = TokenBucket(2, sleep=clock.sleep, clock=clock)
+
+    # a second's worth of burst, then one every half second
+    for _ in range(4):
+        bucket.acquire()
+    assert clock.slept == [0.5, 0.5]
+
+
+def test_throttle_retries():
+    clock = FakeClock()
+    throttle = Throttle('compute test', sleep=clock.sleep, clock=clock)
+    request = Mock(side_effect=[
+        Exception('RequestLimitExceeded'),
+        Exception('RequestLimitExceeded'),
+        'ok',
+    ])
+
+    assert throttle.call(request, is_throttled) == 'ok'
+    assert request.call_count == 3
+    assert len(clock.slept) == 2
+    assert all(0.5 <= delay <= 30 for delay in clock.slept)
+    assert (throttle.requests, throttle.throttled) == (3, 2)
+
+
+def test_throttle_gives_up():
+    clock = FakeClock()
+    throttle = Throttle('compute test', max_retries=2, sleep=clock.sleep)
+    request = Mock(side_effect=Exception('RequestLimitExceeded'))
+
+    with pytest.raises(Exception):
+        throttle.call(request, is_throttled)
+    assert request.call_count == 3
+
+
+def test_throttle_other_errors_not_retried():
+    throttle = Throttle('compute test')
+    request = Mock(side_effect=ValueError('boom'))
+
+    with pytest.raises(ValueError):
+        throttle.call(request, is_throttled)
+    assert request.call_count == 1
+
+
+def test_get_throttle_shared():
+    throttle = get_throttle('compute', 'test-shared', {'compute': 3})
+    assert get_throttle('compute', 'test-shared') is throttle
+    assert throttle.bucket.rate == 3
+
+
+def test_throttle_report():
+    throttle = get_throttle('dns', 'test-report')
+    throttle._count(throttled=True)
+    throttle._count()
+    assert ('dns test-report', 2, 1) in throttle_report()
+
+
+THROTTLED_BODY = (
+    '<Response><Errors><Error><Code>RequestLimitExceeded</Code>'
+    '<Message>Request limit exceeded.</Message></Error></Errors></Response>')
+OVER_LIMIT_BODY = (
+    '<Response><Errors><Error><Code>SlowDown</Code>'
+    '<Message>Too many requests.</Message></Error></Errors></Response>')
+EMPTY_BODY = (
+    '<DescribeInstancesResponse><reservationSet/>'
+    '</DescribeInstancesResponse>')
+
+
+class FakeHTTPResponse(object):
+    reason = ''
+
+    def __init__(self, status, body):
+        self.status = status
+        self.body = body
+
+    def getheaders(self):
+        return []
+
+    def read(self):
+        return self.body
+
+
+class FakeHTTPConnection(object):
+    """ Replays canned (status, body) responses """
+    responses = []
+
+    def __init__(self, host, port, **kwargs):
+        pass
+
+    def request(self, method, url, body=None, headers=None):
+        pass
+
+    def getresponse(self):
+        return FakeHTTPResponse(*self.responses.pop(0))
+
+    def close(self):
+        pass
+
+
+def make_throttled_driver(responses):
+    driver = get_driver(Provider.EC2)('key', 'secret', region='eu-west-1')
+    driver.connection.conn_classes = (FakeHTTPConnection, FakeHTTPConnection)
+    FakeHTTPConnection.responses = responses
+    throttle = Throttle('compute fake', sleep=Mock())
+    return throttle_requests(driver, throttle), throttle
+
+
+def test_throttled_driver_requests_retried():
+    driver, throttle = make_throttled_driver([
+        (503, THROTTLED_BODY),
+        (429, OVER_LIMIT_BODY),
+        (200, EMPTY_BODY),
+    ])
+
+    assert driver.list_nodes() == []
+    assert (throttle.requests, throttle.throttled) == (3, 2)
@@ -0,0 +1,98 @@
+from mock import Mock
+
+from gonzo.clouds.waiter import Waiter
+from gonzo.exceptions import UnhealthyResourceError, WaitTimeoutError
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, delay):
+        self.sleeps.append(delay)
+        self.now += delay
+
+
+def make_resource(resource_id, state):
+    return Mock(id=resource_id, state=state)
+
+
+def is_ready(resource):
+    if resource.state == 'error':
+        raise UnhealthyResourceError(resource.id)
+    return resource.state == 'ready'
+
+
+def make_waiter(states, clock, **kwargs):
+    """ `states` is a list (one per tick) of dicts of id -> state """
+    ticks = iter(states)
+    describe = Mock(side_effect=lambda ids: [
+        make_resource(resource_id, state)
+        for resource_id, state in next(ticks).items()
+    ])
+    return Waiter(describe, is_ready, sleep=clock.sleep, clock=clock.time,
+                  **kwargs)
+
+
+def test_batched_describe_and_callbacks():
+    clock = Clock()
+    waiter = make_waiter([
+        {'a': 'pending', 'b': 'ready'},
+        {'a': 'ready'},
+    ], clock)
+    seen = []
+
+    ready, failed = waiter.wait(
+        [make_resource('a', 'new'), make_resource('b', 'new')],
+        on_ready=lambda resource: seen.append(resource.id))
+
+    assert sorted(ready) == ['a', 'b']
+    assert failed == {}
+    assert seen == ['b', 'a']
+    waiter.describe.assert_any_call(['a', 'b'])
+    waiter.describe.assert_called_with(['a'])
+    assert waiter.describe.call_count == 2
+
+
+def test_unhealthy_resources_fail():
+    clock = Clock()
+    waiter = make_waiter([{'a': 'error', 'b': 'ready'}], clock)
+    failures = []
+
+    ready, failed = waiter.wait(
+        [make_resource('a', 'new'), make_resource('b', 'new')],
+        on_failed=lambda resource_id, error: failures.append(resource_id))
+
+    assert list(ready) == ['b']
+    assert isinstance(failed['a'], UnhealthyResourceError)
+    assert failures == ['a']
+
+
+def test_backoff_with_jitter():
+    clock = Clock()
+    waiter = make_waiter(
+        [{'a': 'pending'}] * 5 + [{'a': 'ready'}], clock,
+        initial_delay=1, backoff=2, max_delay=8)
+    waiter.wait([make_resource('a', 'new')])
+
+    maximums = [1, 2, 4, 8, 8, 8]
+    for delay, maximum in zip(clock.sleeps, maximums):
+        assert maximum / 2.0 <= delay <= maximum
+
+
+def test_deadline():
+    clock = Clock()
+    waiter = make_waiter(
+        [{'a': 'pending', 'b': 'ready'}] + [{'a': 'pending'}] * 100, clock,
+        timeout=30)
+
+    ready, failed = waiter.wait(
+        [make_resource('a', 'new'), make_resource('b', 'new')])
+
+    assert list(ready) == ['b']
+    assert isinstance(failed['a'], WaitTimeoutError)
+    assert clock.now <= 30
@@ -0,0 +1,81 @@
+import os
+
+from libcloud.dns.base import Record, Zone
+
+from gonzo.clouds.zone_snapshot import ZoneSnapshot
+
+
+def make_snapshot():
+    zone = Zone('Z1', 'example.com.', 'master', None, None,
+                extra={'ResourceRecordSetCount': 3})
+    records = [
+        Record('CNAME:prod-web-001', 'prod-web-001', 'CNAME',
+               'host-1.example.net', zone, None,
+               extra={'ttl': 300, '_multi_value': False}),
+        Record('TXT:_count-prod-web', '_count-prod-web', 'TXT', '"1"',
+               zone, None, extra={'ttl': 0}),
+        Record('A:www', 'www', 'A', '10.0.0.1', zone, None,
+               extra={'ttl': 60}),
+    ]
+    return ZoneSnapshot.from_records(zone, records, 1000)
+
+
+def test_get_record():
+    snapshot = make_snapshot()
+    record = snapshot.get_record('Prod-Web-001')
+    assert record.type == 'CNAME'
+    assert record.data == 'host-1.example.net'
+    assert record.extra == {'ttl': 300}
+    assert record.zone.id == 'Z1'
+
+    assert snapshot.get_record('_count-prod-web', 'TXT').data == '"1"'
+    assert snapshot.get_record('_count-prod-web', 'CNAME') is None
+    assert snapshot.get_record('prod-web-002') is None
+
+
+def test_apply_changes():
+    snapshot = make_snapshot()
+    snapshot.apply([
+        ('DELETE', '_count-prod-web', 'TXT', '"1"', {'ttl': 0}),
+        ('CREATE', '_count-prod-web', 'TXT', '"3"', {'ttl': 0}),
+        ('CREATE', 'prod-web-002', 'CNAME', 'host-2.example.net', {}),
+        ('DELETE', 'www', 'A', '10.0.0.1', {'ttl': 60}),
+    ])
+
+    assert snapshot.get_record('_count-prod-web').data == '"3"'
+    assert snapshot.get_record('prod-web-002').extra == {'ttl': 0}
+    assert snapshot.get_record('www') is None
+    # one record set added, one removed
+    assert snapshot.marker == 3
+
+
+def test_apply_changes_to_stale_records():
+    # the count was changed by others, and read live before changing it
+    snapshot = make_snapshot()
+    snapshot.apply([
+        ('DELETE', '_count-prod-web', 'TXT', '"4"', {'ttl': 0}),
+        ('CREATE', '_count-prod-web', 'TXT', '"5"', {'ttl': 0}),
+    ])
+
+    assert snapshot.records['_count-prod-web'] == {
+        'TXT': [['"5"', {'ttl': 0}]]}
+    assert snapshot.marker == 3
+
+
+def test_save_and_load(tmpdir):
+    path = os.path.join(str(tmpdir), 'dns', 'example.com.json')
+    make_snapshot().save(path)
+
+    snapshot = ZoneSnapshot.load(path)
+    assert snapshot.marker == 3
+    assert snapshot.full_synced_at == 1000
+    assert snapshot.get_record('www').data == '10.0.0.1'
+
+
+def test_load_missing_or_corrupt(tmpdir):
+    path = os.path.join(str(tmpdir), 'example.com.json')
+    assert ZoneSnapshot.load(path) is None
+
+    with open(path, 'w') as snapshot_file:
+        snapshot_file.write('{"zone')
+    assert ZoneSnapshot.load(path) is None
@@ -9,6 +9,15 @@ def pytest_addoption(parser):
         help="Devstack endpoint")
 
 
+@pytest.yield_fixture(autouse=True)
+def clear_clouds():
+    """ Don't share Clouds between tests """
+    from gonzo.clouds import clear_clouds
+    clear_clouds()
+    yield
+    clear_clouds()
+
+
 @pytest.yield_fixture
 def minimum_config_fixture():
     cloud = {
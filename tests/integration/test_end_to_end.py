@@ -9,12 +9,6 @@ from gonzo.scripts import list_, launch
 from gonzo.scripts.base import get_parser
 
 
-@pytest.yield_fixture
-def fake_dns():
-    with patch("gonzo.clouds.dns.get_dns_driver") as driver:
-        yield driver
-
-
 @pytest.yield_fixture(autouse=True)
 def fake_get_config(request):
     with patch('gonzo.config.get_config_module') as get_config_module:
@@ -33,10 +27,11 @@ def fake_get_config(request):
                     'USERNAME': 'admin',
                     'PASSWORD': 'password',
                     'AUTH_URL': endpoint,
-                    'AWS_ACCESS_KEY_ID': None,
-                    'AWS_SECRET_ACCESS_KEY': None,
+                    'DNS_BACKEND': 'fake',
                     'DNS_ZONE': "example.com",
                     'DNS_TYPE': 'A',
+                    # instances are destroyed behind gonzo's back below
+                    'INVENTORY_CACHE_TTL': 0,
                 },
             }
         )
@@ -70,7 +65,7 @@ def openstack_session(fake_get_config):
     yield openstack
 
 
-def test_end_to_end(capsys, fake_dns, fake_get_config, openstack_session):
+def test_end_to_end(capsys, fake_get_config, openstack_session):
     # list instances - should be blank
     parser = get_parser()
     args = parser.parse_args(["list"])
@@ -0,0 +1,151 @@
+from libcloud.dns.drivers.route53 import InvalidChangeBatch
+from mock import Mock, patch
+import pytest
+
+from gonzo.clouds.dns import DNS
+from gonzo.exceptions import DataError
+from gonzo.scripts.base import get_parser
+from gonzo.scripts.launch import (add_dns_aliases, add_dns_records,
+                                  launch_fleet, main)
+
+
+def parse_args(*extra):
+    parser = get_parser()
+    return parser.parse_args([
+        'launch', 'prod-web-app', '--count', '3', '--image-id', 'ami-1'] +
+        list(extra))
+
+
+@pytest.fixture
+def args():
+    return parse_args()
+
+
+@pytest.mark.parametrize('count', ['0', '-2'])
+def test_count_must_be_positive(count):
+    with pytest.raises(SystemExit):
+        parse_args('--count', count)
+
+
+def make_instance(name):
+    instance = Mock(id=name, gonzo_network_address='addr')
+    instance.name = name
+    return instance
+
+
+def make_cloud():
+    cloud = Mock(name='cloud')
+    cloud.parse_instance_name.return_value = ('prod', 'web-app')
+    cloud.get_next_azs.return_value = [Mock(), Mock(), Mock()]
+
+    def launch_instance(name, owner, resources, az, user_data=None):
+        if name == 'prod-web-app-002':
+            raise ValueError('quota exceeded')
+        return make_instance(name)
+    cloud.launch_instance.side_effect = launch_instance
+
+    def wait_for_instances(pending, on_running, on_failed):
+        running = {}
+        for instance in pending:
+            running[instance.id] = make_instance(instance.name)
+            on_running(running[instance.id])
+        return running, {}
+    cloud.wait_for_instances.side_effect = wait_for_instances
+    return cloud
+
+
+@patch('gonzo.scripts.launch.config_proxy')
+def test_launch_fleet(config_proxy, args, capsys):
+    config_proxy.SIZES = {'default': 'm1.small'}
+    cloud = make_cloud()
+    dns = Mock()
+    dns.reserve_hosts.return_value = [
+        'prod-web-app-001', 'prod-web-app-002', 'prod-web-app-003']
+    cloud_config = {
+        'DNS_ZONE': 'example.com',
+        'DNS_TYPE': 'CNAME',
+    }
+
+    instances = launch_fleet(args, cloud, dns, cloud_config)
+
+    assert sorted(i.name for i in instances) == [
+        'prod-web-app-001', 'prod-web-app-003']
+    # hostnames are reserved together
+    dns.reserve_hosts.assert_called_once_with(
+        'prod-web-app', 'example.com', 3)
+    # resources are resolved once for the whole fleet
+    cloud.resolve_launch_resources.assert_called_once_with(
+        'ami-1', size='m1.small', security_groups=['web-app', 'gonzo'],
+        key_name=None)
+    cloud.get_next_azs.assert_called_once_with('prod', 'web-app', 3)
+    assert cloud.launch_instance.call_count == 3
+    # and all instances are waited on together
+    assert cloud.wait_for_instances.call_count == 1
+    # and given hostnames in a single DNS change
+    dns.change_batch.assert_called_once_with('example.com')
+    batch = dns.change_batch.return_value
+    assert sorted(call[0] for call in batch.create.call_args_list) == [
+        ('prod-web-app-001', 'CNAME', 'addr'),
+        ('prod-web-app-003', 'CNAME', 'addr'),
+    ]
+    dns.apply_changes.assert_called_once_with(batch)
+
+    out, _ = capsys.readouterr()
+    assert 'prod-web-app-002: failed: quota exceeded' in out
+    assert 'prod-web-app-003: started after' in out
+    assert 'Launched 2 of 3 instance(s)' in out
+
+
+def test_add_dns_records():
+    batch = Mock()
+    add_dns_records(
+        batch, make_instance('prod-web-app-001'),
+        {'DNS_ZONE': 'example.com', 'DNS_TYPE': 'CNAME'})
+
+    batch.create.assert_called_once_with('prod-web-app-001', 'CNAME', 'addr')
+
+
+def test_add_dns_aliases():
+    cloud_config = {
+        'DNS_BACKEND': 'fake',
+        'DNS_ZONE': 'example.com',
+        'DNS_TYPE': 'CNAME',
+        'FAKE_POLL_INTERVAL': 0,
+    }
+    dns = DNS.from_config(cloud_config, use_cache=False)
+    batch = dns.change_batch('example.com')
+    batch.create('www', 'CNAME', 'prod-web-app-001.example.com')
+    dns.apply_changes(batch)
+
+    # www already points at the instance being replaced
+    instance = make_instance('prod-web-app-002')
+    batch = dns.change_batch('example.com')
+    add_dns_aliases(dns, batch, instance, ['www', 'api'], cloud_config)
+    dns.apply_changes(batch)
+
+    for alias in ('www', 'api'):
+        assert dns.get_dns_record(alias, 'example.com').data == (
+            'prod-web-app-002.example.com')
+
+    # and pointing them again changes nothing
+    batch = dns.change_batch('example.com')
+    add_dns_aliases(dns, batch, instance, ['www', 'api'], cloud_config)
+    assert list(batch.batches()) == []
+
+
+@patch('gonzo.scripts.launch.launch')
+def test_main_reports_dns_failures(launch, capsys):
+    launch.side_effect = InvalidChangeBatch("Tried to create www CNAME")
+    with pytest.raises(SystemExit):
+        main(parse_args())
+    assert capsys.readouterr()[1] == (
+        "DNS changes failed: Tried to create www CNAME\n")
+
+
+def test_launch_fleet_aliases():
+    # a name can only point at one instance
+    args = parse_args('--extra-tags', '"cnames=www,api"')
+    dns = Mock()
+    with pytest.raises(DataError):
+        launch_fleet(args, make_cloud(), dns, {'DNS_ZONE': 'example.com'})
+    assert not dns.reserve_hosts.called
@@ -0,0 +1,148 @@
+from datetime import datetime
+
+from libcloud.compute.types import NodeState
+from mock import Mock, patch
+import pytest
+
+from gonzo.scripts.base import get_parser
+from gonzo.scripts.list_ import list_
+
+
+@pytest.fixture
+def args():
+    parser = get_parser()
+    return parser.parse_args(['list', '--all-regions', '--color', 'never'])
+
+
+def make_instance(name, az, created_time=None, owner='alice'):
+    instance = Mock(
+        state=NodeState.RUNNING,
+        gonzo_size='m1.small',
+        gonzo_tags={'owner': owner},
+        gonzo_created_time=created_time or datetime.now(),
+        gonzo_az=az,
+    )
+    instance.name = name
+    return instance
+
+
+def make_cloud(name, region, instances):
+    cloud = Mock(region=region)
+    cloud.name = name
+    cloud.list_instances.return_value = instances
+    return cloud
+
+
+def patch_clouds(get_cloud, clouds):
+    """ Have get_cloud return `clouds`, keyed by (name, region), raising
+        for the others """
+    def get_cloud_(name, region, use_cache):
+        try:
+            return clouds[name, region]
+        except KeyError:
+            raise LookupError("No backend specified!")
+    get_cloud.side_effect = get_cloud_
+
+
+def table_rows(out):
+    return [line.split() for line in out.splitlines() if line.strip()]
+
+
+@patch('gonzo.clouds.get_cloud')
+@patch('gonzo.scripts.list_.get_cloud_regions')
+def test_list_all_regions(get_cloud_regions, get_cloud, args, capsys):
+    east = make_cloud(
+        'aws', 'us-east-1', [make_instance('prod-web-001', 'us-east-1a')])
+    west = make_cloud(
+        'aws', 'us-west-1', [make_instance('prod-web-002', 'us-west-1b')])
+    broken = make_cloud('aws', 'eu-west-1', [])
+    broken.list_instances.side_effect = ValueError('no route')
+    get_cloud_regions.return_value = [
+        ('aws', 'us-east-1'), ('aws', 'us-west-1'), ('aws', 'eu-west-1')]
+    patch_clouds(get_cloud, {
+        ('aws', 'us-east-1'): east,
+        ('aws', 'us-west-1'): west,
+        ('aws', 'eu-west-1'): broken,
+    })
+
+    region_instances = list_(args)
+
+    assert [(region, instance.name)
+            for (_, region), instance in region_instances] == [
+        ('us-east-1', 'prod-web-001'), ('us-west-1', 'prod-web-002')]
+
+    out, err = capsys.readouterr()
+    rows = table_rows(out)
+    assert rows[0][-1] == 'region'
+    assert [(row[0], row[-1]) for row in rows[1:]] == [
+        ('prod-web-001', 'us-east-1'), ('prod-web-002', 'us-west-1')]
+    assert 'Unable to list eu-west-1: no route' in err
+
+
+@patch('gonzo.clouds.get_cloud')
+@patch('gonzo.scripts.list_.get_all_cloud_regions')
+def test_list_all_clouds_by_age(get_all_cloud_regions, get_cloud, capsys):
+    args = get_parser().parse_args(
+        ['list', '--all-clouds', '--order', 'age', '--color', 'never'])
+    get_all_cloud_regions.return_value = [
+        ('aws', 'us-east-1'), ('openstack', 'RegionOne'),
+        ('misconfigured', 'RegionOne')]
+    patch_clouds(get_cloud, {
+        ('aws', 'us-east-1'): make_cloud('aws', 'us-east-1', [
+            make_instance('prod-web-001', 'us-east-1a', datetime(2014, 1, 1)),
+        ]),
+        ('openstack', 'RegionOne'): make_cloud('openstack', 'RegionOne', [
+            make_instance('prod-db-001', 'nova', datetime(2014, 2, 1)),
+        ]),
+    })
+
+    list_(args)
+
+    out, err = capsys.readouterr()
+    rows = table_rows(out)
+    assert rows[0][-2:] == ['cloud', 'region']
+    # youngest first, across clouds
+    assert [(row[0], row[-2], row[-1]) for row in rows[1:]] == [
+        ('prod-db-001', 'openstack', 'RegionOne'),
+        ('prod-web-001', 'aws', 'us-east-1'),
+    ]
+    assert ("Unable to list misconfigured/RegionOne: No backend specified!"
+            in err)
+
+
+@patch('gonzo.scripts.list_.get_current_cloud')
+def test_list_stream(get_current_cloud, capsys):
+    args = get_parser().parse_args(['list', '--stream', '--color', 'never'])
+    cloud = get_current_cloud.return_value
+    cloud.iter_instances.return_value = iter([
+        make_instance('prod-web-002', 'us-east-1a'),
+        make_instance('prod-web-001', 'us-east-1b'),
+    ])
+
+    list_(args)
+
+    out, _ = capsys.readouterr()
+    rows = table_rows(out)
+    assert rows[0] == ['name', 'type', 'status', 'owner', 'uptime',
+                       'location']
+    # as listed, rather than sorted
+    assert [(row[0], row[-1]) for row in rows[1:]] == [
+        ('prod-web-002', 'us-east-1a'), ('prod-web-001', 'us-east-1b')]
+    assert not cloud.list_instances.called
+
+
+@patch('gonzo.scripts.list_.get_current_cloud')
+def test_list_stream_unicode(get_current_cloud, capsys):
+    # e.g. OpenStack metadata
+    args = get_parser().parse_args(['list', '--stream', '--color', 'never'])
+    cloud = get_current_cloud.return_value
+    cloud.iter_instances.return_value = iter([
+        make_instance('prod-web-001', 'us-east-1a', owner=u'jos\xe9'),
+        make_instance('prod-web-002', 'us-east-1b', owner='jos\xc3\xa9'),
+    ])
+
+    list_(args)
+
+    out, _ = capsys.readouterr()
+    rows = table_rows(out)
+    assert [row[3] for row in rows[1:]] == [u'jos\xe9', u'jos\xe9']
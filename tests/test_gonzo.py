@@ -0,0 +1,41 @@
+from mock import Mock, patch
+
+from gonzo.tasks.gonzo import group, instance
+
+
+def make_instance(name):
+    instance = Mock()
+    instance.name = name
+    return instance
+
+
+@patch('gonzo.tasks.gonzo.config')
+@patch('gonzo.tasks.gonzo.get_current_cloud')
+@patch('gonzo.tasks.gonzo.env')
+def test_group_hosts_sorted_by_name(env, get_current_cloud, config):
+    env.hosts = []
+    config.get_cloud.return_value = {'DNS_ZONE': 'example.com'}
+    get_current_cloud.return_value.iter_instances.return_value = iter([
+        make_instance('prod-web-002'), make_instance('prod-web-001')])
+
+    group('prod-web')
+
+    assert env.hosts == ['prod-web-001.example.com',
+                         'prod-web-002.example.com']
+    get_current_cloud.return_value.iter_instances.assert_called_once_with(
+        environment='prod', server_type='web')
+
+
+@patch('gonzo.tasks.gonzo.config')
+@patch('gonzo.tasks.gonzo.get_current_cloud')
+@patch('gonzo.tasks.gonzo.env')
+def test_instance_hosts(env, get_current_cloud, config):
+    env.hosts = []
+    config.get_cloud.return_value = {'DNS_ZONE': 'example.com'}
+    get_current_cloud.return_value.get_instance_by_name.side_effect = (
+        make_instance)
+
+    instance('prod-web-001', 'prod-db-001')
+
+    assert env.hosts == ['prod-web-001.example.com',
+                         'prod-db-001.example.com']
@@ -1,6 +1,11 @@
+from argparse import ArgumentTypeError
+import threading
+
 import pytest
 
-from gonzo.utils import last_index
+from gonzo.exceptions import ConcurrentTaskError, WaitTimeoutError
+from gonzo.utils import (chunks, gather, last_index, positive_int,
+                         run_concurrently)
 
 
 def test_last_index():
@@ -8,6 +13,20 @@ def test_last_index():
     assert last_index([1, 1, 2], 1) == 1
 
 
+def test_chunks():
+    assert chunks([1, 2, 3, 4, 5], 2) == [[1, 2], [3, 4], [5]]
+    assert chunks([], 2) == []
+
+
+def test_positive_int():
+    assert positive_int('3') == 3
+    for value in ('0', '-1'):
+        with pytest.raises(ArgumentTypeError):
+            positive_int(value)
+    with pytest.raises(ValueError):
+        positive_int('x')
+
+
 def test_last_index_missing():
     with pytest.raises(ValueError):
         last_index([1], 2)
@@ -16,3 +35,53 @@ def test_last_index_missing():
 def test_last_index_empty():
     with pytest.raises(ValueError):
         last_index([], 1)
+
+
+def test_run_concurrently():
+    def fail():
+        raise ValueError('boom')
+
+    results, errors = run_concurrently({
+        'one': lambda: 1,
+        'two': lambda: 2,
+        'fail': fail,
+    }, max_workers=2)
+    assert results == {'one': 1, 'two': 2}
+    assert list(errors) == ['fail']
+    assert isinstance(errors['fail'], ValueError)
+
+
+def test_run_concurrently_timeout():
+    stuck = threading.Event()
+    try:
+        results, errors = run_concurrently({
+            'fast': lambda: 'done',
+            'slow': stuck.wait,
+        }, timeout=0.1)
+    finally:
+        stuck.set()
+
+    assert results == {'fast': 'done'}
+    assert isinstance(errors['slow'], WaitTimeoutError)
+
+
+def test_run_concurrently_empty():
+    assert run_concurrently({}) == ({}, {})
+
+
+def test_gather():
+    assert gather({'one': lambda: 1}) == {'one': 1}
+
+
+def test_gather_joins_errors():
+    def fail(message):
+        raise ValueError(message)
+
+    with pytest.raises(ConcurrentTaskError) as exc_info:
+        gather({
+            'one': lambda: 1,
+            'two': lambda: fail('two'),
+            'nested': lambda: gather({'three': lambda: fail('three')}),
+        })
+    assert sorted(exc_info.value.errors) == ['three', 'two']
+    assert str(exc_info.value) == 'three: three; two: two'